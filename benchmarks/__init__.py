@@ -0,0 +1,138 @@
+"""
+The benchmarks measure the performance of the crawler, they are run as the modules e.g.:
+
+    python -m benchmarks.throughput --hosts 4 --pages-per-host 500
+    python -m benchmarks.link_extraction --repeat 5
+
+each benchmark prints a JSON report and compares it with a stored baseline if specified.
+"""
+import json
+import math
+import os
+import resource
+import time
+
+__all__ = ['percentiles', 'ResourceUsage', 'StageTimer', 'compare_with_baseline', 'save_report']
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    """
+    Return a dict {"p50": ..., "max": ...} of the specific values by the nearest-rank method,
+    an empty values return the zeros.
+    """
+    result = {}
+    values = sorted(values)
+    for p in ps:
+        if not values:
+            result['p%s' % p] = 0
+            continue
+        rank = max(0, min(len(values), int(math.ceil(p / 100.0 * len(values)))) - 1)
+        result['p%s' % p] = values[rank]
+    result['max'] = values[-1] if values else 0
+    return result
+
+
+class ResourceUsage(object):
+    """
+    Measure the wall-clock time, the CPU time (user + system) and the peak RSS of the current process
+    between start() and stop().
+    """
+
+    def __init__(self):
+        self.wall_time = 0
+        self.cpu_time = 0
+        self.peak_rss = 0
+        self._started = None
+
+    def start(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._started = (time.perf_counter(), usage.ru_utime + usage.ru_stime)
+        return self
+
+    def stop(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        wall, cpu = self._started
+        self.wall_time = time.perf_counter() - wall
+        self.cpu_time = usage.ru_utime + usage.ru_stime - cpu
+        # the ru_maxrss is in kilobytes on Linux
+        self.peak_rss = usage.ru_maxrss * 1024
+        return self
+
+    def to_dict(self):
+        return {'wall_time': self.wall_time, 'cpu_time': self.cpu_time, 'peak_rss': self.peak_rss}
+
+
+class StageTimer(object):
+    """
+    Record the durations (seconds) of the stages, the functions of the components are wrapped
+    by wrap() and wrap_async() so that the components need not to be changed.
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    def record(self, stage, duration):
+        self.durations.setdefault(stage, []).append(duration)
+
+    def wrap(self, stage, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    def wrap_async(self, stage, func):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    def report(self, scale=1000.0):
+        """Return the percentiles (milliseconds by default) and the count of each stage."""
+        result = {}
+        for stage, durations in sorted(self.durations.items()):
+            result[stage] = {k: v * scale for k, v in percentiles(durations).items()}
+            result[stage]['count'] = len(durations)
+        return result
+
+
+def compare_with_baseline(report, baseline, metrics, tolerance=0.1):
+    """
+    Compare the metrics of the report with the baseline, each metric is a tuple (path, higher_is_better)
+    that the path is a dot separated key e.g. "stages.fetch.p99".
+
+    :return a list of the regressions, each is a tuple (path, baseline value, current value)
+    """
+
+    def lookup(d, path):
+        for key in path.split('.'):
+            if not isinstance(d, dict) or key not in d:
+                return None
+            d = d[key]
+        return d
+
+    regressions = []
+    for path, higher_is_better in metrics:
+        expected, actual = lookup(baseline, path), lookup(report, path)
+        if not expected or actual is None:
+            continue
+        if higher_is_better and actual < expected * (1 - tolerance):
+            regressions.append((path, expected, actual))
+        elif not higher_is_better and actual > expected * (1 + tolerance):
+            regressions.append((path, expected, actual))
+    return regressions
+
+
+def save_report(report, filename):
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
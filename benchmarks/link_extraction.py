@@ -0,0 +1,243 @@
+"""
+The microbenchmark of the link extraction, it times each stage of LxmlLinkExtractor.extract_links()
+separately on a corpus of the HTML pages of the different sizes and link densities:
+
+    - parse: build the document by lxml
+    - iterate: iterate the attributes of the scanned tags (_iter_links())
+    - join: strip, join with the base URL and build the object Link (_to_link())
+    - filter: the rules of the extractor (_link_allowed())
+    - canonicalize: only if the extractor canonicalizes the links
+    - dedup: remove the duplicate links (_deduplicate())
+
+    python -m benchmarks.link_extraction --repeat 5
+    python -m benchmarks.link_extraction --corpus path/to/html/files --baseline data/extraction.json
+
+the corpus is generated (deterministic by the seed) if the directory of the HTML files isn't specified.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from lxml import etree
+from w3lib.url import canonicalize_url
+
+from benchmarks import compare_with_baseline, percentiles, save_report
+from common_crawler.link_extractor.lxml import LxmlLinkExtractor
+
+__all__ = ['generate_corpus', 'load_corpus', 'run', 'main']
+
+STAGES = ('parse', 'iterate', 'join', 'filter', 'canonicalize', 'dedup')
+
+# (name, number of the paragraphs, number of the links)
+CORPUS_PROFILES = (
+    ('small-sparse', 5, 10),
+    ('small-dense', 5, 100),
+    ('medium-sparse', 50, 50),
+    ('medium-dense', 50, 500),
+    ('large-sparse', 500, 200),
+    ('large-dense', 500, 3000),
+)
+
+_BASE_URL = 'https://www.example.com/section/article.html'
+
+_WORDS = ('the', 'crawler', 'fetches', 'pages', 'from', 'hosts', 'and', 'extracts', 'links', 'of',
+          'documents', 'news', 'sports', 'weather', 'search', 'about', 'contact', 'products', 'blog')
+
+BASELINE_METRICS = tuple(('per_link.%s' % stage, False) for stage in STAGES) + (('per_page.total', False),)
+
+
+def _random_href(rng, i):
+    kind = rng.random()
+    if kind < 0.35:
+        return '/%s/%s-%s.html' % (rng.choice(_WORDS), rng.choice(_WORDS), i)
+    if kind < 0.55:
+        return 'https://www.%s.com/%s?id=%s&ref=%s' % (rng.choice(_WORDS), rng.choice(_WORDS), i, rng.choice(_WORDS))
+    if kind < 0.65:
+        return '#%s' % rng.choice(_WORDS)
+    if kind < 0.72:
+        return '  /%s/%s.%s  ' % (rng.choice(_WORDS), i, rng.choice(('pdf', 'jpg', 'zip', 'png')))
+    if kind < 0.77:
+        return rng.choice(('mailto:info@example.com', 'javascript:void(0)', 'tel:+100000000'))
+    if kind < 0.9:
+        # the duplicate links are common in the navigation bars
+        return '/%s/' % rng.choice(_WORDS)
+    return 'relative/%s.html' % i
+
+
+def generate_page(rng, paragraphs, links):
+    """Return an HTML page of the specific number of the paragraphs and the links."""
+    anchors = ['<a href="%s">%s %s</a>' % (_random_href(rng, i), rng.choice(_WORDS), rng.choice(_WORDS))
+               for i in range(links)]
+    rng.shuffle(anchors)
+
+    body, per_paragraph = [], max(1, links // max(1, paragraphs))
+    for i in range(paragraphs):
+        words = ' '.join(rng.choice(_WORDS) for _ in range(80))
+        chunk = anchors[i * per_paragraph:(i + 1) * per_paragraph]
+        body.append('<div class="p%s"><p>%s</p><p>%s</p></div>' % (i % 7, words, ' | '.join(chunk)))
+    rest = anchors[paragraphs * per_paragraph:]
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>%s</title>'
+            '<link rel="stylesheet" href="/static/site.css"><script src="/static/site.js"></script></head>'
+            '<body><nav>%s</nav>%s<map><area href="/map/area.html"></map>'
+            '<img src="/static/logo.png"><footer>%s</footer></body></html>'
+            % (' '.join(rng.choice(_WORDS) for _ in range(6)), ' '.join(rest[:20]), ''.join(body),
+               ' '.join(rest[20:])))
+
+
+def generate_corpus(pages_per_profile=10, seed=0, profiles=CORPUS_PROFILES):
+    """Return a list of tuples (profile name, base URL, HTML) that is deterministic by the seed."""
+    rng = random.Random(seed)
+    return [(name, _BASE_URL, generate_page(rng, paragraphs, links))
+            for name, paragraphs, links in profiles
+            for _ in range(pages_per_profile)]
+
+
+def load_corpus(dirname):
+    """Return a list of tuples (file name, base URL, HTML) of the .html files in the directory."""
+    corpus = []
+    for filename in sorted(os.listdir(dirname)):
+        if filename.endswith(('.html', '.htm')):
+            with open(os.path.join(dirname, filename), encoding='utf-8', errors='replace') as f:
+                corpus.append((filename, _BASE_URL, f.read()))
+    return corpus
+
+
+def _time_page(extractor, base_url, html, durations):
+    """Run the stages on a page, add the duration of each stage to durations and return the number of links."""
+    clock = time.perf_counter
+
+    start = clock()
+    root = etree.HTML(html)
+    durations['parse'] += clock() - start
+
+    start = clock()
+    items = list(extractor._iter_links(root))
+    durations['iterate'] += clock() - start
+
+    start = clock()
+    links = [extractor._to_link(el, attr_val, base_url, 'utf-8') for el, _, attr_val in items]
+    links = [link for link in links if link is not None]
+    durations['join'] += clock() - start
+
+    start = clock()
+    links = [link for link in links if extractor._link_allowed(link)]
+    durations['filter'] += clock() - start
+
+    start = clock()
+    if extractor.canonicalize:
+        for link in links:
+            link.url = canonicalize_url(link.url)
+    durations['canonicalize'] += clock() - start
+
+    start = clock()
+    extractor._deduplicate(links)
+    durations['dedup'] += clock() - start
+
+    return len(items)
+
+
+def run(corpus, extractor=None, repeat=3, scale=1e6):
+    """
+    Time the stages on the corpus and return the report (a dict), the costs are in microseconds by default,
+    the best of the repeats is taken for each page to reduce the noise.
+    """
+    extractor = extractor or LxmlLinkExtractor()
+    totals = dict.fromkeys(STAGES, 0.0)
+    page_totals = []
+    profiles = {}
+    links_total = 0
+
+    for name, base_url, html in corpus:
+        best, links = None, 0
+        for _ in range(repeat):
+            durations = dict.fromkeys(STAGES, 0.0)
+            links = _time_page(extractor, base_url, html, durations)
+            if best is None or sum(durations.values()) < sum(best.values()):
+                best = durations
+
+        links_total += links
+        page_totals.append(sum(best.values()) * scale)
+        for stage in STAGES:
+            totals[stage] += best[stage]
+
+        profile = profiles.setdefault(name, {'pages': 0, 'links': 0, 'bytes': 0, 'total': 0.0})
+        profile['pages'] += 1
+        profile['links'] += links
+        profile['bytes'] += len(html)
+        profile['total'] += sum(best.values()) * scale
+
+    pages = len(corpus) or 1
+    report = {
+        'pages': len(corpus),
+        'links': links_total,
+        'per_page': {stage: totals[stage] * scale / pages for stage in STAGES},
+        'per_link': {stage: totals[stage] * scale / (links_total or 1) for stage in STAGES},
+        'page_total_percentiles': percentiles(page_totals),
+        'profiles': {name: {'pages': p['pages'],
+                            'links_per_page': p['links'] / p['pages'],
+                            'bytes_per_page': p['bytes'] / p['pages'],
+                            'per_page': p['total'] / p['pages'],
+                            'per_link': p['total'] / (p['links'] or 1)}
+                     for name, p in profiles.items()},
+    }
+    report['per_page']['total'] = sum(totals.values()) * scale / pages
+    report['per_link']['total'] = sum(totals.values()) * scale / (links_total or 1)
+    return report
+
+
+def _print_report(report, file=sys.stdout):
+    print('%-14s %14s %14s' % ('stage', 'us/page', 'us/link'), file=file)
+    for stage in STAGES + ('total',):
+        print('%-14s %14.2f %14.3f' % (stage, report['per_page'][stage], report['per_link'][stage]), file=file)
+    print(file=file)
+    print('%-16s %8s %12s %12s %12s' % ('profile', 'links', 'bytes', 'us/page', 'us/link'), file=file)
+    for name, p in report['profiles'].items():
+        print('%-16s %8.0f %12.0f %12.2f %12.3f'
+              % (name, p['links_per_page'], p['bytes_per_page'], p['per_page'], p['per_link']), file=file)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='The microbenchmark of the link extraction')
+    parser.add_argument('--corpus', help='a directory of the .html files, default is the generated corpus')
+    parser.add_argument('--pages-per-profile', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--canonicalize', action='store_true', help='canonicalize the extracted links')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--output', help='write the report to this file')
+    parser.add_argument('--baseline', help='compare the report with this baseline file')
+    parser.add_argument('--save-baseline', help='write the report as the baseline to this file')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    corpus = load_corpus(args.corpus) if args.corpus \
+        else generate_corpus(pages_per_profile=args.pages_per_profile, seed=args.seed)
+    report = run(corpus, LxmlLinkExtractor(canonicalize=args.canonicalize), repeat=args.repeat)
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        _print_report(report)
+    if args.output:
+        save_report(report, args.output)
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, BASELINE_METRICS, args.tolerance)
+        for path, expected, actual in regressions:
+            print('[REGRESSION] %s: baseline %.4f, current %.4f' % (path, expected, actual), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
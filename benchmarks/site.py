@@ -0,0 +1,217 @@
+"""A local synthetic web graph that served by aiohttp for the benchmarks"""
+import asyncio
+import multiprocessing
+import random
+
+__all__ = ['SyntheticSite', 'SiteServer']
+
+_WORDS = ('crawler', 'python', 'asyncio', 'engine', 'pipeline', 'frontier', 'link', 'page', 'host',
+          'queue', 'index', 'search', 'archive', 'network', 'latency', 'request', 'response', 'parser',
+          'document', 'content', 'anchor', 'graph', 'budget', 'worker', 'segment', 'record', 'robot')
+
+LATENCY_DISTRIBUTIONS = ('none', 'fixed', 'uniform', 'exponential', 'lognormal')
+
+
+class SyntheticSite(object):
+    """
+    The class SyntheticSite generates a deterministic web graph, the same params always generate
+    the same pages, links, statuses and latencies, so that the runs are comparable.
+
+    Each host has pages_per_host pages at /page/{n}, a page links to fan_out pages (a part of them
+    on the other hosts), some pages respond an error (500) or a redirect (301 to /moved/{n}) and
+    some pages link into a trap, an endless calendar at /calendar/{year}/{month}.
+    """
+
+    def __init__(self,
+                 hosts=4,
+                 pages_per_host=500,
+                 fan_out=10,
+                 cross_host_ratio=0.1,
+                 min_page_size=2048,
+                 max_page_size=16384,
+                 latency=0.005,
+                 latency_distribution='exponential',
+                 error_rate=0.01,
+                 redirect_rate=0.02,
+                 trap_rate=0.01,
+                 seed=0):
+        """
+        :param hosts: the number of the hosts (each is a port of the server)
+        :param pages_per_host: the number of the pages of each host
+        :param fan_out: the number of the links of each page
+        :param cross_host_ratio: the ratio of the links that point to the other hosts
+        :param min_page_size: the minimum size (bytes) of a page
+        :param max_page_size: the maximum size (bytes) of a page
+        :param latency: the mean latency (seconds) of a response
+        :param latency_distribution: one of LATENCY_DISTRIBUTIONS
+        :param error_rate: the ratio of the pages that respond 500
+        :param redirect_rate: the ratio of the pages that respond 301
+        :param trap_rate: the ratio of the pages that link into the calendar trap
+        :param seed: the seed of the generator
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError('The latency distribution must be one of %s, got %s'
+                             % (LATENCY_DISTRIBUTIONS, latency_distribution))
+
+        self.hosts = hosts
+        self.pages_per_host = pages_per_host
+        self.fan_out = fan_out
+        self.cross_host_ratio = cross_host_ratio
+        self.min_page_size = min_page_size
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.redirect_rate = redirect_rate
+        self.trap_rate = trap_rate
+        self.seed = seed
+        self.base_urls = ['http://127.0.0.1:%s' % (8000 + i) for i in range(hosts)]
+
+    def _random(self, host, path):
+        return random.Random('%s:%s:%s' % (self.seed, host, path))
+
+    def roots(self):
+        return ['%s/page/0' % base_url for base_url in self.base_urls]
+
+    def sample_latency(self, rng):
+        if self.latency <= 0 or self.latency_distribution == 'none':
+            return 0
+        if self.latency_distribution == 'fixed':
+            return self.latency
+        if self.latency_distribution == 'uniform':
+            return rng.uniform(0, 2 * self.latency)
+        if self.latency_distribution == 'exponential':
+            return rng.expovariate(1.0 / self.latency)
+        # the median is the mean and the sigma is 1, a long tail as the real sites
+        return rng.lognormvariate(0, 1) * self.latency
+
+    def _body(self, rng, title, links):
+        size = rng.randint(self.min_page_size, max(self.min_page_size, self.max_page_size))
+        anchors = ''.join('<li><a href="%s">%s</a></li>' % (link, rng.choice(_WORDS)) for link in links)
+        head = '<html><head><title>%s</title></head><body><h1>%s</h1><ul>%s</ul>' % (title, title, anchors)
+
+        paragraphs, length = [], len(head)
+        while length < size:
+            paragraph = '<p>%s</p>' % ' '.join(rng.choice(_WORDS) for _ in range(50))
+            paragraphs.append(paragraph)
+            length += len(paragraph)
+        return head + ''.join(paragraphs) + '</body></html>'
+
+    def page(self, host, path):
+        """
+        Return a tuple (status, headers, body, latency) of the path on the host (the index of the host).
+        """
+        rng = self._random(host, path)
+        latency = self.sample_latency(rng)
+        parts = [p for p in path.split('/') if p]
+
+        if len(parts) == 3 and parts[0] == 'calendar' and parts[1].isdigit() and parts[2].isdigit():
+            year, month = int(parts[1]), int(parts[2])
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            links = ['/calendar/%s/%s' % (year, month), '/page/%s' % rng.randrange(self.pages_per_host)]
+            return 200, {'Content-Type': 'text/html'}, self._body(rng, 'calendar', links), latency
+
+        if len(parts) != 2 or parts[0] not in ('page', 'moved') or not parts[1].isdigit() \
+                or int(parts[1]) >= self.pages_per_host:
+            return 404, {'Content-Type': 'text/html'}, '<html><body>Not Found</body></html>', latency
+
+        n = int(parts[1])
+        if parts[0] == 'page':
+            if rng.random() < self.error_rate:
+                return 500, {'Content-Type': 'text/html'}, '<html><body>Error</body></html>', latency
+            if rng.random() < self.redirect_rate:
+                return 301, {'Location': '/moved/%s' % n}, '', latency
+
+        links = []
+        for _ in range(self.fan_out):
+            target = rng.randrange(self.pages_per_host)
+            if self.hosts > 1 and rng.random() < self.cross_host_ratio:
+                links.append('%s/page/%s' % (self.base_urls[rng.randrange(self.hosts)], target))
+            else:
+                links.append('/page/%s' % target)
+        if rng.random() < self.trap_rate:
+            links.append('/calendar/2018/%s' % rng.randint(1, 12))
+
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, self._body(rng, 'page %s' % n, links), latency
+
+
+def _serve(site, connection):
+    from aiohttp import web
+
+    def handler(host):
+        async def handle(request):
+            status, headers, body, latency = site.page(host, request.path)
+            if latency > 0:
+                await asyncio.sleep(latency)
+            return web.Response(status=status, headers=headers, body=body.encode('utf-8'))
+
+        return handle
+
+    async def start():
+        runners, base_urls = [], []
+        for host in range(site.hosts):
+            app = web.Application()
+            app.router.add_route('GET', '/{path:.*}', handler(host))
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            runners.append(runner)
+            base_urls.append('http://127.0.0.1:%s' % runner.addresses[0][1])
+        return runners, base_urls
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    runners, base_urls = loop.run_until_complete(start())
+    site.base_urls = base_urls
+    connection.send(base_urls)
+
+    # serve until the parent closes the connection
+    try:
+        loop.run_until_complete(loop.run_in_executor(None, connection.recv))
+    except EOFError:
+        pass
+    finally:
+        for runner in runners:
+            loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+
+class SiteServer(object):
+    """
+    Serve a SyntheticSite in a child process, so that the CPU time and the memory of the server
+    are not counted in the benchmark, each host listens on an ephemeral port of 127.0.0.1.
+
+        with SiteServer(site) as server:
+            roots = server.site.roots()
+    """
+
+    def __init__(self, site):
+        self.site = site
+        self._connection = None
+        self._process = None
+
+    def start(self):
+        self._connection, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(self.site, child), daemon=True)
+        self._process.start()
+        self.site.base_urls = self._connection.recv()
+        return self
+
+    def stop(self):
+        if self._process is None:
+            return
+        try:
+            self._connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._connection.close()
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
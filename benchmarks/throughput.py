@@ -0,0 +1,194 @@
+"""
+The end-to-end throughput benchmark of the AsyncEngine, it crawls a local SyntheticSite and reports
+the pages per second, the latency percentiles of each stage, the CPU time and the peak RSS:
+
+    python -m benchmarks.throughput --hosts 4 --pages-per-host 500 --save-baseline data/baseline.json
+    python -m benchmarks.throughput --hosts 4 --pages-per-host 500 --baseline data/baseline.json
+
+the exit status is 1 if a metric regressed over the tolerance compared with the baseline.
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import json
+import logging
+import sys
+
+from benchmarks import ResourceUsage, StageTimer, compare_with_baseline, save_report
+from benchmarks.site import SyntheticSite, SiteServer, LATENCY_DISTRIBUTIONS
+from common_crawler.configuration import CONFIGURATION
+from common_crawler.http.client.aiohttp import AioHttpClient
+from common_crawler.instrument import Instrumentation
+from common_crawler.pipeline import Pipeline
+from common_crawler.stats import CrawlStats
+
+__all__ = ['DiscardPipeline', 'run', 'main']
+
+# the metrics that compared with the baseline: (path, higher is better)
+BASELINE_METRICS = (
+    ('pages_per_second', True),
+    ('cpu_per_page', False),
+    ('peak_rss', False),
+    ('stages.fetch.p99', False),
+    ('stages.extract.p99', False),
+)
+
+
+class DiscardPipeline(Pipeline):
+    """Count the transmitted pages and discard them, so the benchmark measures the crawl only."""
+
+    def __init__(self, **kwargs):
+        super(__class__, self).__init__(**kwargs)
+        self.pages = 0
+        self.bytes = 0
+
+    def setup(self, **kwargs):
+        pass
+
+    def handle(self, **kwargs):
+        self.pages += 1
+        self.bytes += len(self.data or '')
+
+    def close(self, **kwargs):
+        pass
+
+
+def run(site, max_tasks=100, configuration=None):
+    """
+    Crawl the site (it must be served) by the AsyncEngine and return the report (a dict).
+
+    :param site: an object SyntheticSite that served by the SiteServer
+    :param max_tasks: the number of the concurrent workers
+    :param configuration: the config items that cover the defaults of the benchmark
+    """
+    # the module name "async" is a reserved word since Python 3.7
+    AsyncEngine = importlib.import_module('common_crawler.engines.async').AsyncEngine
+
+    config = dict(CONFIGURATION)
+    config.update(roots=site.roots(), strict=False, interval=0, max_tasks=max_tasks, log_level=0)
+    config.update(configuration or {})
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    instrumentation = Instrumentation() if config['instrumentation'] else None
+
+    async def create_http_client():
+        # the ClientSession must be created in the running event loop
+        return AioHttpClient(loop=loop,
+                             allowed_content_types=config['allowed_content_types'],
+                             max_body_size=config['max_body_size'],
+                             truncate_body=config['truncate_body'],
+                             instrumentation=instrumentation)
+
+    http_client = loop.run_until_complete(create_http_client())
+    pipeline = DiscardPipeline()
+    engine = AsyncEngine(configuration=config, http_client=http_client, pipeline=pipeline, loop=loop)
+    if instrumentation is not None:
+        engine.instrumentation = engine.crawler.instrumentation = instrumentation
+    engine.logger.setLevel(logging.CRITICAL)
+
+    timer = StageTimer()
+    crawler = engine.crawler
+    crawler._process = timer.wrap_async('fetch', crawler._process)
+    engine.link_extractor.extract_links = timer.wrap('extract', engine.link_extractor.extract_links)
+    pipeline.transmit = timer.wrap('transmit', pipeline.transmit)
+    engine.handle_async = timer.wrap_async('handle', engine.handle_async)
+
+    usage = ResourceUsage().start()
+    try:
+        engine.start()
+    finally:
+        usage.stop()
+        loop.run_until_complete(engine.close())
+        loop.close()
+
+    finished_urls = crawler.finished_urls
+    if isinstance(finished_urls, CrawlStats):
+        statuses = finished_urls.statuses
+    else:
+        statuses = collections.Counter(t.response.status for t in finished_urls
+                                       if t is not None and t.response is not None)
+    report = {
+        'site': {k: v for k, v in site.__dict__.items() if k != 'base_urls'},
+        'max_tasks': max_tasks,
+        'pages': pipeline.pages,
+        'bytes': pipeline.bytes,
+        'requests': len(finished_urls),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'pages_per_second': pipeline.pages / usage.wall_time if usage.wall_time else 0,
+        'cpu_per_page': usage.cpu_time / pipeline.pages if pipeline.pages else 0,
+        'stages': timer.report(),
+    }
+    report.update(usage.to_dict())
+    if crawler.trap_detector is not None:
+        report['trap_rejections'] = dict(crawler.trap_detector.rejected)
+    if instrumentation is not None:
+        report['instrumentation'] = instrumentation.to_dict()
+    return report
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='The end-to-end throughput benchmark of the AsyncEngine')
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--pages-per-host', type=int, default=500)
+    parser.add_argument('--fan-out', type=int, default=10)
+    parser.add_argument('--cross-host-ratio', type=float, default=0.1)
+    parser.add_argument('--min-page-size', type=int, default=2048)
+    parser.add_argument('--max-page-size', type=int, default=16384)
+    parser.add_argument('--latency', type=float, default=0.005, help='the mean latency (seconds)')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='exponential')
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--redirect-rate', type=float, default=0.02)
+    parser.add_argument('--trap-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-tasks', type=int, default=100)
+    parser.add_argument('--max-pages', type=int, default=-1)
+    parser.add_argument('--instrumentation', action='store_true',
+                        help='time the stages by the instrumentation of the engine (DNS, connect, TTFB...)')
+    parser.add_argument('--output', help='write the report to this file')
+    parser.add_argument('--baseline', help='compare the report with this baseline file')
+    parser.add_argument('--save-baseline', help='write the report as the baseline to this file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the relative change of a metric that is reported as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    site = SyntheticSite(hosts=args.hosts,
+                         pages_per_host=args.pages_per_host,
+                         fan_out=args.fan_out,
+                         cross_host_ratio=args.cross_host_ratio,
+                         min_page_size=args.min_page_size,
+                         max_page_size=args.max_page_size,
+                         latency=args.latency,
+                         latency_distribution=args.latency_distribution,
+                         error_rate=args.error_rate,
+                         redirect_rate=args.redirect_rate,
+                         trap_rate=args.trap_rate,
+                         seed=args.seed)
+
+    with SiteServer(site):
+        report = run(site, max_tasks=args.max_tasks, configuration={'max_pages': args.max_pages,
+                                                                       'instrumentation': args.instrumentation})
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.output:
+        save_report(report, args.output)
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, BASELINE_METRICS, args.tolerance)
+        for path, expected, actual in regressions:
+            print('[REGRESSION] %s: baseline %.4f, current %.4f' % (path, expected, actual), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""The crawl budget bounds a crawl by depth, pages and time"""
+import collections
+import time
+from urllib.parse import urlsplit
+
+from common_crawler.configuration import CONFIGURATION
+
+__all__ = ['CrawlBudget']
+
+REASON_DEPTH = 'depth'
+REASON_HOST = 'pages_per_host'
+REASON_PAGES = 'pages'
+REASON_TIME = 'time'
+
+
+def _limited(limit):
+    return limit is not None and limit >= 0
+
+
+class CrawlBudget(object):
+    """
+    The class CrawlBudget is enforced when the tasks are admitted into the task queue,
+    each check is a comparison of the counter so that it is cheap for each URL.
+
+        - max_depth: the maximum depth of a task (the roots is 0)
+        - max_pages_per_host: the maximum number of the admitted URLs of each host
+        - max_pages: the maximum number of the admitted URLs of the whole crawl
+        - max_time: the wall-clock deadline (seconds since start())
+
+    The budget is exhausted when the global page cap reached or the deadline passed,
+    then the crawler drains the task queue without fetching (see expired).
+    """
+
+    def __init__(self,
+                 max_depth=CONFIGURATION.get('max_depth', -1),
+                 max_pages_per_host=CONFIGURATION.get('max_pages_per_host', -1),
+                 max_pages=CONFIGURATION.get('max_pages', -1),
+                 max_time=CONFIGURATION.get('max_time', -1)):
+        """
+        The params see the common_crawler.configuration, None or a negative number represent unlimited.
+        """
+        self.max_depth = max_depth
+        self.max_pages_per_host = max_pages_per_host
+        self.max_pages = max_pages
+        self.max_time = max_time
+
+        self.admitted = 0
+        self.rejected = collections.Counter()
+        self.hosts = collections.Counter()
+        self.deadline = None
+        self.start()
+
+    def start(self):
+        """(Re)start the clock of the deadline."""
+        self.deadline = time.time() + self.max_time if _limited(self.max_time) else None
+
+    @property
+    def expired(self):
+        """Return True if the deadline passed."""
+        return self.deadline is not None and time.time() >= self.deadline
+
+    @property
+    def exhausted(self):
+        """Return True if no more URL will be admitted."""
+        return (_limited(self.max_pages) and self.admitted >= self.max_pages) or self.expired
+
+    def check(self, url, depth=0):
+        """Return the reason if the URL is out of the budget, otherwise return None."""
+        if _limited(self.max_pages) and self.admitted >= self.max_pages:
+            return REASON_PAGES
+        if _limited(self.max_depth) and depth > self.max_depth:
+            return REASON_DEPTH
+        if _limited(self.max_pages_per_host) \
+                and self.hosts[urlsplit(url).netloc.lower()] >= self.max_pages_per_host:
+            return REASON_HOST
+        if self.expired:
+            return REASON_TIME
+        return None
+
+    def admit(self, url, depth=0):
+        """Return True and charge the budget if the URL is in the budget, otherwise return False."""
+        reason = self.check(url, depth)
+        if reason is not None:
+            self.rejected[reason] += 1
+            return False
+
+        self.admitted += 1
+        if _limited(self.max_pages_per_host):
+            self.hosts[urlsplit(url).netloc.lower()] += 1
+        return True
+
+    def __repr__(self):
+        return 'CrawlBudget (admitted: %s, rejected: %s, expired: %s)' \
+               % (self.admitted, dict(self.rejected), self.expired)
+
+    __str__ = __repr__
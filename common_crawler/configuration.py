@@ -6,9 +6,16 @@ CONFIGURATION = {
     # The name of the crawler
     'name': 'common_crawler',
 
-    # Root urls, it is the starting point of the crawler
+    # Root urls, it is the starting point of the crawler, it can also be an object of the
+    # common_crawler.seed.SeedSource (e.g. FileSeedSource('roots.txt.gz')) for streaming the root urls lazily
     'roots': (),
 
+    # Pull more root urls from the seed source only when the size of the task queue drops below this value
+    'seeds_low_water': 1000,
+
+    # The number of the root urls that pulled from the seed source each time
+    'seeds_batch_size': 1000,
+
     # A tuple(or single value) of a string containing domains which won't be considered for extracting the links.
     'deny_domains': (),
 
@@ -22,12 +29,57 @@ CONFIGURATION = {
     # else just crawl links of the around
     'follow': True,
 
+    # Skip extracting the links of a page if its SimHash fingerprint is within this number of bits
+    # of a page that has been seen (a near-duplicate), None or a negative number represent disabled,
+    # the fingerprint ignores the tags and the hrefs so the pages that differ only by their links
+    # (e.g. the pagination, the short pages) collide, 3 is a common value when it's enabled
+    'near_duplicate_distance': None,
+
     # The tuple of the regex rule for link that allowed to extract in the LinkExtractor
     'allowed_rule': (),
 
     # The tuple of the regex rule for link that denied to extract in the LinkExtractor
     'denied_rule': (),
 
+    # The maximum depth of the crawl (the root urls is 0), a negative number represent unlimited
+    'max_depth': -1,
+
+    # The maximum number of the urls of each host that admitted into the task queue, a negative number represent unlimited
+    'max_pages_per_host': -1,
+
+    # The maximum number of the urls of the whole crawl that admitted into the task queue,
+    # a negative number represent unlimited
+    'max_pages': -1,
+
+    # The wall-clock deadline of the crawl (unit seconds), the engine drains the task queue without fetching
+    # and finishes reporting when it passed, a negative number represent unlimited
+    'max_time': -1,
+
+    # If the flag is true, reject the urls that look like a crawler trap (infinite URL space) before
+    # adding them to the task queue, the following thresholds are the limits of the common_crawler.trap.TrapDetector
+    # and None or a non-positive number represent the check is disabled, it's opt-in because a large site
+    # may legitimately have more urls of a template (e.g. /article/<id>) than the limit
+    'trap_detection': False,
+
+    # The maximum length of a url
+    'trap_max_url_length': 2048,
+
+    # The maximum number of the segments of a url path
+    'trap_max_path_depth': 16,
+
+    # The maximum number of times that a segment repeats in a url path, e.g. /a/b/a/b/a/b
+    'trap_max_repeated_segments': 2,
+
+    # The maximum number of the query parameters of a url
+    'trap_max_query_params': 12,
+
+    # The maximum number of the distinct urls that a url template produces, the template is the url
+    # that digits in the path are replaced and the query is replaced by its parameter names
+    'trap_max_urls_per_template': 10000,
+
+    # The maximum number of the url templates that tracked, the least recently used one is dropped when it's full
+    'trap_max_templates': 100000,
+
     # Log level, from 0 to 3: ERROR, WARNING, INFO, DEBUG
     'log_level': 2,
 
@@ -41,6 +93,14 @@ CONFIGURATION = {
     # can also be set to a function object, the config item has precedence over log_level and log_file
     'log_init_fn': 'common_crawler.engines._init_logging',
 
+    # Write the log on a background thread (QueueHandler and QueueListener), the event loop only puts
+    # the records into a queue and never waits for the I/O of the console or the file
+    'log_queue': False,
+
+    # The maximum number of the records per second of each message (e.g. the redirects, the retries), the
+    # excess records below the level WARNING are dropped and counted, None represent unlimited
+    'log_rate_limit': None,
+
     # Limit the maximum number of redirect chains, if it's a negative number represent unlimited
     # The unlimited pattern will not limit the number of redirects this could lead to infinite redirection
     'max_redirect': 10,
@@ -48,11 +108,110 @@ CONFIGURATION = {
     # Limit the maximum number of retries on network error
     'max_retries': 4,
 
+    # The tuple of the content types (the media type of the Content-Type) that allowed to download the body,
+    # the other responses are aborted before the body is downloaded, an empty tuple represent allowing all
+    'allowed_content_types': ('text/html', 'application/xhtml+xml'),
+
+    # Limit the maximum size (unit bytes) of the body, a response whose Content-Length exceeds the limit is aborted
+    # and a streamed body is stopped when it exceeds the limit, None or a negative number represent unlimited
+    'max_body_size': 10 * 1024 * 1024,
+
+    # If the flag is true, keep the beginning of a streamed body that exceeds the max_body_size, else reject it
+    'truncate_body': True,
+
     # Limit the maximum number of concurrent connections
     'max_tasks': 100,
 
     # The interval is a time that crawls interval (unit seconds)
-    'interval': 1
+    'interval': 1,
+
+    # Limit the maximum number of in-flight writes of the common_crawler.pipeline.AsyncPipeline,
+    # the crawl waits for a free slot when the limit reached
+    'pipeline_max_inflight': 64,
+
+    # The synchronous pipeline that wrapped by the common_crawler.pipeline.ThreadedPipeline if it is loaded from
+    # the config item pipeline, its writes run in a thread and the in-flight writes are bounded as above
+    'threaded_pipeline': 'common_crawler.pipeline.segment.SegmentFilePipeline',
+
+    # The filename of the SQLite database that keeps the validators (ETag, Last-Modified, the hash of the content)
+    # of the fetched URLs, the crawler sends the conditional requests (If-None-Match, If-Modified-Since) and skips
+    # the pages that responded 304 Not Modified, None represent disabled
+    'validator_store': None,
+
+    # The maximum number of the known URLs (in the validator_store) to revisit at the start of the crawl,
+    # the URLs are ordered by the probability that they have changed, estimated from the change history,
+    # None represent disabled and -1 represent all known urls
+    'revisit_budget': None,
+
+    # Time the stages of the crawl (DNS, connect, TTFB, body, HTML parse, parse, extract, enqueue, transmit and sleep)
+    # into the histograms and report them at the end, the disabled instrumentation costs nearly nothing
+    'instrumentation': False,
+
+    # The filename for dumping the instrumentation as JSON at the end of the crawl, None represent not dump
+    'instrumentation_filename': None,
+
+    # Serve the live metrics (pages per second, queue depth, status codes, per host errors...) in the
+    # Prometheus text format at http://{metrics_host}:{metrics_port}/metrics from the event loop of the
+    # AsyncEngine, None represent disabled
+    'metrics_port': None,
+    'metrics_host': '127.0.0.1',
+
+    # The finished tasks are folded into the counters and the histograms of the crawl (see common_crawler.stats)
+    # instead of being retained, the compact record of each task is appended to this file as a tab-separated
+    # line for the later analysis, None represent not spill
+    'stats_filename': None,
+
+    # Profile the engine: the stack of the event loop is sampled every profile_interval seconds into the folded
+    # stacks (for flamegraph.pl or speedscope) that rewritten every profile_flush_interval seconds, and the
+    # tracemalloc snapshots are diffed every profile_memory_interval seconds (0 represent not trace memory),
+    # the files in the profile_dir are named by the start time and the pid so that the runs can be compared
+    'profile': False,
+    'profile_dir': 'data/profiles',
+    'profile_interval': 0.005,
+    'profile_flush_interval': 10,
+    'profile_memory_interval': 30,
+
+    # Trace the sampled tasks (queued, fetch, retries, redirects, parse, extract and pipeline) into this file in
+    # the Chrome trace event format that can be opened by chrome://tracing or Perfetto, None represent disabled,
+    # trace_sample_rate is the probability that a task is traced and at most trace_max_spans tasks are traced
+    'trace_filename': None,
+    'trace_sample_rate': 0.01,
+    'trace_max_spans': 10000,
+
+    # The memory budget (bytes) of the RSS of the process, None represent unlimited, when the RSS exceeds
+    # memory_soft_ratio of the budget the extracted URLs are deferred to the disk and the concurrent fetches
+    # are limited, above memory_hard_ratio only one fetch at a time, the RSS is sampled at most once per
+    # memory_sample_interval seconds (see common_crawler.governor)
+    'memory_budget': None,
+    'memory_soft_ratio': 0.8,
+    'memory_hard_ratio': 0.95,
+    'memory_sample_interval': 0.5,
+
+    # The maximum number of the permanent redirections (301 and 308) that remembered, the URLs are rewritten
+    # to the known targets when they are enqueued and fetched, a site that redirects every http:// or non-www
+    # URL is learned as a scheme/host rule, 0 represent disabled
+    'redirect_cache_size': 10000,
+
+    # Obey the robots.txt: the robots.txt of each host is fetched once (the concurrent requests share the
+    # same fetch) and cached for robots_ttl seconds, at most robots_cache_size hosts are cached, the disallowed
+    # URLs are filtered before they are enqueued and the requests of a host are spaced by its Crawl-delay
+    # (at most robots_max_crawl_delay seconds), robots_user_agent is matched with the User-agent lines,
+    # None represent the name
+    'robots': False,
+    'robots_user_agent': None,
+    'robots_ttl': 86400,
+    'robots_cache_size': 10000,
+    'robots_max_crawl_delay': 30,
+
+    # Discover the URLs from the sitemaps (the sitemap indexes and the RSS/Atom feeds are read as well): the
+    # sitemaps of the robots.txt of the roots (if sitemaps is True) and the sitemap_urls are streamed into the
+    # task queue in constant memory while crawling, at most sitemap_max_count sitemaps are read and each one at
+    # most sitemap_max_size bytes (after decompressed), the URLs are enqueued newest lastmod first in each batch
+    # and the URLs that not modified since their last fetch (see validator_store) are skipped
+    'sitemaps': False,
+    'sitemap_urls': (),
+    'sitemap_max_count': 1000,
+    'sitemap_max_size': 50 * 1024 * 1024
 }
 
 # Specify the address of each component
@@ -63,10 +222,20 @@ COMPONENTS_CONFIG = {
 
     # The link_extractor is for extract link from a specified response and it must be a subclass
     # of common_crawler.link_extractor.LinkExtractor, about rules of this action, is set in the
-    # CONFIGURATION such as deny_domains, allow_domains and so on
+    # CONFIGURATION such as deny_domains, allow_domains and so on, the built-in link extractors:
+    #   common_crawler.link_extractor.lxml.LxmlLinkExtractor - the links of the HTML pages
+    #   common_crawler.link_extractor.sitemap.SitemapLinkExtractor - the URLs of the sitemaps and the RSS/Atom feeds
+    #   (newest lastmod first), the other pages as LxmlLinkExtractor
     'link_extractor': 'common_crawler.link_extractor.lxml.LxmlLinkExtractor',
 
     # The pipeline is for transmitting parsed data to a place that you want it and must be a subclass of
-    # common_crawler.pipeline.Pipeline
+    # common_crawler.pipeline.Pipeline, the built-in pipelines:
+    #   common_crawler.pipeline.file.SimpleFilePipeline - one file per page, written by a thread pool
+    #   common_crawler.pipeline.ThreadedPipeline - run the pipeline of the config item threaded_pipeline in a thread
+    #   common_crawler.pipeline.segment.SegmentFilePipeline - append records to the rotating segment files
+    #   common_crawler.pipeline.warc.WarcPipeline - write request and response records to the rotating .warc.gz files
+    #   common_crawler.pipeline.sqlite.SqlitePipeline - insert the pages into SQLite by the batched transactions
+    #   common_crawler.pipeline.cas.ContentAddressedPipeline - store each distinct body only once by its hash
+    # the AsyncEngine awaits the pipeline if it is a subclass of common_crawler.pipeline.AsyncPipeline
     'pipeline': 'common_crawler.pipeline.file.SimpleFilePipeline'
 }
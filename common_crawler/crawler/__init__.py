@@ -3,8 +3,11 @@ import logging
 from abc import ABC, abstractmethod
 
 from common_crawler.configuration import CONFIGURATION
-from common_crawler.utils.misc import get_function_by_name, arg_to_iter
-from common_crawler.utils.url import revise_urls
+from common_crawler.instrument import NULL_INSTRUMENTATION
+from common_crawler.metrics import CrawlMetrics
+from common_crawler.seed import to_seed_source
+from common_crawler.utils.misc import get_function_by_name
+from common_crawler.utils.url import get_domain
 
 __all__ = ['Crawler']
 
@@ -14,6 +17,9 @@ DEFAULT_ROOTS = CONFIGURATION.get('roots', ())
 DEFAULT_STRICT = CONFIGURATION.get('strict', True)
 DEFAULT_MAX_REDIRECT = CONFIGURATION.get('max_redirect', 10)
 DEFAULT_MAX_RETRIES = CONFIGURATION.get('max_retries', 4)
+DEFAULT_SEEDS_LOW_WATER = CONFIGURATION.get('seeds_low_water', 1000)
+DEFAULT_SEEDS_BATCH_SIZE = CONFIGURATION.get('seeds_batch_size', 1000)
+DEFAULT_STATS_FILENAME = CONFIGURATION.get('stats_filename', None)
 
 
 class Crawler(ABC):
@@ -31,6 +37,9 @@ class Crawler(ABC):
     and push into the task queue, thus Crawler can get a new URL continually from the task queue to crawl,
     each crawled URL must be put in the seen_urls for distinguishing what is a duplicate, for the finished
     tasks, whether succeeded or failed, will be put in the finished_urls for subsequent recording.
+
+    The roots are wrapped as a common_crawler.seed.SeedSource and streamed into the task queue lazily,
+    the function feed_seeds() pulls a new batch only when the task queue drops below the low-water mark.
     """
 
     def __init__(self,
@@ -39,8 +48,19 @@ class Crawler(ABC):
                  strict=DEFAULT_STRICT,
                  max_redirect=DEFAULT_MAX_REDIRECT,
                  max_retries=DEFAULT_MAX_RETRIES,
+                 seeds_low_water=DEFAULT_SEEDS_LOW_WATER,
+                 seeds_batch_size=DEFAULT_SEEDS_BATCH_SIZE,
+                 stats_filename=DEFAULT_STATS_FILENAME,
                  task_queue=None,
                  http_client=None,
+                 trap_detector=None,
+                 budget=None,
+                 validator_store=None,
+                 instrumentation=None,
+                 tracer=None,
+                 governor=None,
+                 redirect_cache=None,
+                 robots=None,
                  logger=None,
                  **kwargs):
         """
@@ -49,17 +69,50 @@ class Crawler(ABC):
         :param strict: see the common_crawler.configuration
         :param max_redirect: see the common_crawler.configuration
         :param max_retries: see the common_crawler.configuration
+        :param seeds_low_water: see the common_crawler.configuration
+        :param seeds_batch_size: see the common_crawler.configuration
+        :param stats_filename: see the common_crawler.configuration
         :param task_queue: the queue for store the link which ready to crawl
         :param http_client: the client for making the request of HTTP
+        :param trap_detector: an object common_crawler.trap.TrapDetector that decides whether a URL
+        should be admitted into the task queue (the enqueued URLs are recorded by its function record()),
+        None represent admitting all URLs
+        :param budget: an object common_crawler.budget.CrawlBudget that bounds the crawl by depth,
+        pages and time, None represent unlimited
+        :param validator_store: an object common_crawler.revisit.ValidatorStore that keeps the validators
+        (ETag, Last-Modified) of the fetched URLs for the conditional requests, None represent disabled
+        :param instrumentation: an object common_crawler.instrument.Instrumentation that times the stages
+        of the crawl, None represent disabled
+        :param tracer: an object common_crawler.trace.Tracer that records the spans of the sampled tasks,
+        None represent disabled
+        :param governor: an object common_crawler.governor.MemoryGovernor that slows the crawl down when
+        the RSS approaches the memory budget, None represent unlimited
+        :param redirect_cache: an object common_crawler.redirect.RedirectCache that rewrites the URLs to the
+        targets of the known permanent redirections, None represent disabled
+        :param robots: an object common_crawler.robots.RobotsCache that filters the URLs which disallowed by
+        the robots.txt and delays the requests by the Crawl-delay of the hosts, None represent disabled
         """
         self.strict = strict
         self.max_redirect = max_redirect
         self.max_retries = max_retries
+        self.seeds_low_water = seeds_low_water
+        self.seeds_batch_size = seeds_batch_size
+        self.stats_filename = stats_filename
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
         self.task_queue = task_queue or self._init_task_queue()
         self.http_client = http_client or self._init_http_client()
+        self.trap_detector = trap_detector
+        self.budget = budget
+        self.validator_store = validator_store
+        self.tracer = tracer
+        self.governor = governor
+        self.redirect_cache = redirect_cache
+        self.robots = robots
         self.logger = logger or logging.getLogger(name)
         self.seen_urls = self._init_seen_urls()
         self.finished_urls = self._init_finished_urls()
+        # the live counters of the crawl (see common_crawler.metrics)
+        self.metrics = CrawlMetrics()
         self.__dict__.update(**kwargs)
 
         func_names = ('add', 'append')
@@ -70,12 +123,39 @@ class Crawler(ABC):
             function that name is "add" or "append" for adding an element"""
             raise ValueError(message)
 
-        roots = revise_urls(arg_to_iter(roots), strict)
-        for root in roots:
-            self.add_to_task_queue(root)
+        self.seed_source = to_seed_source(roots, strict)
+        self.feed_seeds(force=True)
+
+        self.logger.info('Crawler(%s) is initialized, the seed source of start crawl is %s'
+                         % (self.__class__.__name__ + ":" + name, self.seed_source))
+
+    def feed_seeds(self, force=False):
+        """
+        Pull a batch of root URLs from the seed source into the task queue if the size
+        of the task queue is below the low-water mark (or force is True).
 
-        self.logger.info('Crawler(%s) is initialized, the URL queue of start crawl is  %s'
-                         % (self.__class__.__name__ + ":" + name, roots))
+        :return the number of URLs that added to the task queue
+        """
+        if self.seed_source.exhausted:
+            return 0
+        if self.budget is not None and self.budget.exhausted:
+            return 0
+        if not force and self.task_queue.qsize() >= self.seeds_low_water:
+            return 0
+        # the task queue is fed even if throttled when it's empty, so the crawl always makes progress
+        if self.governor is not None and self.task_queue.qsize() and self.governor.throttled:
+            return 0
+
+        # the seed source doesn't deduplicate, a batch that rejected entirely (e.g. the duplicates)
+        # is followed by the next batch, otherwise the crawl may finish while there are still roots
+        qsize = self.task_queue.qsize()
+        while not self.seed_source.exhausted and self.task_queue.qsize() == qsize:
+            if self.budget is not None and self.budget.exhausted:
+                break
+            roots = self.seed_source.take(self.seeds_batch_size)
+            if roots:
+                self.add_to_task_queue(roots)
+        return self.task_queue.qsize() - qsize
 
     @abstractmethod
     def crawl(self, parse_link=None):
@@ -95,10 +175,37 @@ class Crawler(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def add_to_task_queue(self, url):
-        """Add a URL to the task queue if not seen before"""
+    def add_to_task_queue(self, url, parent=None):
+        """
+        Add a URL to the task queue if not seen before.
+
+        :param url: a URL or a list of URLs
+        :param parent: the task that the URLs were extracted from, None for the roots
+        """
         raise NotImplementedError
 
+    def _admit(self, url, depth=0):
+        """
+        Return True if the URL can be admitted into the task queue, an admitted URL is put in the seen_urls
+        so that a URL that seen or queued before is rejected here and doesn't consume the budget again.
+        """
+        # ignore the difference that prefix of HTTP/HTTPS
+        domain = get_domain(url)
+        if domain in self.seen_urls:
+            return False
+        if self.trap_detector is not None and not self.trap_detector.admit(url):
+            self.logger.debug('Reject the url %s that looks like a crawler trap', url)
+            return False
+        # before the budget, a disallowed URL doesn't consume the budget
+        if self.robots is not None and not self.robots.allowed(url):
+            self.logger.debug('Reject the url %s that is disallowed by the robots.txt', url)
+            return False
+        if self.budget is not None and not self.budget.admit(url, depth):
+            self.logger.debug('Reject the url %s that is out of the crawl budget', url)
+            return False
+        self.add_to_seen_urls(domain)
+        return True
+
     @abstractmethod
     def _init_task_queue(self):
         raise NotImplementedError
@@ -1,109 +1,333 @@
 import asyncio
 
+from w3lib.url import canonicalize_url
+
 from common_crawler.crawler import Crawler
-from common_crawler.http.client.aiohttp import AioHttpClient
+from common_crawler.http.client.aiohttp import AioHttpClient, DEFAULT_ALLOWED_CONTENT_TYPES, DEFAULT_MAX_BODY_SIZE, \
+    DEFAULT_TRUNCATE_BODY
+from common_crawler.stats import CrawlStats
 from common_crawler.task import Task
 from common_crawler.utils.misc import arg_to_iter
 from common_crawler.utils.url import join_url, is_redirect, get_domain
 
 __all__ = ['AsyncCrawler']
 
+# returned by the function _process() instead of a task that waits for the Crawl-delay of its host
+_PARKED = object()
+# returned by the function _process() instead of a task that disallowed by the robots.txt
+_DISALLOWED = object()
+# returned by the function _process() instead of a task that coalesced with an inflight request
+_COALESCED = object()
+
+
+def _canonical(url):
+    try:
+        return canonicalize_url(url)
+    except ValueError:
+        return url
+
 
 class AsyncCrawler(Crawler):
     """
     The class AsyncCrawler is an implementation of the class Crawler base on the asyncio.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self,
+                 allowed_content_types=DEFAULT_ALLOWED_CONTENT_TYPES,
+                 max_body_size=DEFAULT_MAX_BODY_SIZE,
+                 truncate_body=DEFAULT_TRUNCATE_BODY,
+                 **kwargs):
+        """
+        The params allowed_content_types, max_body_size and truncate_body see the common_crawler.configuration,
+        they are passed to the default http client (a given http_client keeps its own limits).
+        """
+        # the http client is initialized by the constructor of the super class
+        self.allowed_content_types = allowed_content_types
+        self.max_body_size = max_body_size
+        self.truncate_body = truncate_body
         super(self.__class__, self).__init__(**kwargs)
+        # the number of the tasks that dropped without fetching because the crawl budget expired
+        self.dropped = 0
+        # the number of the tasks that responded 304 Not Modified to the conditional request
+        self.not_modified = 0
+        # the canonical URLs that are being fetched and the number of the requests that coalesced with them
+        self.inflight_urls = set()
+        self.coalesced = 0
+        # the number of the tasks that are waiting for the Crawl-delay of their hosts outside the task queue
+        self.parked = 0
 
     async def crawl(self, parse_link=None):
         try:
             while True:
                 task = await self.task_queue.get()
-                task, url = await self._process(task, parse_link)
-
-                # ignore the failed task
-                if task is None:
-                    self.logger.error('The url %s is invalid' % url)
-                elif isinstance(task.exception, Exception):
-                    self.logger.error('The url %s is invalid, raise exception %s' % (url, task.exception))
-                # if the task is valid
-                # return the Task to the Engine for extract links and handle parsed data
-                else:
-                    yield task
+
+                # drain the task queue without fetching when the deadline passed
+                if self.budget is not None and self.budget.expired:
+                    self.dropped += 1
+                    self.task_queue.task_done()
+                    continue
+
+                span = task.span
+                governor = self.governor
+                if governor is not None:
+                    await governor.acquire()
+                # the slot of the governor is released even if the fetch raised or the generator was closed
+                try:
+                    task, url = await self._process(task, parse_link)
+                    # the task is put back into the task queue when the Crawl-delay of its host passed
+                    if task is _PARKED:
+                        continue
+                    yielded = False
+
+                    # the skipped task is not an error, it has been counted by the function _process()
+                    if task is _DISALLOWED or task is _COALESCED:
+                        task = None
+                    # ignore the failed task
+                    elif task is None:
+                        self.logger.error('The url %s is invalid', url)
+                    elif isinstance(task.exception, Exception):
+                        self.logger.error('The url %s is invalid, raise exception %s', url, task.exception)
+                    # the body was not downloaded because of the content type or the size
+                    elif getattr(task.response, 'rejected', None):
+                        self.logger.debug('The body of the url %s is rejected by %s', url, task.response.rejected)
+                    # the page is unchanged since the last fetch
+                    elif task.response.status == 304:
+                        self.not_modified += 1
+                        self.logger.debug('The url %s is not modified since the last fetch', url)
+                    # if the task is valid
+                    # return the Task to the Engine for extract links and handle parsed data
+                    else:
+                        yielded = True
+                        yield task
+                finally:
+                    if governor is not None:
+                        governor.release()
 
                 # for record
+                self.metrics.observe(task, url, yielded)
                 self.add_to_finished_urls(task)
+                # the engine has handled the yielded task when the generator resumes
+                if span is not None:
+                    span.finish()
+                # refill before task_done() so that join() of the task queue can't finish
+                # while the seed source still has root URLs
+                self.feed_seeds()
                 self.task_queue.task_done()
         except asyncio.CancelledError:
             pass
 
     async def _process(self, task, parse_link):
         """
-        Process the url and return the Task which contains the parsed data.
+        Process the url and return the Task which contains the parsed data, the redirections
+        are followed in a loop, at most max_redirect hops.
         """
-        exception = None
-        response = None
         url = task.url if task.redirect_num == 0 else task.redirect_url
+        span = task.span
+        # the url of a new task has been put in the seen_urls when it was admitted into the task queue
+        admitted = task.redirect_num == 0
+        # the task has waited for the Crawl-delay, its url has been checked and the request slot reserved
+        reserved = task.delayed_url is not None
+        if reserved:
+            url, task.delayed_url = task.delayed_url, None
+            admitted = True
+        elif span is not None and task.redirect_num == 0:
+            span.complete('queued', span.created)
+
+        # skip the hops of the known permanent redirections
+        if self.redirect_cache is not None and not reserved:
+            target = self.redirect_cache.resolve(url)
+            if target != url:
+                self.add_to_seen_urls(get_domain(url))
+                task.redirect_url = url = target
+                admitted = False
 
-        # ignore the difference that prefix of HTTP/HTTPS
-        domain = get_domain(url)
-        if domain in self.seen_urls:
-            return None, url
+        while True:
+            # ignore the difference that prefix of HTTP/HTTPS
+            domain = get_domain(url)
+            if admitted:
+                admitted = False
+                # the task may be put into the task queue directly
+                self.add_to_seen_urls(domain)
+            elif domain in self.seen_urls:
+                if span is not None:
+                    span.instant('duplicate', url=url)
+                return None, url
+            else:
+                self.add_to_seen_urls(domain)
+
+            # the robots.txt of the host is fetched once, then the task is parked until the Crawl-delay passed
+            if self.robots is not None and not reserved:
+                if not await self._obey_robots(url, span):
+                    return _DISALLOWED, url
+                delay = self.robots.reserve(url)
+                if delay > 0:
+                    self._park(task, url, delay)
+                    return _PARKED, url
+            reserved = False
+
+            # coalesce the concurrent requests for the same canonical URL, the first one fetches it
+            key = _canonical(url)
+            if key in self.inflight_urls:
+                self.coalesced += 1
+                if span is not None:
+                    span.instant('coalesced', url=url)
+                return _COALESCED, url
+            self.inflight_urls.add(key)
+            try:
+                fetched = await self._fetch(task, url)
+            finally:
+                self.inflight_urls.discard(key)
+            if not fetched:
+                return task, url
+
+            if not is_redirect(task.response.status):
+                break
+
+            # handle the redirection
+            location = task.response.headers.get('location', url)
+            task.redirect_url = join_url(location, base_url=url)
+            if self.redirect_cache is not None:
+                self.redirect_cache.record(url, task.redirect_url, task.response.status)
+
+            if get_domain(task.redirect_url) in self.seen_urls:
+                return None, url
+
+            if task.redirect_num < self.max_redirect:
+                self.logger.info('Redirect to %s from %s', task.redirect_url, url)
+                if span is not None:
+                    span.instant('redirect', location=task.redirect_url)
+                task.redirect_num += 1
+                url = task.redirect_url
+            else:
+                self.logger.error('Redirect limit reached for %s from %s', task.redirect_url, url)
+                return None, url
+
+        # get parsed data by the function parse_link()
+        if getattr(task.response, 'rejected', None):
+            return task, url
+        elif task.response.status == 304:
+            if self.validator_store is not None:
+                self.validator_store.not_modified(url)
+            return task, url
         else:
-            self.add_to_seen_urls(domain)
+            # the validators of an error page would make the next fetch conditional on the error
+            if self.validator_store is not None and 200 <= task.response.status < 300:
+                self.validator_store.update(url, task.response.headers, task.response.text)
+            instrumentation = self.instrumentation
+            start = instrumentation.clock()
+            if span is not None:
+                span.begin('parse')
+            if parse_link is not None:
+                task.parsed_data = parse_link(task.response)
+            else:
+                task.parsed_data = self.parse_link(task.response)
+            instrumentation.observe('parse', start)
+            if span is not None:
+                span.end('parse')
+            return task, url
+
+    async def _obey_robots(self, url, span=None):
+        """Return False if the robots.txt disallows the url, the robots.txt is fetched if not cached."""
+        if not await self.robots.can_fetch(url):
+            self.logger.debug('The url %s is disallowed by the robots.txt', url)
+            if span is not None:
+                span.instant('disallowed', url=url)
+            return False
+        return True
+
+    def _park(self, task, url, delay):
+        """
+        Put the task back into the task queue after the delay (seconds), so that neither a worker nor a slot
+        of the governor is held while the task waits for the Crawl-delay of its host.
+        """
+        task.delayed_url = url
+        self.parked += 1
+        if task.span is not None:
+            task.span.begin('crawl_delay')
+        asyncio.get_event_loop().call_later(delay, self._unpark, task, delay)
+
+    def _unpark(self, task, delay):
+        self.parked -= 1
+        if task.span is not None:
+            task.span.end('crawl_delay', seconds=delay)
+        self.task_queue.put_nowait(task)
+        # the task was taken from the task queue before it was parked, the join() of the task queue
+        # can't finish while a task is parked
+        self.task_queue.task_done()
+
+    async def _fetch(self, task, url):
+        """
+        Request the url (at most max_retries tries) and set the response to the task,
+        return False if all tries have failed, the last exception is set to the task.
+        """
+        exception = None
+        response = None
+        span = task.span
+        kwargs = {'allow_redirects': False}
+        if self.validator_store is not None:
+            headers = self.validator_store.conditional_headers(url)
+            if headers:
+                kwargs['headers'] = headers
 
+        instrumentation = self.instrumentation
+        start = instrumentation.clock()
+        if span is not None:
+            span.begin('fetch')
         while task.retries_num < self.max_retries:
             try:
-                response = self.http_client.get(url, allow_redirects=False)
+                response = self.http_client.get(url, **kwargs)
 
                 if task.retries_num > 1:
-                    self.logger.debug(
-                        'Request the url %s has succeeded, tries %s times' % (
-                            url, task.retries_num))
+                    self.logger.debug('Request the url %s has succeeded, tries %s times', url, task.retries_num)
 
                 break
             except Exception as error:
-                self.logger.debug(
-                    'Request the url %s has failed and tried again, tries %s times, raised: %s' % (
-                        url, task.retries_num, error))
+                self.logger.debug('Request the url %s has failed and tried again, tries %s times, raised: %s',
+                                  url, task.retries_num, error)
                 exception = error
+                instrumentation.incr('retries')
+                if span is not None:
+                    span.instant('retry', error=error)
 
             task.retries_num += 1
 
         # all tries is failed
         if task.retries_num == self.max_retries:
-            self.logger.error(
-                'All attempts to request the url %s have failed and will to ignore this task' % url)
+            self.logger.error('All attempts to request the url %s have failed and will to ignore this task', url)
             task.exception = exception
-            return task, url
+            instrumentation.incr('failures')
+            if span is not None:
+                span.end('fetch', url=url, error=exception)
+            return False
 
-        # get parsed data by the function parse_link(), and handle the redirection
-        async with response as resp:
-            task.response = await self.http_client.get_response(resp)
-
-            if is_redirect(task.response.status):
-                location = task.response.headers.get('location', url)
-                task.redirect_url = join_url(location, base_url=url)
-
-                if get_domain(task.redirect_url) in self.seen_urls:
-                    return None, url
-
-                if task.redirect_num < self.max_redirect:
-                    self.logger.info('Redirect to %s from %s ' % (task.redirect_url, url))
-                    task.redirect_num += 1
-                    # recursive request the redirect url
-                    return await self._process(task, parse_link)
-                else:
-                    self.logger.error('Redirect limit reached for %s from %s' % (task.redirect_url, url))
-                    return None, url
-            else:
-                if parse_link is not None:
-                    task.parsed_data = parse_link(task.response)
-                else:
-                    task.parsed_data = self.parse_link(task.response)
-                return task, url
+        self.metrics.inflight += 1
+        try:
+            async with response as resp:
+                # the time to the first byte includes the DNS resolution and the connection
+                instrumentation.observe('ttfb', start)
+                task.response = await self.http_client.get_response(resp)
+        finally:
+            self.metrics.inflight -= 1
+        if span is not None:
+            span.end('fetch', url=url, status=task.response.status)
+        return True
+
+    def feed_seeds(self, force=False):
+        """Put the URLs that deferred by the memory governor back first, then the seeds."""
+        governor = self.governor
+        if governor is None or not governor.deferred:
+            return super(AsyncCrawler, self).feed_seeds(force)
+
+        qsize = self.task_queue.qsize()
+        if qsize and (governor.throttled or (not force and qsize >= self.seeds_low_water)):
+            return 0
+        deferred = governor.take_deferred(self.seeds_batch_size)
+        for url, depth, parent in deferred:
+            self.task_queue.put_nowait(
+                Task(url=url, depth=depth, parent=parent,
+                     span=self.tracer.start_span(url) if self.tracer is not None else None)
+            )
+        return len(deferred)
 
     def parse_link(self, response):
         """
@@ -111,28 +335,54 @@ class AsyncCrawler(Crawler):
         """
         return response.text
 
-    def add_to_task_queue(self, url):
+    def add_to_task_queue(self, url, parent=None):
         urls = arg_to_iter(url)
+        depth = parent.depth + 1 if parent is not None else 0
+        parent_url = parent.url if parent is not None else None
+        tracer = self.tracer
+        # the extracted URLs are deferred to the disk while the memory is throttled
+        defer = parent is not None and self.governor is not None and self.governor.throttled
+        redirect_cache = self.redirect_cache
+        trap_detector = self.trap_detector
+        added = 0
         for u in urls:
-            self.task_queue.put_nowait(
-                Task(url=u)
-            )
-        self.logger.debug('Adding the url %s into the task queue' % urls)
+            if redirect_cache is not None:
+                u = redirect_cache.resolve(u)
+            if not self._admit(u, depth):
+                continue
+            if defer:
+                self.governor.defer(u, depth, parent_url)
+            else:
+                self.task_queue.put_nowait(
+                    Task(url=u, depth=depth, parent=parent_url,
+                         span=tracer.start_span(u) if tracer is not None else None)
+                )
+                added += 1
+            # only the enqueued URLs are counted by the templates
+            if trap_detector is not None:
+                trap_detector.record(u)
+        # only the number of the URLs, formatting the whole list costs more than enqueuing it
+        self.logger.debug('Adding %s urls into the task queue from %s', added, parent_url)
 
     def _init_task_queue(self):
         return asyncio.Queue()
 
     def _init_http_client(self):
-        return AioHttpClient()
+        return AioHttpClient(allowed_content_types=self.allowed_content_types,
+                             max_body_size=self.max_body_size,
+                             truncate_body=self.truncate_body,
+                             instrumentation=self.instrumentation)
 
     def _init_seen_urls(self):
         return set()
 
     def _init_finished_urls(self):
-        return []
+        return CrawlStats(spill_filename=self.stats_filename)
 
     async def close(self):
         await self.http_client.close()
+        if isinstance(self.finished_urls, CrawlStats):
+            self.finished_urls.close()
 
     async def __aenter__(self):
         return self
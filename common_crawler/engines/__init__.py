@@ -1,15 +1,30 @@
 """The engine for start the crawler system, it assembles all components then start crawling."""
 
+import asyncio
 import logging
 import sys
 import time
 from abc import ABC, abstractmethod
 
+from common_crawler.budget import CrawlBudget
 from common_crawler.configuration import CONFIGURATION, COMPONENTS_CONFIG
 from common_crawler.crawler import Crawler
+from common_crawler.governor import MemoryGovernor
+from common_crawler.instrument import Instrumentation, NULL_INSTRUMENTATION
 from common_crawler.link_extractor import LinkExtractor
-from common_crawler.pipeline import Pipeline
+from common_crawler.link_extractor.sitemap import SitemapDiscovery
+from common_crawler.pipeline import Pipeline, AsyncPipeline
+from common_crawler.profiler import Profiler
+from common_crawler.redirect import RedirectCache
+from common_crawler.revisit import ValidatorStore, RevisitScheduler
+from common_crawler.robots import RobotsCache
+from common_crawler.seed import SeedSource
+from common_crawler.stats import CrawlStats
+from common_crawler.trace import Tracer
+from common_crawler.trap import TrapDetector
+from common_crawler.utils.log import RateLimitFilter, start_queue_logging
 from common_crawler.utils.misc import verify_configuration, dynamic_import, DynamicImportReturnType as ReturnType
+from common_crawler.utils.simhash import SimhashIndex, simhash, tokenize
 
 __all__ = ['Engine']
 
@@ -27,21 +42,40 @@ def _init_logging(configuration):
     log_level = levels[min(configuration.get('log_level', 2), len(levels) - 1)]
     log_format = configuration.get('log_format', None)
     log_formatter = None
+    log_filename = configuration.get('log_filename', None)
+    logger = logging.getLogger(configuration.get('name', 'common_crawler'))
 
     if isinstance(log_format, str):
         log_formatter = logging.Formatter(fmt=log_format)
-        logging.basicConfig(level=log_level, format=log_format)
-    else:
-        logging.basicConfig(level=log_level)
 
-    logger = logging.getLogger(configuration.get('name', 'common_crawler'))
-    log_filename = configuration.get('log_filename', None)
-    if isinstance(log_filename, str):
-        handle = logging.FileHandler(filename=log_filename)
-        handle.setLevel(log_level)
+    if configuration.get('log_queue', False):
+        # the handlers write on the thread of a QueueListener, the event loop only puts the records into a queue
+        handlers = [logging.StreamHandler()]
+        if isinstance(log_filename, str):
+            handlers.append(logging.FileHandler(filename=log_filename))
+        for handle in handlers:
+            handle.setLevel(log_level)
+            if log_formatter is not None:
+                handle.setFormatter(log_formatter)
+        start_queue_logging(handlers, logger)
+        logger.setLevel(log_level)
+        logger.propagate = False
+    else:
         if log_formatter is not None:
-            handle.setFormatter(log_formatter)
-        logger.addHandler(handle)
+            logging.basicConfig(level=log_level, format=log_format)
+        else:
+            logging.basicConfig(level=log_level)
+
+        if isinstance(log_filename, str):
+            handle = logging.FileHandler(filename=log_filename)
+            handle.setLevel(log_level)
+            if log_formatter is not None:
+                handle.setFormatter(log_formatter)
+            logger.addHandler(handle)
+
+    log_rate_limit = configuration.get('log_rate_limit', None)
+    if log_rate_limit is not None and log_rate_limit > 0:
+        logger.addFilter(RateLimitFilter(rate=log_rate_limit))
 
     return logger
 
@@ -100,7 +134,8 @@ class Engine(ABC):
 
         :param kwargs: additional configuration item that has precedence over CONFIGURATION
         """
-        self.config = {}
+        # the items that missing in the configuration fall back to the default CONFIGURATION
+        self.config = dict(CONFIGURATION)
         if verify_configuration(configuration):
             self.config.update(configuration)
 
@@ -125,6 +160,39 @@ class Engine(ABC):
             print('next, call the default function for initialize log system.')
             self.logger = _init_logging(self.config)
 
+        trap_detector = TrapDetector(max_url_length=self.config['trap_max_url_length'],
+                                     max_path_depth=self.config['trap_max_path_depth'],
+                                     max_repeated_segments=self.config['trap_max_repeated_segments'],
+                                     max_query_params=self.config['trap_max_query_params'],
+                                     max_urls_per_template=self.config['trap_max_urls_per_template'],
+                                     max_templates=self.config['trap_max_templates']) \
+            if self.config['trap_detection'] else None
+
+        budget = CrawlBudget(max_depth=self.config['max_depth'],
+                             max_pages_per_host=self.config['max_pages_per_host'],
+                             max_pages=self.config['max_pages'],
+                             max_time=self.config['max_time'])
+
+        validator_store = ValidatorStore(self.config['validator_store']) \
+            if self.config['validator_store'] else None
+
+        self.instrumentation = Instrumentation() if self.config['instrumentation'] else NULL_INSTRUMENTATION
+
+        self.tracer = Tracer(self.config['trace_filename'],
+                             sample_rate=self.config['trace_sample_rate'],
+                             max_spans=self.config['trace_max_spans']) \
+            if self.config['trace_filename'] else None
+
+        redirect_cache = RedirectCache(max_urls=self.config['redirect_cache_size']) \
+            if self.config['redirect_cache_size'] else None
+
+        self.governor = MemoryGovernor(self.config['memory_budget'],
+                                       soft_ratio=self.config['memory_soft_ratio'],
+                                       hard_ratio=self.config['memory_hard_ratio'],
+                                       sample_interval=self.config['memory_sample_interval'],
+                                       max_concurrency=self.config['max_tasks']) \
+            if self.config['memory_budget'] else None
+
         self.crawler = crawler if crawler else dynamic_import(components['crawler'],
                                                               ReturnType.CLASS,
                                                               name=self.config['name'],
@@ -132,13 +200,43 @@ class Engine(ABC):
                                                               strict=self.config['strict'],
                                                               max_redirect=self.config['max_redirect'],
                                                               max_retries=self.config['max_retries'],
+                                                              seeds_low_water=self.config['seeds_low_water'],
+                                                              seeds_batch_size=self.config['seeds_batch_size'],
+                                                              stats_filename=self.config['stats_filename'],
                                                               task_queue=task_queue,
                                                               http_client=http_client,
+                                                              trap_detector=trap_detector,
+                                                              budget=budget,
+                                                              validator_store=validator_store,
+                                                              instrumentation=self.instrumentation,
+                                                              tracer=self.tracer,
+                                                              governor=self.governor,
+                                                              redirect_cache=redirect_cache,
+                                                              allowed_content_types=self.config[
+                                                                  'allowed_content_types'],
+                                                              max_body_size=self.config['max_body_size'],
+                                                              truncate_body=self.config['truncate_body'],
                                                               logger=self.logger)
 
         if callable(parse_link):
             self.crawler.parse_link = parse_link
 
+        # a given crawler shares the instrumentation of the engine
+        crawler_instrumentation = getattr(self.crawler, 'instrumentation', None)
+        if self.instrumentation.enabled and (crawler_instrumentation is None or not crawler_instrumentation.enabled):
+            self.crawler.instrumentation = self.instrumentation
+        if self.tracer is not None and getattr(self.crawler, 'tracer', None) is None:
+            self.crawler.tracer = self.tracer
+        if self.governor is not None and getattr(self.crawler, 'governor', None) is None:
+            self.crawler.governor = self.governor
+        # the robots.txt is requested by the http client of the crawler
+        if self.config['robots'] and getattr(self.crawler, 'robots', None) is None:
+            self.crawler.robots = RobotsCache(self.crawler.http_client,
+                                              user_agent=self.config['robots_user_agent'] or self.config['name'],
+                                              ttl=self.config['robots_ttl'],
+                                              max_hosts=self.config['robots_cache_size'],
+                                              max_crawl_delay=self.config['robots_max_crawl_delay'])
+
         if not isinstance(self.crawler, Crawler):
             raise ValueError('The crawler is invalid and must be a subclass of %s.%s, got %s.%s'
                              % (Crawler.__module__,
@@ -175,6 +273,47 @@ class Engine(ABC):
                                 self.pipeline.__class__.__name__)
                              )
 
+        # the failed writes of a loaded AsyncPipeline are logged by the logger of the engine
+        if pipeline is None and isinstance(self.pipeline, AsyncPipeline):
+            self.pipeline.logger = self.logger
+            self.pipeline.max_inflight = self.config['pipeline_max_inflight']
+
+        if self.governor is not None:
+            self.governor.probes.update(task_queue=self.crawler.task_queue.qsize,
+                                        inflight_fetches=lambda: self.crawler.metrics.inflight,
+                                        pipeline_inflight=lambda: getattr(self.pipeline, 'inflight', 0),
+                                        seen_urls=lambda: len(self.crawler.seen_urls))
+
+        # the sitemaps are streamed into the task queue while crawling, a SeedSource of the roots is never
+        # materialized for discovering the sitemaps of their hosts
+        roots = self.config['roots']
+        self.sitemap_discovery = SitemapDiscovery(sitemap_urls=self.config['sitemap_urls'],
+                                                  hosts=roots if self.config['sitemaps']
+                                                  and not isinstance(roots, SeedSource) else (),
+                                                  max_sitemaps=self.config['sitemap_max_count'],
+                                                  max_size=self.config['sitemap_max_size'],
+                                                  logger=self.logger) \
+            if self.config['sitemaps'] or self.config['sitemap_urls'] else None
+
+        # revisit the known URLs that most likely changed since the last run
+        validator_store = getattr(self.crawler, 'validator_store', None)
+        if validator_store is not None and self.config['revisit_budget'] is not None:
+            revisits = RevisitScheduler(validator_store).schedule(self.config['revisit_budget'])
+            self.crawler.add_to_task_queue(revisits)
+            self.logger.info('Scheduled %s URLs for revisiting' % len(revisits))
+
+        self.profiler = Profiler(dirname=self.config['profile_dir'],
+                                 name=self.config['name'],
+                                 interval=self.config['profile_interval'],
+                                 flush_interval=self.config['profile_flush_interval'],
+                                 memory_interval=self.config['profile_memory_interval']) \
+            if self.config['profile'] else None
+
+        near_duplicate_distance = self.config['near_duplicate_distance']
+        self.near_duplicate_skips = 0
+        self.simhash_index = SimhashIndex(k=near_duplicate_distance) \
+            if near_duplicate_distance is not None and near_duplicate_distance >= 0 else None
+
     def start(self):
         try:
             self.start_time = time.time()
@@ -182,6 +321,17 @@ class Engine(ABC):
                              % (self.__module__, self.__class__.__name__))
 
             self.show_config_info()
+
+            # the deadline of the crawl budget counts from the start of the engine
+            budget = getattr(self.crawler, 'budget', None)
+            if budget is not None:
+                budget.start()
+
+            if self.profiler is not None:
+                self.profiler.start()
+                filenames = (self.profiler.cpu_filename, self.profiler.memory_filename)
+                self.logger.info('Profiling the engine into %s' % ', '.join(f for f in filenames if f))
+
             self.work()
         except KeyboardInterrupt:
             sys.stderr.flush()
@@ -190,6 +340,8 @@ class Engine(ABC):
             self.logger.error(message)
         finally:
             self.end_time = time.time()
+            if self.profiler is not None:
+                self.profiler.stop()
             self.reporting()
 
     def show_config_info(self):
@@ -219,18 +371,92 @@ class Engine(ABC):
 
     def reporting(self):
         """Reporting the info that finished the task with crawler.finished_urls"""
-        finished = self._clean_for_finished_urls()
-
+        finished_urls = self.crawler.finished_urls
         self.logger.info('--------- Finished task ---------')
-        self.logger.info('The number of the finished task: %s' % len(finished))
-        for t in finished:
-            response = t.response
-
-            self.logger.info('Task(%s) - %s<%s>:%s content: %s<%s> retries %s redirects %s'
-                             % ('Invalid, error: %s' % t.exception if t.exception else 'Valid',
-                                t.url, response.status, response.reason,
-                                response.content_type, response.content_length,
-                                t.retries_num, t.redirect_num))
+        if isinstance(finished_urls, CrawlStats):
+            # the statistics are folded while crawling, so the reporting costs constant memory
+            finished_urls.flush()
+            for line in finished_urls.report():
+                self.logger.info('[STATS]: %s' % line)
+            metrics = getattr(self.crawler, 'metrics', None)
+            if metrics is not None:
+                for host, count in metrics.host_errors.most_common(10):
+                    self.logger.info('[HOST]: %s failed %s of %s requests'
+                                     % (host, count, metrics.host_requests[host]))
+        else:
+            finished = self._clean_for_finished_urls()
+            self.logger.info('The number of the finished task: %s' % len(finished))
+            for t in finished:
+                response = t.response
+
+                self.logger.info('Task(%s) - %s<%s>:%s content: %s<%s> retries %s redirects %s'
+                                 % ('Invalid, error: %s' % t.exception if t.exception else 'Valid',
+                                    t.url, response.status, response.reason,
+                                    response.content_type, response.content_length,
+                                    t.retries_num, t.redirect_num))
+
+        failed = getattr(self.pipeline, 'failed', 0)
+        if failed:
+            self.logger.error('The pipeline failed %s writes, the last exception: %r'
+                              % (failed, getattr(self.pipeline, 'last_exception', None)))
+
+        budget = getattr(self.crawler, 'budget', None)
+        if budget is not None:
+            self.logger.info('Crawl budget: %s' % budget)
+
+        trap_detector = getattr(self.crawler, 'trap_detector', None)
+        if trap_detector is not None:
+            self.logger.info('Crawler traps: %s' % trap_detector)
+            for host, count in trap_detector.rejected_hosts.most_common(10):
+                self.logger.info('[TRAP]: %s rejected %s urls' % (host, count))
+
+        http_stats = getattr(getattr(self.crawler, 'http_client', None), 'stats', None)
+        if http_stats:
+            self.logger.info('Bodies: %s bytes downloaded, %s bytes saved, rejected by the content type %s '
+                             'and by the size %s, truncated %s'
+                             % tuple(http_stats.get(k, 0) for k in ('bytes_downloaded', 'bytes_saved',
+                                                                     'rejected_content_type', 'rejected_size',
+                                                                     'truncated')))
+
+        not_modified = getattr(self.crawler, 'not_modified', None)
+        if not_modified:
+            self.logger.info('Not modified since the last fetch: %s' % not_modified)
+
+        coalesced = getattr(self.crawler, 'coalesced', None)
+        if coalesced:
+            self.logger.info('The requests that coalesced with an in-flight request of the same URL: %s' % coalesced)
+
+        if self.instrumentation.enabled:
+            for line in self.instrumentation.report():
+                self.logger.info('[STAGE]: %s' % line)
+            filename = self.config['instrumentation_filename']
+            if filename:
+                self.instrumentation.dump(filename)
+
+        redirect_cache = getattr(self.crawler, 'redirect_cache', None)
+        if redirect_cache is not None:
+            self.logger.info('Redirections: %s' % redirect_cache)
+
+        if self.sitemap_discovery is not None:
+            self.logger.info('Sitemaps: %s' % self.sitemap_discovery)
+
+        robots = getattr(self.crawler, 'robots', None)
+        if robots is not None:
+            self.logger.info('Robots: %s' % robots)
+
+        if self.governor is not None:
+            self.logger.info('Memory governor: %s' % self.governor)
+
+        if self.tracer is not None:
+            self.logger.info('Traced %s tasks into %s' % (self.tracer.sampled, self.tracer.filename))
+
+        if self.profiler is not None:
+            self.logger.info('Profiled %s samples and %s memory snapshots into %s'
+                             % (self.profiler.samples, self.profiler.snapshots, self.profiler.dirname))
+
+        if self.simhash_index is not None:
+            self.logger.info('The number of the near-duplicate pages that skipped link extraction: %s'
+                             % self.near_duplicate_skips)
 
         self.logger.info('--------- Total time %ss ---------' % int(self.start_time - self.end_time))
 
@@ -257,23 +483,75 @@ class Engine(ABC):
         if self.config['follow']:
             self.add_links(task)
 
-        self.transmit_data(task)
+        instrumentation = self.instrumentation
+        span = getattr(task, 'span', None)
+        if span is not None:
+            span.begin('pipeline')
+        start = instrumentation.clock()
+        try:
+            result = self.transmit_data(task)
+            # an AsyncPipeline returns a coroutine, it can only be awaited here if no event loop is running
+            if asyncio.iscoroutine(result):
+                loop = asyncio.get_event_loop()
+                if loop.is_running():
+                    result.close()
+                    raise RuntimeError('The pipeline %s is asynchronous, the task must be handled by handle_async()'
+                                       % self.pipeline.__class__.__name__)
+                loop.run_until_complete(result)
+        finally:
+            instrumentation.observe('transmit', start)
+            if span is not None:
+                span.end('pipeline', pipeline=self.pipeline.__class__.__name__)
 
         interval = self.config['interval']
         if interval > 0:
+            start = instrumentation.clock()
             time.sleep(interval)
+            instrumentation.observe('sleep', start)
 
     def add_links(self, task):
         """
-        Add the links to the task queue for next crawl.
+        Add the links to the task queue for next crawl, the link extraction is skipped
+        if the page is a near-duplicate of a page that has been seen (see is_near_duplicate()).
 
         :param task: a task return from Crawler.crawl()
         """
         response = task.response
+        if self.is_near_duplicate(response):
+            self.near_duplicate_skips += 1
+            self.logger.debug('Skip extracting the links of the near-duplicate page %s', task.url)
+            return
+
+        instrumentation = self.instrumentation
+        span = getattr(task, 'span', None)
+        if span is not None:
+            span.begin('extract')
+        start = instrumentation.clock()
         encoding = response.charset if response.charset else 'utf-8'
         links = self.link_extractor.extract_links(response=response, encoding=encoding)
         links = [l.url for l in links]
-        self.crawler.add_to_task_queue(links)
+        instrumentation.observe('extract', start)
+        if span is not None:
+            span.end('extract', links=len(links))
+
+        start = instrumentation.clock()
+        self.crawler.add_to_task_queue(links, parent=task)
+        instrumentation.observe('enqueue', start)
+
+    def is_near_duplicate(self, response):
+        """
+        Return True if the SimHash fingerprint of the response is within config item
+        "near_duplicate_distance" bits of a page that has been seen, otherwise remember
+        the fingerprint and return False, always return False if the detection is disabled.
+        """
+        if self.simhash_index is None:
+            return False
+
+        text = getattr(response, 'text', None)
+        if not isinstance(text, str):
+            return False
+
+        return not self.simhash_index.add_if_new(simhash(tokenize(text)))
 
     def transmit_data(self, task):
         """
@@ -281,11 +559,12 @@ class Engine(ABC):
         you may need to overwrite this function if the pipeline is not default.
 
         :param task: a task return from Crawler.crawl()
+        :return the return value of the Pipeline.transmit(), it is a coroutine if the pipeline is asynchronous
         """
         response = task.response
-        self.pipeline.transmit(task,
-                               dirname='data',
-                               encode=response.charset if response.charset else 'utf-8')
+        return self.pipeline.transmit(task,
+                                      dirname='data',
+                                      encode=response.charset if response.charset else 'utf-8')
 
     @abstractmethod
     def close(self):
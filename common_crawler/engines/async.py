@@ -2,6 +2,8 @@ import asyncio
 from asyncio import ensure_future
 
 from common_crawler.engines import Engine
+from common_crawler.metrics import MetricsServer
+from common_crawler.pipeline import AsyncPipeline
 
 __all__ = ['AsyncEngine']
 
@@ -12,20 +14,73 @@ class AsyncEngine(Engine):
         self.loop = self.__dict__.get('loop', asyncio.get_event_loop())
 
     def work(self):
+        metrics_server = None
+        if self.config['metrics_port'] is not None:
+            metrics_server = MetricsServer(self, host=self.config['metrics_host'], port=self.config['metrics_port'])
+            self.loop.run_until_complete(metrics_server.start())
+            self.logger.info('Serving the metrics on http://%s:%s%s'
+                             % (metrics_server.host, metrics_server.port, metrics_server.path))
+
         workers = [ensure_future(self._handle(), loop=self.loop)
                    for _ in range(self.config['max_tasks'])]
 
+        # the task queue may be drained while the sitemaps are still being read
+        if self.sitemap_discovery is not None:
+            self.loop.run_until_complete(self.sitemap_discovery.run(self.crawler))
         self.loop.run_until_complete(self.crawler.task_queue.join())
         for worker in workers:
             worker.cancel()
 
+        if metrics_server is not None:
+            self.loop.run_until_complete(metrics_server.close())
+
+        if isinstance(self.pipeline, AsyncPipeline):
+            self.loop.run_until_complete(self.pipeline.flush())
+
     async def _handle(self):
         async for t in self.crawler.crawl():
-            self.handle(t)
+            await self.handle_async(t)
+
+    async def handle_async(self, task):
+        """
+        The asynchronous version of the function handle(), it awaits the pipeline if the pipeline is
+        an AsyncPipeline (a slow pipeline pushes back on the crawl) and sleeps without blocking the event loop.
+        """
+        if self.config['follow']:
+            self.add_links(task)
+
+        instrumentation = self.instrumentation
+        span = getattr(task, 'span', None)
+        if span is not None:
+            span.begin('pipeline')
+        start = instrumentation.clock()
+        try:
+            result = self.transmit_data(task)
+            if asyncio.iscoroutine(result):
+                await result
+        finally:
+            instrumentation.observe('transmit', start)
+            if span is not None:
+                span.end('pipeline', pipeline=self.pipeline.__class__.__name__)
+
+        interval = self.config['interval']
+        if interval > 0:
+            start = instrumentation.clock()
+            await asyncio.sleep(interval)
+            instrumentation.observe('sleep', start)
 
     async def close(self):
-        self.pipeline.close()
+        result = self.pipeline.close()
+        if asyncio.iscoroutine(result):
+            await result
         await self.crawler.close()
+        validator_store = getattr(self.crawler, 'validator_store', None)
+        if validator_store is not None:
+            validator_store.close()
+        if self.tracer is not None:
+            self.tracer.close()
+        if self.governor is not None:
+            self.governor.close()
 
     async def __aenter__(self):
         return self
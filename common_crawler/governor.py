@@ -0,0 +1,206 @@
+"""The memory governor slows the crawl down when the RSS of the process approaches a budget"""
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+
+__all__ = ['MemoryGovernor', 'read_rss', 'LEVEL_NORMAL', 'LEVEL_THROTTLE', 'LEVEL_CRITICAL']
+
+LEVEL_NORMAL = 'normal'
+LEVEL_THROTTLE = 'throttle'
+LEVEL_CRITICAL = 'critical'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def read_rss():
+    """Return the resident set size (bytes) of the process, None if it's unknown."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # the peak RSS is the best approximation on the platforms without the procfs
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryGovernor(object):
+    """
+    The class MemoryGovernor samples the RSS of the process (at most once per sample_interval seconds)
+    and applies the backpressure by the level of the usage of the budget:
+
+        - normal: below soft_ratio of the budget, nothing is limited
+        - throttle: the URLs that extracted from the pages are deferred to a spill file instead of
+          the task queue, the seeds are not fed and the number of the concurrent fetches is limited
+          to throttle_concurrency of max_concurrency
+        - critical: above hard_ratio of the budget, as throttle but only one fetch at a time
+
+    The deferred URLs are put back into the task queue when the level is normal again (or the task
+    queue is empty, so the crawl always makes progress), so nothing is lost but the crawl is slowed
+    down instead of being killed by the OOM killer.
+
+    The probes are the functions that return the sizes of the components (e.g. the task queue, the
+    in-flight writes of the pipeline) which are reported with the RSS.
+    """
+
+    def __init__(self,
+                 max_rss,
+                 soft_ratio=0.8,
+                 hard_ratio=0.95,
+                 sample_interval=0.5,
+                 max_concurrency=100,
+                 throttle_concurrency=0.25,
+                 pause=0.05,
+                 probes=None,
+                 rss_fn=read_rss,
+                 clock=time.monotonic):
+        """
+        :param max_rss: the memory budget (bytes) of the RSS
+        :param soft_ratio: the ratio of the budget that the throttling starts
+        :param hard_ratio: the ratio of the budget that only one fetch is allowed at a time
+        :param sample_interval: the minimum seconds between two samples of the RSS
+        :param max_concurrency: the number of the concurrent fetches when not throttled (the max_tasks)
+        :param throttle_concurrency: the ratio of the max_concurrency that allowed when throttled
+        :param pause: the seconds that a worker sleeps before checking the concurrency again
+        :param probes: a dict of the name and a function that returns the size of a component
+        """
+        self.max_rss = max_rss
+        self.soft_limit = int(max_rss * soft_ratio)
+        self.hard_limit = int(max_rss * hard_ratio)
+        self.sample_interval = sample_interval
+        self.max_concurrency = max_concurrency
+        self.throttle_concurrency = max(1, int(max_concurrency * throttle_concurrency))
+        self.pause = pause
+        self.probes = dict(probes or {})
+        self.rss_fn = rss_fn
+        self.clock = clock
+
+        self.rss = None
+        self.peak_rss = 0
+        self.level = LEVEL_NORMAL
+        self.active = 0
+        # the number of the times that the level rose to throttle or critical
+        self.throttle_events = collections.Counter()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.deferred = 0
+        self.deferred_total = 0
+        self.requeued_total = 0
+        self._next_sample = None
+        self._spill = None
+        self._read_offset = 0
+
+    def sample(self, force=False):
+        """Read the RSS if the sample interval passed and update the level, return the level."""
+        now = self.clock()
+        if not force and self._next_sample is not None and now < self._next_sample:
+            return self.level
+        self._next_sample = now + self.sample_interval
+
+        rss = self.rss_fn()
+        if rss is None:
+            return self.level
+        self.rss = rss
+        self.peak_rss = max(self.peak_rss, rss)
+
+        if rss >= self.hard_limit:
+            level = LEVEL_CRITICAL
+        elif rss >= self.soft_limit:
+            level = LEVEL_THROTTLE
+        else:
+            level = LEVEL_NORMAL
+        if level != self.level and level != LEVEL_NORMAL:
+            self.throttle_events[level] += 1
+        self.level = level
+        return level
+
+    @property
+    def throttled(self):
+        return self.sample() != LEVEL_NORMAL
+
+    @property
+    def concurrency_limit(self):
+        if self.level == LEVEL_CRITICAL:
+            return 1
+        if self.level == LEVEL_THROTTLE:
+            return self.throttle_concurrency
+        return self.max_concurrency
+
+    async def acquire(self):
+        """Wait until the number of the active fetches is below the limit of the current level."""
+        if self.active >= self.concurrency_limit:
+            self.waits += 1
+            start = self.clock()
+            while self.active >= self.concurrency_limit:
+                await asyncio.sleep(self.pause)
+                self.sample()
+            self.wait_seconds += self.clock() - start
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+
+    def defer(self, url, depth=0, parent=None):
+        """Append a URL to the spill file, it will be put back by the function take_deferred()."""
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix='common_crawler-deferred-')
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.write(('%s\t%s\t%s\n' % (depth, parent or '', url)).encode('utf-8'))
+        self.deferred += 1
+        self.deferred_total += 1
+
+    def take_deferred(self, n):
+        """Return a list of at most n tuples (url, depth, parent) in the order that they were deferred."""
+        result = []
+        if not self.deferred:
+            return result
+
+        self._spill.seek(self._read_offset)
+        while len(result) < n:
+            line = self._spill.readline()
+            if not line:
+                break
+            depth, parent, url = line.decode('utf-8').rstrip('\n').split('\t', 2)
+            result.append((url, int(depth), parent or None))
+        self._read_offset = self._spill.tell()
+
+        self.deferred -= len(result)
+        self.requeued_total += len(result)
+        # reclaim the space of the spill file when all URLs have been taken
+        if not self.deferred:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._read_offset = 0
+        return result
+
+    def components(self):
+        """Return a dict of the sizes of the components."""
+        sizes = {}
+        for name, probe in self.probes.items():
+            try:
+                sizes[name] = probe()
+            except Exception:
+                sizes[name] = None
+        return sizes
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self.deferred = 0
+
+    def __repr__(self):
+        return 'MemoryGovernor (level: %s, rss: %s, peak rss: %s, budget: %s, throttle events: %s, ' \
+               'deferred: %s, requeued: %s, waits: %s)' \
+               % (self.level, self.rss, self.peak_rss, self.max_rss, dict(self.throttle_events),
+                  self.deferred_total, self.requeued_total, self.waits)
+
+    __str__ = __repr__
@@ -13,12 +13,16 @@ class Response(object):
     __slots__ = [
         'url', 'status', 'charset', 'content_type',
         'content_length', 'reason', 'headers', 'text',
-        'selector'
+        'selector', 'truncated', 'rejected'
     ]
 
     def __init__(self, url, status, charset, content_type,
                  content_length, reason, headers, text,
-                 selector):
+                 selector, truncated=False, rejected=None):
+        """
+        :param truncated: True if the body exceeded the size limit and the text only contains the beginning of it
+        :param rejected: the reason why the body was not downloaded (e.g. content_type, size), None if downloaded
+        """
         self.url = url
         self.status = status
         self.charset = charset
@@ -28,6 +32,8 @@ class Response(object):
         self.headers = headers
         self.text = text
         self.selector = selector
+        self.truncated = truncated
+        self.rejected = rejected
 
     def xpath(self, path, **kwargs):
         if not self.selector or not hasattr(self.selector, 'xpath'):
@@ -1,18 +1,32 @@
 """The implementation of HttpClient by aiohttp"""
 
+import codecs
+import collections
 import json
 
-from aiohttp import ClientSession, ClientRequest, ClientWebSocketResponse, http, ClientResponse
+from aiohttp import ClientSession, ClientRequest, ClientWebSocketResponse, http, ClientResponse, TraceConfig
 from lxml import etree
 
+from common_crawler.configuration import CONFIGURATION
 from common_crawler.http import Response
 from common_crawler.http.client import HttpClient
-from common_crawler.utils.misc import dynamic_import, DynamicImportReturnType
+from common_crawler.instrument import NULL_INSTRUMENTATION
+from common_crawler.utils.misc import dynamic_import, DynamicImportReturnType, arg_to_iter
+from common_crawler.utils.url import is_redirect
 
 __all__ = ['AioHttpClient']
 
 sentinel = dynamic_import('aiohttp.helpers.sentinel', DynamicImportReturnType.VARIABLE)
 
+DEFAULT_ALLOWED_CONTENT_TYPES = CONFIGURATION.get('allowed_content_types', ('text/html', 'application/xhtml+xml'))
+DEFAULT_MAX_BODY_SIZE = CONFIGURATION.get('max_body_size', 10 * 1024 * 1024)
+DEFAULT_TRUNCATE_BODY = CONFIGURATION.get('truncate_body', True)
+
+_CHUNK_SIZE = 64 * 1024
+
+REJECTED_CONTENT_TYPE = 'content_type'
+REJECTED_SIZE = 'size'
+
 
 class AioHttpClient(HttpClient):
     def __init__(self, *, connector=None,
@@ -26,13 +40,31 @@ class AioHttpClient(HttpClient):
                  cookie_jar=None, connector_owner=True,
                  raise_for_status=False,
                  read_timeout=sentinel, conn_timeout=None,
-                 auto_decompress=True, trust_env=False, **kwargs):
+                 auto_decompress=True, trust_env=False,
+                 allowed_content_types=DEFAULT_ALLOWED_CONTENT_TYPES,
+                 max_body_size=DEFAULT_MAX_BODY_SIZE,
+                 truncate_body=DEFAULT_TRUNCATE_BODY,
+                 instrumentation=None, **kwargs):
         """
         The class packaging a class ClientSession to perform HTTP request and manager that these HTTP connection.
 
         For details of the params: http://aiohttp.readthedocs.io/en/stable/client_advanced.html#client-session
+
+        The params allowed_content_types, max_body_size and truncate_body see the common_crawler.configuration,
+        they are checked in the function get_response() before the body is downloaded, the counters of the
+        rejected responses and the bytes saved are in the self.stats.
+
+        The param instrumentation is an object common_crawler.instrument.Instrumentation, if it is enabled
+        the DNS resolution and the connection are timed by the tracing of aiohttp and the body read is timed
+        in the function get_response().
         """
         super(AioHttpClient, self).__init__(**kwargs)
+        self.allowed_content_types = {t.lower() for t in arg_to_iter(allowed_content_types)}
+        self.max_body_size = max_body_size
+        self.truncate_body = truncate_body
+        self.stats = collections.Counter()
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        trace_configs = [self._init_trace_config()] if self.instrumentation.enabled else None
         self.client = ClientSession(connector=connector,
                                     loop=loop,
                                     cookies=cookies,
@@ -50,7 +82,35 @@ class AioHttpClient(HttpClient):
                                     read_timeout=read_timeout,
                                     conn_timeout=conn_timeout,
                                     auto_decompress=auto_decompress,
-                                    trust_env=trust_env)
+                                    trust_env=trust_env,
+                                    trace_configs=trace_configs)
+
+    def _init_trace_config(self):
+        """Return a TraceConfig that records the durations of the DNS resolution and the connection."""
+        instrumentation = self.instrumentation
+        trace_config = TraceConfig()
+
+        async def on_dns_start(session, context, params):
+            context.dns_start = instrumentation.clock()
+
+        async def on_dns_end(session, context, params):
+            instrumentation.observe('dns', context.dns_start)
+
+        async def on_connection_start(session, context, params):
+            context.connection_start = instrumentation.clock()
+
+        async def on_connection_end(session, context, params):
+            instrumentation.observe('connect', context.connection_start)
+
+        async def on_connection_reused(session, context, params):
+            instrumentation.incr('connections_reused')
+
+        trace_config.on_dns_resolvehost_start.append(on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_end)
+        trace_config.on_connection_create_start.append(on_connection_start)
+        trace_config.on_connection_create_end.append(on_connection_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reused)
+        return trace_config
 
     def request(self, method, url, *args, **kwargs):
         return self.client.request(method=method, url=url, **kwargs)
@@ -80,8 +140,38 @@ class AioHttpClient(HttpClient):
         await self.client.close()
 
     async def get_response(self, response):
-        text = await response.text()
-        return Response(url=response.url,
+        """
+        The Content-Type and the Content-Length are checked before the body is downloaded,
+        the connection is aborted if the content type isn't allowed or the declared length
+        exceeds max_body_size. Otherwise the body is streamed and aborted (or truncated, see
+        truncate_body) as soon as it goes over max_body_size, the limit is on the decoded bytes
+        since a compressed body (Content-Encoding) can be much larger than its Content-Length.
+        """
+        start = self.instrumentation.clock()
+        text, truncated, rejected = None, False, self._reject_reason(response)
+
+        if rejected is not None:
+            self.stats['rejected_%s' % rejected] += 1
+            self.stats['bytes_saved'] += response.content_length or 0
+            response.close()
+        elif not self._limited():
+            text = await response.text()
+            self.stats['bytes_downloaded'] += response.content_length or len(text)
+        else:
+            body, truncated = await self._read_limited(response)
+            if truncated and not self.truncate_body:
+                rejected = REJECTED_SIZE
+                self.stats['rejected_%s' % rejected] += 1
+            else:
+                text = body.decode(self._get_encoding(response, body), errors='replace')
+        self.instrumentation.observe('body', start)
+
+        start = self.instrumentation.clock()
+        selector = etree.HTML(text) if text else None
+        self.instrumentation.observe('html_parse', start)
+
+        # the URL of aiohttp is an object yarl.URL and it can't be joined with the relative links
+        return Response(url=str(response.url),
                         status=response.status,
                         charset=response.charset,
                         content_type=response.content_type,
@@ -89,7 +179,69 @@ class AioHttpClient(HttpClient):
                         reason=response.reason,
                         headers=response.headers,
                         text=text,
-                        selector=etree.HTML(text))
+                        selector=selector,
+                        truncated=truncated,
+                        rejected=rejected)
+
+    @staticmethod
+    def _get_encoding(response, body):
+        """
+        Return the encoding of a streamed body, an unknown declared charset is ignored and the body
+        without a charset is detected as the function response.text() of aiohttp does, utf-8 by default.
+        """
+        encoding = response.charset
+        if encoding:
+            try:
+                return codecs.lookup(encoding).name
+            except LookupError:
+                pass
+
+        # the fallback of the session (aiohttp >= 3.8.6), it's called by the function get_encoding()
+        resolve_charset = getattr(response, '_resolve_charset', None)
+        if callable(resolve_charset):
+            try:
+                return codecs.lookup(resolve_charset(response, body)).name
+            except (LookupError, TypeError, ValueError):
+                pass
+        return 'utf-8'
+
+    def _limited(self):
+        return self.max_body_size is not None and self.max_body_size >= 0
+
+    def _reject_reason(self, response):
+        """Return the reason if the body should not be downloaded according to the headers, otherwise None."""
+        if is_redirect(response.status):
+            return None
+
+        headers = response.headers or {}
+        if self.allowed_content_types and 'Content-Type' in headers \
+                and (response.content_type or '').lower() not in self.allowed_content_types:
+            return REJECTED_CONTENT_TYPE
+
+        if self._limited() and response.content_length is not None \
+                and response.content_length > self.max_body_size:
+            return REJECTED_SIZE
+
+        return None
+
+    async def _read_limited(self, response):
+        """Return a tuple (body, truncated) that the body is at most max_body_size bytes."""
+        chunks, size = [], 0
+        while size <= self.max_body_size:
+            chunk = await response.content.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        self.stats['bytes_downloaded'] += size
+
+        if size <= self.max_body_size:
+            return b''.join(chunks), False
+
+        # the rest of the body will never be read
+        self.stats['truncated'] += 1
+        response.close()
+        return b''.join(chunks)[:self.max_body_size], True
 
     async def __aenter__(self):
         return self
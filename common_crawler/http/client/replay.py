@@ -0,0 +1,267 @@
+"""Record the responses to a local archive and replay them without the network"""
+
+import asyncio
+import json
+import mmap
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+from lxml import etree
+from multidict import CIMultiDict
+
+from common_crawler.http import Response
+from common_crawler.http.client import HttpClient
+from common_crawler.http.client.aiohttp import AioHttpClient
+from common_crawler.pipeline.segment import _HEADER_STRUCT, _encode_record, _headers_to_list, \
+    RECORD_FORMAT_LENGTH_PREFIXED
+
+__all__ = ['RecordingHttpClient', 'ReplayHttpClient']
+
+_INDEX_SUFFIX = '.idx'
+
+# the body of a record is always stored as UTF-8 whatever the charset of the response
+_BODY_ENCODING = 'utf-8'
+
+
+def _key(url):
+    """Return the key of a URL in the archive, the empty path is the same as "/"."""
+    parts = urlsplit(str(url).strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+
+class RecordingHttpClient(AioHttpClient):
+    """
+    The class RecordingHttpClient is an AioHttpClient that appends each response (the result of
+    get_response()) to an archive, the archive is a length-prefixed segment file (see the function
+    common_crawler.pipeline.segment.iter_records()) and each line of the index file {archive}.idx
+    is "offset length URL" that locates the record of the URL.
+
+    notice, this class must manually call close() for flushing the archive!!!
+    """
+
+    def __init__(self, *, archive='data/replay.dat', buffer_size=1 << 20, **kwargs):
+        """
+        :param archive: the filename of the archive, the records are appended if it exists
+        :param buffer_size: the size (bytes) of the write buffer of the archive
+        """
+        super(__class__, self).__init__(**kwargs)
+        dirname = os.path.dirname(archive)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self.archive = archive
+        self.recorded = 0
+        self._file = open(archive, 'ab', buffering=buffer_size)
+        self._index = open(archive + _INDEX_SUFFIX, 'a', encoding='utf-8')
+        self._offset = self._file.tell()
+
+    async def get_response(self, response):
+        result = await super(__class__, self).get_response(response)
+        self.record(result, url=response.url)
+        return result
+
+    def record(self, response, url=None):
+        """
+        Append an object common_crawler.http.Response to the archive.
+
+        :param url: the requested URL, default is the URL of the response
+        """
+        url = str(url or response.url)
+        metadata = {'url': url,
+                    'status': response.status,
+                    'reason': response.reason,
+                    'charset': response.charset,
+                    'content_type': response.content_type,
+                    'content_length': response.content_length,
+                    'headers': _headers_to_list(response.headers),
+                    'truncated': response.truncated,
+                    'rejected': response.rejected,
+                    'has_body': response.text is not None}
+        body = (response.text or '').encode(_BODY_ENCODING, errors='replace')
+
+        data = _encode_record(metadata, body, RECORD_FORMAT_LENGTH_PREFIXED)
+        self._file.write(data)
+        self._index.write('%s\t%s\t%s\n' % (self._offset, len(data), url))
+        self._offset += len(data)
+        self.recorded += 1
+
+    async def close(self):
+        await super(__class__, self).close()
+        for f in (self._file, self._index):
+            if not f.closed:
+                f.close()
+
+
+class ReplayResponse(object):
+    """
+    A recorded response, it has the same attributes as the aiohttp.ClientResponse that the crawler
+    uses and it is an asynchronous context manager, entering it waits for the simulated latency.
+    """
+
+    def __init__(self, url, status, reason, headers, charset, content_type, content_length,
+                 body, metadata=None, latency=0):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.charset = charset
+        self.content_type = content_type
+        self.content_length = content_length
+        self.body = body
+        self.metadata = metadata or {}
+        self.latency = latency
+
+    async def read(self):
+        return self.body
+
+    async def text(self, encoding=None, errors='strict'):
+        return self.body.decode(encoding or _BODY_ENCODING, errors='replace')
+
+    def close(self):
+        pass
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class ReplayHttpClient(HttpClient):
+    """
+    The class ReplayHttpClient serves the GET requests from an archive that written by the
+    RecordingHttpClient, the archive is memory-mapped and the index is loaded into a dict,
+    so that a lookup is a dict access and a slice of the mapping without any read() call.
+
+    A URL that was not recorded responds 404, the latency (seconds) simulates the network
+    for each request, so a crawl on the same archive gets the same result on every run.
+    """
+
+    def __init__(self, archive='data/replay.dat', latency=0, **kwargs):
+        """
+        :param archive: the filename of the archive that written by the RecordingHttpClient
+        :param latency: the simulated latency (seconds) of each request, 0 represent no latency
+        """
+        super(__class__, self).__init__(**kwargs)
+        self.archive = archive
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+
+        self._file = open(archive, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.index = self._load_index(archive + _INDEX_SUFFIX)
+
+    def _load_index(self, filename):
+        """Return a dict {key: (offset, length)}, the latest record of a URL wins."""
+        index = {}
+        if os.path.exists(filename):
+            with open(filename, encoding='utf-8') as f:
+                for line in f:
+                    offset, length, url = line.rstrip('\n').split('\t', 2)
+                    index[_key(url)] = (int(offset), int(length))
+            return index
+
+        # rebuild the index by scanning the archive
+        offset = 0
+        while self._mmap is not None and offset + _HEADER_STRUCT.size <= len(self._mmap):
+            meta_length, body_length = _HEADER_STRUCT.unpack_from(self._mmap, offset)
+            length = _HEADER_STRUCT.size + meta_length + body_length
+            start = offset + _HEADER_STRUCT.size
+            metadata = json.loads(self._mmap[start:start + meta_length].decode('utf-8'))
+            index[_key(metadata['url'])] = (offset, length)
+            offset += length
+        return index
+
+    def lookup(self, url):
+        """Return a tuple (metadata, body) of the recorded response of the URL or None."""
+        location = self.index.get(_key(url))
+        if location is None:
+            return None
+
+        offset, _ = location
+        meta_length, body_length = _HEADER_STRUCT.unpack_from(self._mmap, offset)
+        start = offset + _HEADER_STRUCT.size
+        metadata = json.loads(self._mmap[start:start + meta_length].decode('utf-8'))
+        start += meta_length
+        return metadata, self._mmap[start:start + body_length]
+
+    def request(self, method, url, *args, **kwargs):
+        if method.upper() != 'GET':
+            raise ValueError('The ReplayHttpClient only replays the GET requests, got %s' % method)
+
+        record = self.lookup(url)
+        if record is None:
+            self.misses += 1
+            return ReplayResponse(url=url, status=404, reason='Not Recorded', headers=CIMultiDict(),
+                                  charset=None, content_type=None, content_length=0, body=b'',
+                                  latency=self.latency)
+
+        self.hits += 1
+        metadata, body = record
+        return ReplayResponse(url=metadata['url'],
+                              status=metadata['status'],
+                              reason=metadata['reason'],
+                              headers=CIMultiDict(metadata['headers']),
+                              charset=metadata['charset'],
+                              content_type=metadata['content_type'],
+                              content_length=metadata['content_length'],
+                              body=body,
+                              metadata=metadata,
+                              latency=self.latency)
+
+    def get(self, url, *args, **kwargs):
+        return self.request('GET', url, *args, **kwargs)
+
+    def post(self, url, *args, data=None, **kwargs):
+        return self.request('POST', url, *args, **kwargs)
+
+    def put(self, url, *args, data=None, **kwargs):
+        return self.request('PUT', url, *args, **kwargs)
+
+    def delete(self, url, *args, **kwargs):
+        return self.request('DELETE', url, *args, **kwargs)
+
+    def options(self, url, *args, **kwargs):
+        return self.request('OPTIONS', url, *args, **kwargs)
+
+    def head(self, url, *args, **kwargs):
+        return self.request('HEAD', url, *args, **kwargs)
+
+    def patch(self, url, *args, data=None, **kwargs):
+        return self.request('PATCH', url, *args, **kwargs)
+
+    async def get_response(self, response):
+        """Return the recorded response as it was returned by the RecordingHttpClient."""
+        metadata = response.metadata
+        text = await response.text() if metadata.get('has_body', True) else None
+        return Response(url=response.url,
+                        status=response.status,
+                        charset=response.charset,
+                        content_type=response.content_type,
+                        content_length=response.content_length,
+                        reason=response.reason,
+                        headers=response.headers,
+                        text=text,
+                        selector=etree.HTML(text) if text else None,
+                        truncated=metadata.get('truncated', False),
+                        rejected=metadata.get('rejected'))
+
+    async def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if not self._file.closed:
+            self._file.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,183 @@
+"""The timers and the counters of the hot path, they cost nearly nothing when disabled"""
+import collections
+import json
+import math
+import time
+
+__all__ = ['Histogram', 'Instrumentation', 'NullInstrumentation', 'NULL_INSTRUMENTATION']
+
+# 2 ** _SUB_BUCKET_BITS sub-buckets for each power of two, the relative error is less than 1 / 32
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+
+def _bucket_index(value):
+    if value < _SUB_BUCKETS:
+        return value
+    exponent = value.bit_length() - _SUB_BUCKET_BITS - 1
+    return _SUB_BUCKETS * (exponent + 1) + (value >> exponent) - _SUB_BUCKETS
+
+
+def _bucket_range(index):
+    """Return a tuple (lowest, highest) of the values of the bucket."""
+    if index < _SUB_BUCKETS:
+        return index, index
+    exponent, sub_bucket = divmod(index - _SUB_BUCKETS, _SUB_BUCKETS)
+    lowest = (sub_bucket + _SUB_BUCKETS) << exponent
+    return lowest, lowest + (1 << exponent) - 1
+
+
+class Histogram(object):
+    """
+    The class Histogram records the non-negative integers (e.g. microseconds) into the log-linear
+    buckets as the HdrHistogram does: each power of two is divided into 32 linear sub-buckets, so the
+    memory is a few hundred counters for any range and a recording is an index computation plus an
+    increment of a list item, no lock or allocation is needed in the single-threaded event loop.
+    """
+
+    __slots__ = ['counts', 'count', 'total', 'min', 'max']
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = int(value) if value > 0 else 0
+        index = _bucket_index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Return the value at the percentile p (0 - 100), the highest value of its bucket."""
+        if not self.count:
+            return 0
+        rank = max(1, int(math.ceil(p / 100.0 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_range(index)[1], self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def to_dict(self, scale=1.0):
+        """Return the summary of the histogram, each value is multiplied by the scale."""
+        return {'count': self.count,
+                'min': (self.min or 0) * scale,
+                'mean': self.mean * scale,
+                'p50': self.percentile(50) * scale,
+                'p90': self.percentile(90) * scale,
+                'p99': self.percentile(99) * scale,
+                'p999': self.percentile(99.9) * scale,
+                'max': (self.max or 0) * scale}
+
+    def __repr__(self):
+        return 'Histogram (count: %s, p50: %s, p99: %s, max: %s)' \
+               % (self.count, self.percentile(50), self.percentile(99), self.max)
+
+    __str__ = __repr__
+
+
+class Instrumentation(object):
+    """
+    The class Instrumentation collects the durations of the stages and the counters, a stage
+    is timed by a pair of calls without any object allocated:
+
+        start = instrumentation.clock()
+        ...
+        instrumentation.observe('parse', start)
+
+    the durations are recorded as microseconds into a Histogram of each stage.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(Histogram)
+        self.clock = time.perf_counter
+
+    def observe(self, name, start):
+        """Record the duration since the start (the result of clock()) to the stage."""
+        self.histograms[name].record((self.clock() - start) * 1e6)
+
+    def record(self, name, seconds):
+        """Record the duration (seconds) to the stage."""
+        self.histograms[name].record(seconds * 1e6)
+
+    def incr(self, name, value=1):
+        self.counters[name] += value
+
+    def to_dict(self):
+        """Return the counters and the summaries of the stages (milliseconds)."""
+        return {'counters': dict(self.counters),
+                'stages': {name: h.to_dict(scale=1e-3) for name, h in sorted(self.histograms.items())}}
+
+    def dump(self, filename):
+        """Write the result of to_dict() to a JSON file."""
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def report(self):
+        """Return a list of the lines (one for each stage and counter) for the log."""
+        lines = []
+        for name, h in sorted(self.histograms.items()):
+            summary = h.to_dict(scale=1e-3)
+            lines.append('%-16s count %-8s mean %.3fms p50 %.3fms p90 %.3fms p99 %.3fms max %.3fms'
+                         % (name, summary['count'], summary['mean'], summary['p50'],
+                            summary['p90'], summary['p99'], summary['max']))
+        for name, value in sorted(self.counters.items()):
+            lines.append('%-16s %s' % (name, value))
+        return lines
+
+
+def _nothing(*args, **kwargs):
+    return None
+
+
+class NullInstrumentation(Instrumentation):
+    """
+    The disabled instrumentation, the clock() returns 0 and the others do nothing, so a timed stage
+    costs two calls of the no-op functions, a caller can check the attribute enabled for skipping
+    the work that only prepares the arguments.
+    """
+
+    enabled = False
+
+    def __init__(self):
+        super(__class__, self).__init__()
+        self.clock = int
+        self.observe = _nothing
+        self.record = _nothing
+        self.incr = _nothing
+
+
+# the shared disabled instrumentation
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -43,25 +43,30 @@ class LxmlLinkExtractor(LinkExtractor):
         links = []
 
         for el, attr, attr_val in self._iter_links(selector):
-            try:
-                if self.strip:
-                    attr_val = attr_val.strip(HTML5_WHITESPACE)
-                attr_val = join_url(url=attr_val, base_url=base_url)
-            except ValueError:
-                continue
-            else:
-                url = self.process_attr(attr_val)
-                if url is None:
-                    continue
-
-            url = url.decode(encoding) if isinstance(url, bytes) else url
-            # fix relative link after process_attr
-            url = join_url(url=url, base_url=base_url)
-            link = Link(url=url, text=_LXML_STRING_CONTENT(el) or u'')
-            links.append(link)
+            link = self._to_link(el, attr_val, base_url, encoding)
+            if link is not None:
+                links.append(link)
 
         return links
 
+    def _to_link(self, element, attr_val, base_url, encoding):
+        """Return an object Link of the attribute value of the element or None if it is discarded."""
+        try:
+            if self.strip:
+                attr_val = attr_val.strip(HTML5_WHITESPACE)
+            attr_val = join_url(url=attr_val, base_url=base_url)
+        except ValueError:
+            return None
+        else:
+            url = self.process_attr(attr_val)
+            if url is None:
+                return None
+
+        url = url.decode(encoding) if isinstance(url, bytes) else url
+        # fix relative link after process_attr
+        url = join_url(url=url, base_url=base_url)
+        return Link(url=url, text=_LXML_STRING_CONTENT(element) or u'')
+
     def _iter_links(self, document):
         """Iterate elements of the document by lxml.etree"""
         for element in document.iter(etree.Element):
@@ -0,0 +1,410 @@
+"""The sitemaps, the sitemap indexes and the RSS/Atom feeds are stream-parsed into the URLs of the crawl"""
+import asyncio
+import collections
+import datetime
+import email.utils
+import logging
+import re
+import zlib
+
+from lxml import etree
+
+from common_crawler.link import Link
+from common_crawler.link_extractor.lxml import LxmlLinkExtractor
+from common_crawler.robots import RobotsCache
+from common_crawler.utils.url import join_url, parse_url, revise_urls
+
+__all__ = ['SitemapLink', 'SitemapParser', 'SitemapLinkExtractor', 'SitemapDiscovery',
+           'iter_sitemap', 'parse_lastmod', 'MAX_SITEMAP_SIZE']
+
+# the limit of the sitemap protocol, it also bounds the decompressed size of a gzip bomb
+MAX_SITEMAP_SIZE = 50 * 1024 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+# <url> of a sitemap, <sitemap> of a sitemap index, <item> of RSS and <entry> of Atom
+_ENTRY_TAGS = {'url', 'sitemap', 'item', 'entry'}
+
+_LASTMOD_TAGS = {'lastmod', 'pubDate', 'date', 'updated', 'published'}
+
+_SITEMAP_ROOT_REGEX = re.compile(r'<(?:\w+:)?(?:urlset|sitemapindex|rss|feed|RDF)[\s>]')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else None
+
+
+def parse_lastmod(value):
+    """
+    Return the seconds since the epoch of a W3C datetime (the sitemaps and Atom) or
+    a RFC 822 date (RSS), return None if the value is invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        if value[:4].isdigit():
+            # the W3C datetime allows the year and the month only
+            if len(value) == 4:
+                value += '-01-01'
+            elif len(value) == 7:
+                value += '-01'
+            dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        else:
+            dt = email.utils.parsedate_to_datetime(value)
+    except (ValueError, TypeError, IndexError):
+        return None
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+class SitemapLink(Link):
+    """
+    The object represent a URL of a sitemap or a feed, the lastmod is the seconds since the epoch
+    (None if unknown) and the sitemap is True if the URL is a sitemap of a sitemap index.
+    """
+
+    __slots__ = ['lastmod', 'sitemap']
+
+    def __init__(self, url, lastmod=None, sitemap=False, text=''):
+        super(SitemapLink, self).__init__(url, text)
+        self.lastmod = lastmod
+        self.sitemap = sitemap
+
+    def __repr__(self):
+        return 'SitemapLink(url=%s, lastmod=%s, sitemap=%s)' % (self.url, self.lastmod, self.sitemap)
+
+    __str__ = __repr__
+
+
+class SitemapParser(object):
+    """
+    The class SitemapParser is an incremental parser of the sitemaps, the sitemap indexes and the RSS/Atom
+    feeds, the body is fed chunk by chunk (a gzip body is detected by its magic number and decompressed
+    chunk by chunk) and each entry is cleared from the tree as soon as its URL is taken, so the memory is
+    constant no matter how large the sitemap is:
+
+        parser = SitemapParser(base_url=url)
+        for chunk in chunks:
+            links.extend(parser.feed(chunk))
+        links.extend(parser.close())
+
+    The body over max_size bytes (after decompressed) is ignored and the truncated is set to True.
+    """
+
+    def __init__(self, base_url=None, encoding=None, max_size=MAX_SITEMAP_SIZE):
+        """
+        :param base_url: the URL of the sitemap for joining the relative URLs
+        :param encoding: override the encoding of the document, None represent the declared encoding
+        :param max_size: the maximum number of the bytes that parsed, None represent unlimited
+        """
+        self.base_url = base_url
+        self.max_size = max_size
+        self.size = 0
+        self.count = 0
+        self.truncated = False
+        self._head = b''
+        self._decompressor = None
+        self._parser = etree.XMLPullParser(events=('end',), encoding=encoding, recover=True,
+                                           resolve_entities=False, no_network=True, huge_tree=True)
+
+    def feed(self, data):
+        """Parse a chunk of the body and return a list of the SitemapLinks that completed by the chunk."""
+        if self.truncated or not data:
+            return []
+
+        # the first two bytes decide whether the body is a gzip file
+        if self._head is not None:
+            data = self._head + data
+            if len(data) < 2:
+                self._head = data
+                return []
+            self._head = None
+            if data[:2] == _GZIP_MAGIC:
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        links = []
+        if self._decompressor is None:
+            self._feed_xml(data, links)
+            return links
+
+        # a small chunk of a gzip bomb never expands to more than a chunk at a time
+        while data and not self.truncated:
+            try:
+                self._feed_xml(self._decompressor.decompress(data, _CHUNK_SIZE), links)
+            except zlib.error:
+                self.truncated = True
+                break
+            data = self._decompressor.unconsumed_tail
+        return links
+
+    def close(self):
+        """Finish the parsing and return a list of the rest of the SitemapLinks."""
+        links = []
+        if self._head:
+            self._feed_xml(self._head, links)
+        elif self._decompressor is not None and not self.truncated:
+            try:
+                self._feed_xml(self._decompressor.flush(), links)
+            except zlib.error:
+                pass
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        self._read_events(links)
+        return links
+
+    def _feed_xml(self, data, links):
+        if not data:
+            return
+        if self.max_size is not None and self.size + len(data) > self.max_size:
+            data = data[:self.max_size - self.size]
+            self.truncated = True
+        self.size += len(data)
+        try:
+            self._parser.feed(data)
+        except etree.XMLSyntaxError:
+            self.truncated = True
+        self._read_events(links)
+
+    def _read_events(self, links):
+        for _, element in self._parser.read_events():
+            name = _local_name(element.tag)
+            if name not in _ENTRY_TAGS:
+                continue
+
+            link = self._to_link(element, name)
+            if link is not None:
+                links.append(link)
+                self.count += 1
+
+            # the entry and its processed siblings are released
+            element.clear(keep_tail=False)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def _to_link(self, element, name):
+        url, lastmod = None, None
+        for child in element:
+            child_name = _local_name(child.tag)
+            if child_name in ('loc', 'link'):
+                if url is not None:
+                    continue
+                # <link href="..." rel="alternate"/> of Atom, <link>...</link> of RSS
+                href = child.get('href')
+                if href is not None:
+                    if child.get('rel', 'alternate') == 'alternate':
+                        url = href
+                elif child.text:
+                    url = child.text
+            elif child_name in _LASTMOD_TAGS and lastmod is None:
+                lastmod = parse_lastmod(child.text)
+
+        # <item rdf:about="..."> of RSS 1.0
+        if url is None and name == 'item':
+            url = element.get('{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about')
+        if not url or not url.strip():
+            return None
+
+        url = url.strip()
+        if self.base_url:
+            url = join_url(url, base_url=self.base_url)
+        return SitemapLink(url=url, lastmod=lastmod, sitemap=name == 'sitemap')
+
+
+def iter_sitemap(source, base_url=None, chunk_size=_CHUNK_SIZE, max_size=MAX_SITEMAP_SIZE):
+    """
+    Iterate the SitemapLinks of a sitemap (or a sitemap index, a feed) in constant memory.
+
+    :param source: a filename or a binary file object, a gzip file is detected by its magic number
+    """
+    file = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        parser = SitemapParser(base_url=base_url, max_size=max_size)
+        while not parser.truncated:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield from parser.feed(chunk)
+        yield from parser.close()
+    finally:
+        if file is not source:
+            file.close()
+
+
+def _newest_first(links):
+    """Sort the links by the lastmod (the newest first), the links without the lastmod keep their order at the end."""
+    links.sort(key=lambda link: -link.lastmod if link.lastmod is not None else float('inf'))
+    return links
+
+
+class SitemapLinkExtractor(LxmlLinkExtractor):
+    """
+    The class SitemapLinkExtractor extracts the URLs of a response that is a sitemap, a sitemap index
+    or a RSS/Atom feed (detected by the root element), the newest lastmod first so that they are
+    enqueued in that order, the other responses are extracted by the LxmlLinkExtractor.
+
+    The sitemaps are only fetched by the crawler if their content types (e.g. application/xml, text/xml)
+    are in the config item allowed_content_types, the SitemapDiscovery streams them without the limit.
+    """
+
+    def __init__(self, **kwargs):
+        """The parameter specification see the superclass LinkExtractor."""
+        super(SitemapLinkExtractor, self).__init__(**kwargs)
+
+    def _process(self, response, encoding='utf-8'):
+        text = self._get_response_text(response)
+        if not text or not _SITEMAP_ROOT_REGEX.search(text[:2048]):
+            return super(SitemapLinkExtractor, self)._process(response, encoding)
+
+        # the text has been decoded, the declared encoding of the document is overridden
+        parser = SitemapParser(base_url=response.url, encoding=encoding, max_size=None)
+        links = parser.feed(text.encode(encoding, errors='replace'))
+        links.extend(parser.close())
+        return _newest_first(links)
+
+
+class SitemapDiscovery(object):
+    """
+    The class SitemapDiscovery streams the sitemaps into the task queue of an AsyncCrawler, the sitemaps
+    are the configured sitemap_urls and the Sitemap lines of the robots.txt of the hosts, the sitemap
+    indexes are followed (at most max_sitemaps sitemaps), the RSS/Atom feeds are read as the sitemaps.
+
+    Each sitemap is read chunk by chunk into a SitemapParser and the URLs are enqueued in batches (the
+    seeds_batch_size of the crawler) only when the task queue is below the seeds_low_water of the crawler,
+    so the memory is constant and a sitemap is read no faster than the URLs are crawled.
+
+    The lastmod is the priority hint: the URLs of a batch are enqueued newest first, and a URL that has
+    not been modified since its last fetch (see the validator_store of the crawler) is skipped.
+    """
+
+    def __init__(self, sitemap_urls=(), hosts=(), max_sitemaps=1000, max_size=MAX_SITEMAP_SIZE,
+                 pause=0.05, logger=None):
+        """
+        :param sitemap_urls: the URLs of the sitemaps, the sitemap indexes or the feeds
+        :param hosts: the URLs that the sitemaps of their robots.txt are discovered (the roots)
+        :param max_sitemaps: the maximum number of the sitemaps that read
+        :param max_size: the maximum number of the bytes that parsed of a sitemap (after decompressed)
+        :param pause: the seconds that sleeps before checking the size of the task queue again
+        """
+        self.sitemap_urls = list(sitemap_urls)
+        self.hosts = hosts
+        self.max_sitemaps = max_sitemaps
+        self.max_size = max_size
+        self.pause = pause
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.sitemaps = 0
+        self.errors = 0
+        self.urls = 0
+        self.unchanged = 0
+        self._queued = set()
+
+    async def run(self, crawler):
+        """Read all the sitemaps into the task queue of the crawler."""
+        pending = collections.deque()
+        for url in self.sitemap_urls:
+            self._push(pending, url)
+
+        if self.hosts:
+            robots = getattr(crawler, 'robots', None) or RobotsCache(crawler.http_client)
+            for host in self._iter_hosts():
+                rules = await robots.fetch(host)
+                for url in rules.sitemaps:
+                    self._push(pending, url)
+
+        while pending and not self._exhausted(crawler):
+            await self._read(crawler, pending.popleft(), pending)
+
+        self.logger.info('Discovered %s urls from %s sitemaps', self.urls, self.sitemaps)
+
+    def _iter_hosts(self):
+        seen = set()
+        for url in revise_urls(self.hosts, strict=False):
+            parts = parse_url(url)
+            host = '%s://%s' % (parts.scheme, parts.netloc.lower())
+            if host not in seen:
+                seen.add(host)
+                yield host
+
+    def _push(self, pending, url):
+        if url in self._queued or len(self._queued) >= self.max_sitemaps:
+            return
+        self._queued.add(url)
+        pending.append(url)
+
+    async def _read(self, crawler, url, pending):
+        self.sitemaps += 1
+        parser = SitemapParser(base_url=url, max_size=self.max_size)
+        batch = []
+        try:
+            async with crawler.http_client.get(url) as response:
+                if response.status != 200:
+                    self.errors += 1
+                    self.logger.warning('The sitemap %s responded %s', url, response.status)
+                    return
+                while not parser.truncated and not self._exhausted(crawler):
+                    chunk = await response.content.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await self._add(crawler, parser.feed(chunk), batch, pending)
+            await self._add(crawler, parser.close(), batch, pending)
+            await self._flush(crawler, batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            self.logger.warning('Read the sitemap %s has failed, raised: %s', url, e)
+            return
+
+        if parser.truncated:
+            self.logger.warning('The sitemap %s is truncated after %s bytes', url, parser.size)
+        self.logger.debug('Read %s entries from the sitemap %s', parser.count, url)
+
+    async def _add(self, crawler, links, batch, pending):
+        validator_store = getattr(crawler, 'validator_store', None)
+        for link in links:
+            if link.sitemap:
+                self._push(pending, link.url)
+                continue
+            if validator_store is not None and link.lastmod is not None:
+                validators = validator_store.get(link.url)
+                if validators is not None and validators['fetched_at'] >= link.lastmod:
+                    self.unchanged += 1
+                    continue
+            batch.append(link)
+            if len(batch) >= crawler.seeds_batch_size:
+                await self._flush(crawler, batch)
+
+    async def _flush(self, crawler, batch):
+        if not batch:
+            return
+        # the sitemap is read no faster than the task queue is consumed
+        task_queue = crawler.task_queue
+        governor = getattr(crawler, 'governor', None)
+        while task_queue.qsize() >= crawler.seeds_low_water \
+                or (governor is not None and task_queue.qsize() and governor.throttled):
+            await asyncio.sleep(self.pause)
+
+        if not self._exhausted(crawler):
+            crawler.add_to_task_queue([link.url for link in _newest_first(batch)])
+            self.urls += len(batch)
+        batch.clear()
+
+    def _exhausted(self, crawler):
+        budget = getattr(crawler, 'budget', None)
+        return budget is not None and budget.exhausted
+
+    def __repr__(self):
+        return 'SitemapDiscovery (sitemaps: %s, errors: %s, urls: %s, unchanged: %s)' \
+               % (self.sitemaps, self.errors, self.urls, self.unchanged)
+
+    __str__ = __repr__
@@ -0,0 +1,260 @@
+"""The live metrics of the crawl that served in the Prometheus text exposition format"""
+import asyncio
+import collections
+import time
+
+from common_crawler.governor import LEVEL_NORMAL, LEVEL_THROTTLE, LEVEL_CRITICAL
+
+__all__ = ['CrawlMetrics', 'MetricsServer', 'render_metrics']
+
+_PREFIX = 'common_crawler_'
+
+# the quantiles of the stages of the instrumentation
+_QUANTILES = (0.5, 0.9, 0.99)
+
+# the levels of the memory governor as the numbers
+_LEVELS = {LEVEL_NORMAL: 0, LEVEL_THROTTLE: 1, LEVEL_CRITICAL: 2}
+
+
+def _host(url):
+    # scheme://host/path -> host, cheaper than parsing the whole URL
+    parts = url.split('/', 3)
+    return parts[2] if len(parts) > 2 else url
+
+
+class CrawlMetrics(object):
+    """
+    The class CrawlMetrics counts the finished tasks of the crawler, it is updated once for each
+    finished task (after the fetch) by the increments of the integers and the counters, the fetch
+    path only increments and decrements the in-flight gauge.
+
+    The rates (e.g. pages per second, the error ratio of a host) are computed when the metrics are
+    collected rather than when a task finishes.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.inflight = 0
+        self.requests = 0
+        self.pages = 0
+        self.errors = 0
+        self.statuses = collections.Counter()
+        self.host_requests = collections.Counter()
+        self.host_errors = collections.Counter()
+
+    def observe(self, task, url, yielded=False):
+        """
+        Count a finished task.
+
+        :param task: the task that returned by the function _process() of the crawler, None if it was ignored
+        :param url: the requested URL
+        :param yielded: True if the task was returned to the engine
+        """
+        if task is None:
+            return
+
+        self.requests += 1
+        host = _host(url)
+        self.host_requests[host] += 1
+        response = task.response
+        if task.exception is not None or response is None or response.status >= 400:
+            self.errors += 1
+            self.host_errors[host] += 1
+        if response is not None:
+            self.statuses[response.status] += 1
+        if yielded:
+            self.pages += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Exposition(object):
+    """Build the text exposition format: a HELP and a TYPE line then the samples of each metric."""
+
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        """:param samples: a list of tuples (labels dict or None, value)"""
+        name = _PREFIX + name
+        self.lines.append('# HELP %s %s' % (name, help_text))
+        self.lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in samples:
+            suffix = ''
+            if isinstance(labels, tuple):
+                suffix, labels = labels
+            if labels:
+                label_text = ','.join('%s="%s"' % (k, _escape(v)) for k, v in sorted(labels.items()))
+                self.lines.append('%s%s{%s} %s' % (name, suffix, label_text, value))
+            else:
+                self.lines.append('%s%s %s' % (name, suffix, value))
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def render_metrics(engine, previous=None, max_hosts=20):
+    """
+    Return the metrics of the engine in the text exposition format.
+
+    :param engine: an object common_crawler.engines.Engine
+    :param previous: a tuple (time, pages) of the last collection for computing the recent pages per second
+    :param max_hosts: export the per host metrics of the hosts that have the most errors
+    """
+    crawler = engine.crawler
+    metrics = getattr(crawler, 'metrics', None) or CrawlMetrics()
+    now = time.time()
+    since, pages = previous or (metrics.started_at, 0)
+    elapsed = now - since
+
+    exposition = _Exposition()
+    exposition.metric('uptime_seconds', 'gauge', 'Seconds since the crawl started.',
+                      [(None, '%.3f' % (now - metrics.started_at))])
+    exposition.metric('pages_total', 'counter', 'The pages returned to the engine.', [(None, metrics.pages)])
+    exposition.metric('pages_per_second', 'gauge', 'The pages per second since the last collection.',
+                      [(None, '%.3f' % ((metrics.pages - pages) / elapsed if elapsed > 0 else 0))])
+    exposition.metric('requests_total', 'counter', 'The finished fetches.', [(None, metrics.requests)])
+    exposition.metric('errors_total', 'counter', 'The fetches that failed or responded 4xx/5xx.',
+                      [(None, metrics.errors)])
+    exposition.metric('inflight_fetches', 'gauge', 'The fetches in progress.', [(None, metrics.inflight)])
+    coalesced = getattr(crawler, 'coalesced', None)
+    if coalesced is not None:
+        exposition.metric('coalesced_requests_total', 'counter',
+                          'The requests that coalesced with an in-flight request of the same URL.', [(None, coalesced)])
+
+    robots = getattr(crawler, 'robots', None)
+    if robots is not None:
+        exposition.metric('robots_fetches_total', 'counter', 'The robots.txt that requested.', [(None, robots.fetched)])
+        exposition.metric('robots_disallowed_total', 'counter', 'The URLs that disallowed by the robots.txt.',
+                          [(None, robots.disallowed)])
+        exposition.metric('robots_delayed_total', 'counter', 'The requests that waited for the Crawl-delay.',
+                          [(None, robots.delayed)])
+        exposition.metric('robots_parked_tasks', 'gauge', 'The tasks that are waiting for the Crawl-delay.',
+                          [(None, getattr(crawler, 'parked', 0))])
+
+    task_queue = getattr(crawler, 'task_queue', None)
+    if task_queue is not None and hasattr(task_queue, 'qsize'):
+        exposition.metric('task_queue_depth', 'gauge', 'The tasks waiting in the task queue.',
+                          [(None, task_queue.qsize())])
+    seen_urls = getattr(crawler, 'seen_urls', None)
+    if seen_urls is not None:
+        exposition.metric('seen_urls', 'gauge', 'The size of the seen set.', [(None, len(seen_urls))])
+
+    exposition.metric('responses_total', 'counter', 'The responses by the status code.',
+                      [({'status': status}, count) for status, count in sorted(metrics.statuses.items())])
+
+    stats = getattr(getattr(crawler, 'http_client', None), 'stats', None)
+    if stats is not None:
+        exposition.metric('bytes_downloaded_total', 'counter', 'The bytes of the downloaded bodies.',
+                          [(None, stats['bytes_downloaded'])])
+        exposition.metric('bytes_saved_total', 'counter', 'The declared bytes of the rejected bodies.',
+                          [(None, stats.get('bytes_saved', 0))])
+        exposition.metric('bodies_rejected_total', 'counter', 'The bodies that not downloaded by the reason.',
+                          [({'reason': reason}, stats.get('rejected_%s' % reason, 0))
+                           for reason in ('content_type', 'size')])
+        exposition.metric('bodies_truncated_total', 'counter', 'The bodies that truncated to the max_body_size.',
+                          [(None, stats.get('truncated', 0))])
+
+    hosts = [host for host, _ in metrics.host_errors.most_common(max_hosts)]
+    exposition.metric('host_requests_total', 'counter', 'The finished fetches of the host.',
+                      [({'host': host}, metrics.host_requests[host]) for host in hosts])
+    exposition.metric('host_errors_total', 'counter', 'The failed fetches of the host.',
+                      [({'host': host}, metrics.host_errors[host]) for host in hosts])
+    exposition.metric('host_error_ratio', 'gauge', 'The ratio of the failed fetches of the host.',
+                      [({'host': host}, '%.4f' % (metrics.host_errors[host] / metrics.host_requests[host]))
+                       for host in hosts])
+
+    governor = getattr(engine, 'governor', None)
+    if governor is not None:
+        exposition.metric('memory_rss_bytes', 'gauge', 'The last sampled RSS of the process.',
+                          [(None, governor.rss or 0)])
+        exposition.metric('memory_budget_bytes', 'gauge', 'The memory budget of the RSS.',
+                          [(None, governor.max_rss)])
+        exposition.metric('memory_level', 'gauge',
+                          'The level of the memory governor: 0 normal, 1 throttle, 2 critical.',
+                          [(None, _LEVELS.get(governor.level, 0))])
+        exposition.metric('memory_throttle_events_total', 'counter', 'The times that the governor throttled.',
+                          [({'level': level}, count) for level, count in sorted(governor.throttle_events.items())])
+        exposition.metric('memory_concurrency_limit', 'gauge', 'The number of the allowed concurrent fetches.',
+                          [(None, governor.concurrency_limit)])
+        exposition.metric('memory_deferred_urls', 'gauge', 'The URLs deferred to the disk.',
+                          [(None, governor.deferred)])
+        exposition.metric('memory_waits_total', 'counter', 'The times that a worker waited for the governor.',
+                          [(None, governor.waits)])
+        exposition.metric('component_size', 'gauge', 'The sizes of the components of the crawl.',
+                          [({'component': name}, size) for name, size in sorted(governor.components().items())
+                           if size is not None])
+
+    instrumentation = getattr(engine, 'instrumentation', None)
+    if instrumentation is not None and instrumentation.enabled:
+        samples = []
+        for stage, histogram in sorted(instrumentation.histograms.items()):
+            for q in _QUANTILES:
+                samples.append(({'stage': stage, 'quantile': q}, histogram.percentile(q * 100) / 1e6))
+            samples.append((('_sum', {'stage': stage}), histogram.total / 1e6))
+            samples.append((('_count', {'stage': stage}), histogram.count))
+        exposition.metric('stage_seconds', 'summary', 'The durations of the stages of the crawl.', samples)
+
+    return exposition.text()
+
+
+class MetricsServer(object):
+    """
+    The class MetricsServer serves the metrics of an engine on the event loop of the engine, it is
+    a minimal HTTP/1.1 server (asyncio.start_server) that answers GET /metrics, nothing is computed
+    until a scraper requests the metrics.
+    """
+
+    def __init__(self, engine, host='127.0.0.1', port=9100, path='/metrics'):
+        """
+        :param engine: an object common_crawler.engines.Engine
+        :param host: the address to listen, the default is the local address only
+        :param port: the port to listen, 0 represent an ephemeral port (see self.port after start())
+        :param path: the path of the metrics
+        """
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server = None
+        self._previous = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # ignore the headers of the request
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?', 1)[0] == self.path:
+                body = render_metrics(self.engine, self._previous).encode('utf-8')
+                metrics = getattr(self.engine.crawler, 'metrics', None)
+                if metrics is not None:
+                    self._previous = (time.time(), metrics.pages)
+                status, content_type = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                body, status, content_type = b'Not Found\n', '404 Not Found', 'text/plain'
+
+            writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %s\r\nConnection: close\r\n\r\n'
+                          % (status, content_type, len(body))).encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -3,11 +3,21 @@ The module pipeline is for transmitting parsed data from HTTP response,
 a destination of transmission can be file or database.
 """
 
+import asyncio
+import functools
+import logging
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
+from common_crawler.configuration import CONFIGURATION
 from common_crawler.task import Task
+from common_crawler.utils.misc import dynamic_import, DynamicImportReturnType
 
-__all__ = ['Pipeline']
+__all__ = ['Pipeline', 'AsyncPipeline', 'ThreadedPipeline']
+
+DEFAULT_MAX_INFLIGHT = CONFIGURATION.get('pipeline_max_inflight', 64)
+DEFAULT_THREADED_PIPELINE = CONFIGURATION.get('threaded_pipeline',
+                                              'common_crawler.pipeline.segment.SegmentFilePipeline')
 
 
 class Pipeline(ABC):
@@ -33,6 +43,12 @@ class Pipeline(ABC):
             self.close(**kwargs)
 
     def _init_task(self, task):
+        self._verify_task(task)
+        self.task = task
+        self.data = task.parsed_data
+
+    @staticmethod
+    def _verify_task(task):
         if not isinstance(task, Task):
             raise ValueError('Received class of the param task must be %s.%s, currently got %s.%s'
                              % (Task.__module__,
@@ -41,9 +57,6 @@ class Pipeline(ABC):
                                 task.__class__.__name__)
                              )
 
-        self.task = task
-        self.data = task.parsed_data
-
     @abstractmethod
     def setup(self, **kwargs):
         """some pre-operation of transmitting"""
@@ -64,3 +77,156 @@ class Pipeline(ABC):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
+
+
+class AsyncPipeline(Pipeline):
+    """
+    The class AsyncPipeline is the asynchronous contract of the Pipeline, the AsyncEngine awaits
+    its transmit(), flush() and close().
+
+    The function transmit() schedules the coroutine handle() and returns immediately unless the
+    number of in-flight writes reaches max_inflight, in that case it waits for a free slot, so that
+    a slow sink pushes back on the crawl instead of piling up page bodies in memory.
+
+    Each subclass must implement the coroutine handle(task, **kwargs), the task is passed as the
+    param rather than self.task because the writes run concurrently.
+
+    A failed write is logged (by the param logger, the Engine passes its own) and counted in
+    self.failed, the last exception is kept in self.last_exception.
+    """
+
+    def __init__(self, max_inflight=DEFAULT_MAX_INFLIGHT, **kwargs):
+        """
+        :param max_inflight: see the common_crawler.configuration (pipeline_max_inflight)
+        """
+        super(AsyncPipeline, self).__init__(**kwargs)
+        self.max_inflight = max_inflight
+        self.transmitted = 0
+        self.failed = 0
+        self.last_exception = None
+        if getattr(self, 'logger', None) is None:
+            self.logger = logging.getLogger(__name__)
+        self._inflight = set()
+        self._semaphore = None
+
+    @property
+    def inflight(self):
+        """The number of the writes that are not finished"""
+        return len(self._inflight)
+
+    async def transmit(self, task, **kwargs):
+        self._verify_task(task)
+
+        # create lazily for binding the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+
+        span = getattr(task, 'span', None)
+        if span is not None:
+            span.begin('pipeline_wait')
+        await self._semaphore.acquire()
+        future = asyncio.ensure_future(self.handle(task, **kwargs))
+        self._inflight.add(future)
+        future.add_done_callback(functools.partial(self._on_done, task))
+        if span is not None:
+            span.end('pipeline_wait')
+            # the span is exported after the write is done
+            span.begin('pipeline_async')
+            span.hold()
+            future.add_done_callback(functools.partial(self._finish_span, span))
+
+    def _finish_span(self, span, future):
+        failed = not future.cancelled() and future.exception() is not None
+        span.end('pipeline_async', pipeline=self.__class__.__name__, failed=failed)
+        span.finish()
+
+    def _on_done(self, task, future):
+        self._inflight.discard(future)
+        self._semaphore.release()
+
+        if future.cancelled():
+            return
+        exception = future.exception()
+        if exception is not None:
+            self.failed += 1
+            self.last_exception = exception
+            self.logger.error('Transmit the url %s by %s has failed, raised: %r',
+                              task.url, self.__class__.__name__, exception)
+        else:
+            self.transmitted += 1
+
+    async def setup(self, **kwargs):
+        pass
+
+    @abstractmethod
+    async def handle(self, task, **kwargs):
+        """handle how to transmit data of the task"""
+        raise NotImplementedError
+
+    async def flush(self):
+        """Wait for all the in-flight writes."""
+        while self._inflight:
+            await asyncio.wait(list(self._inflight))
+
+    async def close(self, **kwargs):
+        await self.flush()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # the coroutine close() can't be awaited by the statement "with" inside a running event loop
+        loop = asyncio.get_event_loop()
+        if loop.is_running():
+            raise RuntimeError('The %s is asynchronous and must be closed by "async with" or "await close()"'
+                               % self.__class__.__name__)
+        loop.run_until_complete(self.close())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class ThreadedPipeline(AsyncPipeline):
+    """
+    Adapt a synchronous Pipeline to the AsyncPipeline, the function transmit() of the wrapped
+    pipeline runs in a dedicated thread pool (one thread by default, which keeps the order
+    and the state of the wrapped pipeline safe) and the in-flight writes are bounded.
+
+    e.g. ThreadedPipeline(SegmentFilePipeline()) moves the file I/O out of the event loop, it can be
+    loaded from the components (the config item pipeline) as well, then the wrapped pipeline is the
+    config item threaded_pipeline.
+    """
+
+    def __init__(self, pipeline=DEFAULT_THREADED_PIPELINE, max_workers=1, thread_name_prefix='ThreadedPipeline-',
+                 **kwargs):
+        """
+        :param pipeline: the wrapped object Pipeline or the full name of its class (constructed without params)
+        :param max_workers: the number of the threads, the wrapped pipeline must be thread-safe if it more than one
+        """
+        super(ThreadedPipeline, self).__init__(**kwargs)
+
+        if isinstance(pipeline, str):
+            pipeline = dynamic_import(pipeline, DynamicImportReturnType.CLASS)
+
+        if not isinstance(pipeline, Pipeline) or isinstance(pipeline, AsyncPipeline):
+            raise ValueError('The wrapped pipeline must be a synchronous %s.%s, got %s.%s'
+                             % (Pipeline.__module__,
+                                Pipeline.__name__,
+                                pipeline.__class__.__module__,
+                                pipeline.__class__.__name__)
+                             )
+
+        self.pipeline = pipeline
+        self.threadpool = ThreadPoolExecutor(max_workers=max_workers,
+                                             thread_name_prefix=thread_name_prefix)
+
+    async def handle(self, task, **kwargs):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.threadpool,
+                                   functools.partial(self.pipeline.transmit, task, **kwargs))
+
+    async def close(self, **kwargs):
+        await self.flush()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.threadpool, self.pipeline.close)
+        self.threadpool.shutdown()
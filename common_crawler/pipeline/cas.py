@@ -0,0 +1,127 @@
+import collections
+import hashlib
+import json
+import os
+import time
+
+from common_crawler.pipeline import Pipeline
+
+__all__ = ['ContentAddressedPipeline']
+
+
+class ContentAddressedPipeline(Pipeline):
+    """
+    Transmit the body of the tasks to a content-addressed store, each body is hashed (SHA-256)
+    and each distinct body is written only once to {dirname}/objects/{hash[:2]}/{hash[2:4]}/{hash},
+    every transmitted URL is recorded in the index file {dirname}/index.tsv as "URL hash status time".
+
+    The mirrors, session-id variants and soft-404 pages usually have the same body, so the disk usage
+    and write I/O drop in line with the duplication ratio, a bounded in-memory cache of the recently
+    seen hashes avoids touching the filesystem on the hot path.
+
+    notice, this class must manually call close() for flushing the index!!!
+    """
+
+    def __init__(self,
+                 dirname='data',
+                 cache_size=100000,
+                 index_buffer_size=1 << 16,
+                 **kwargs):
+        """
+        :param dirname: the root directory of the store
+        :param cache_size: the maximum number of the hashes in the in-memory cache
+        :param index_buffer_size: the size (bytes) of the write buffer of the index file
+        """
+        super(__class__, self).__init__(**kwargs)
+
+        self.dirname = dirname
+        self.objects_dirname = os.path.join(dirname, 'objects')
+        self.cache_size = cache_size
+        self.blobs_written = 0
+        self.duplicates = 0
+        self.bytes_written = 0
+        self.bytes_saved = 0
+
+        if not os.path.exists(self.objects_dirname):
+            os.makedirs(self.objects_dirname)
+
+        self._cache = collections.OrderedDict()
+        self._index = open(os.path.join(dirname, 'index.tsv'), 'a',
+                           encoding='utf-8', buffering=index_buffer_size)
+
+    def transmit(self, task, encode='utf-8', **kwargs):
+        """
+        Overwrite this function for avoiding call close() when each time perform
+        transmit(), because close() will close the index file.
+        """
+        super(__class__, self)._init_task(task)
+
+        self.setup(**kwargs)
+        self.handle(encode)
+
+    def setup(self, **kwargs):
+        pass
+
+    def handle(self, encode='utf-8', **kwargs):
+        body = self.data
+        if body is None:
+            body = b''
+        elif isinstance(body, str):
+            body = body.encode(encode, errors='replace')
+        elif not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+
+        digest = hashlib.sha256(body).hexdigest()
+        if self._seen(digest):
+            self.duplicates += 1
+            self.bytes_saved += len(body)
+        else:
+            self._write_blob(digest, body)
+
+        response = self.task.response
+        self._index.write('%s\t%s\t%s\t%.3f\n' % (self.task.url,
+                                                  digest,
+                                                  response.status if response is not None else '',
+                                                  time.time()))
+
+    def path_of(self, digest):
+        """Return the path of the blob of the specific hash."""
+        return os.path.join(self.objects_dirname, digest[:2], digest[2:4], digest)
+
+    def _seen(self, digest):
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return True
+
+        if os.path.exists(self.path_of(digest)):
+            self._remember(digest)
+            return True
+        return False
+
+    def _remember(self, digest):
+        self._cache[digest] = None
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _write_blob(self, digest, body):
+        path = self.path_of(digest)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # write to a temporary file then rename, a reader never sees a partial blob
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+        self._remember(digest)
+        self.blobs_written += 1
+        self.bytes_written += len(body)
+
+    def flush(self):
+        self._index.flush()
+
+    def close(self, **kwargs):
+        if not self._index.closed:
+            self._index.close()
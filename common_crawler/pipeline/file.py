@@ -1,17 +1,19 @@
+import asyncio
 import multiprocessing
 import os
 from concurrent.futures import ThreadPoolExecutor
 
-from common_crawler.pipeline import Pipeline
+from common_crawler.pipeline import AsyncPipeline
 from common_crawler.utils.url import get_domain
 
 __all__ = ['SimpleFilePipeline']
 
 
-class SimpleFilePipeline(Pipeline):
+class SimpleFilePipeline(AsyncPipeline):
     """
-    Transmit the parsed data to the file simply,
-    built-in a thread pool for increase efficiency.
+    Transmit the parsed data to the file simply (one file per page), the files are written
+    by a built-in thread pool and the in-flight writes are bounded by max_inflight, so that
+    a slow disk pushes back on the crawl (see common_crawler.pipeline.AsyncPipeline).
 
     notice, this class must manually call close() for release resource!!!
     """
@@ -24,48 +26,33 @@ class SimpleFilePipeline(Pipeline):
         super(__class__, self).__init__(**kwargs)
 
         self.enable_multithread = enable_multithread
-        if enable_multithread:
-            self.threadpool = ThreadPoolExecutor(max_workers=max_workers,
-                                                 thread_name_prefix=thread_name_prefix)
+        self.threadpool = ThreadPoolExecutor(max_workers=max_workers,
+                                             thread_name_prefix=thread_name_prefix) if enable_multithread else None
 
-    def transmit(self,
-                 task,
-                 suffix='html',
-                 dirname='',
-                 encode='utf-8',
-                 **kwargs):
-        """
-        Overwrite this function for avoiding call close() when each time perform
-        transmit(), because close() will release resource of the thread pool and
-        will cause subsequent operation is disabled
-        """
-        super(__class__, self)._init_task(task)
-
-        self.setup(**kwargs)
-
-        filename = '%s:%s.%s' % (get_domain(self.task.url),
-                                 self.task.response.status,
+    async def handle(self, task, suffix='html', dirname='', encode='utf-8', **kwargs):
+        filename = '%s:%s.%s' % (get_domain(task.url),
+                                 task.response.status,
                                  suffix)
         if dirname:
-            if not os.path.exists(dirname):
-                os.makedirs(dirname)
             filename = os.path.join(dirname, filename)
 
-        self.handle(filename, encode)
-
-    def setup(self, **kwargs):
-        pass
-
-    def handle(self, filename, encode):
-        if self.enable_multithread:
-            self.threadpool.submit(self._work, filename, encode)
+        # the data is passed rather than read from the task by the thread, the writes run concurrently
+        if self.threadpool is None:
+            self._work(filename, task.parsed_data, encode)
         else:
-            self._work(filename, encode)
+            await asyncio.get_event_loop().run_in_executor(self.threadpool, self._work,
+                                                           filename, task.parsed_data, encode)
 
-    def _work(self, filename, encode):
+    @staticmethod
+    def _work(filename, data, encode):
+        # the path of the URL becomes the sub-directories
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
         with open(filename, 'wb+') as f:
-            f.write(self.data.encode(encode))
+            f.write(data.encode(encode))
 
-    def close(self, **kwargs):
-        if self.enable_multithread:
+    async def close(self, **kwargs):
+        await self.flush()
+        if self.threadpool is not None:
             self.threadpool.shutdown()
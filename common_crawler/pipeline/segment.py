@@ -0,0 +1,256 @@
+import json
+import os
+import struct
+import time
+
+from common_crawler.pipeline import Pipeline
+
+__all__ = ['SegmentWriter', 'SegmentFilePipeline', 'iter_records',
+           'RECORD_FORMAT_JSONL', 'RECORD_FORMAT_LENGTH_PREFIXED']
+
+RECORD_FORMAT_JSONL = 'jsonl'
+RECORD_FORMAT_LENGTH_PREFIXED = 'length-prefixed'
+
+# length of the metadata (JSON) and length of the body
+_HEADER_STRUCT = struct.Struct('>IQ')
+
+
+class SegmentWriter(object):
+    """
+    An append-only writer for the large segment files, the data is buffered in memory
+    and the segment is rotated when its size or its age exceeds the limit, the fsync()
+    is called in batches (every fsync_bytes) rather than for each record, so that the
+    writes per second are bounded by disk bandwidth instead of metadata operations.
+
+    Segment files are named as {prefix}-{timestamp}-{sequence}.{suffix}.
+    """
+
+    def __init__(self,
+                 dirname='data',
+                 prefix='segment',
+                 suffix='jsonl',
+                 max_segment_size=1 << 30,
+                 max_segment_age=3600,
+                 buffer_size=1 << 20,
+                 fsync_bytes=1 << 26,
+                 on_rotate=None):
+        """
+        :param dirname: the directory of the segment files
+        :param prefix: the prefix of the segment file name
+        :param suffix: the suffix of the segment file name
+        :param max_segment_size: rotate the segment when its size (bytes) exceeds this value
+        :param max_segment_age: rotate the segment when it was opened over this value (seconds),
+        None or non-positive represent never rotate by time
+        :param buffer_size: the size (bytes) of the in-memory write buffer
+        :param fsync_bytes: call fsync() whenever the bytes written since the last fsync() exceed this value,
+        None or non-positive represent only call fsync() on rotate and close
+        :param on_rotate: a unary function that receives the filename of the closed segment
+        """
+        self.dirname = dirname
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_segment_size = max_segment_size
+        self.max_segment_age = max_segment_age
+        self.buffer_size = buffer_size
+        self.fsync_bytes = fsync_bytes
+        self.on_rotate = on_rotate
+
+        self.filename = None
+        self.offset = 0
+        self.sequence = 0
+        self.fsync_count = 0
+        self._file = None
+        self._opened_at = 0
+        self._unsynced = 0
+
+    def write(self, data):
+        """
+        Append the bytes to the current segment.
+
+        :return a tuple (filename, offset, length) which locates the data
+        """
+        self.maybe_rotate()
+
+        filename, offset = self.filename, self.offset
+        self._file.write(data)
+        self.offset += len(data)
+        self._unsynced += len(data)
+
+        if self.fsync_bytes and self.fsync_bytes > 0 and self._unsynced >= self.fsync_bytes:
+            self.flush(fsync=True)
+
+        return filename, offset, len(data)
+
+    def maybe_rotate(self):
+        """Open a new segment if there is no segment or the current segment is full, return True if opened."""
+        if self._file is None or self._should_rotate():
+            self.rotate()
+            return True
+        return False
+
+    def _should_rotate(self):
+        if self.offset >= self.max_segment_size:
+            return True
+        if self.max_segment_age and self.max_segment_age > 0:
+            return time.time() - self._opened_at >= self.max_segment_age
+        return False
+
+    def rotate(self):
+        """Close the current segment then open a new one."""
+        self._close_segment()
+
+        if self.dirname and not os.path.exists(self.dirname):
+            os.makedirs(self.dirname)
+
+        self.sequence += 1
+        name = '%s-%s-%05d.%s' % (self.prefix,
+                                  time.strftime('%Y%m%d%H%M%S'),
+                                  self.sequence,
+                                  self.suffix)
+        self.filename = os.path.join(self.dirname, name)
+        self._file = open(self.filename, 'ab', buffering=self.buffer_size)
+        self._opened_at = time.time()
+        self.offset = self._file.tell()
+
+    def flush(self, fsync=False):
+        if self._file is None:
+            return
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+            self.fsync_count += 1
+            self._unsynced = 0
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self.flush(fsync=True)
+        self._file.close()
+        self._file = None
+        if callable(self.on_rotate):
+            self.on_rotate(self.filename)
+
+    def close(self):
+        self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _headers_to_list(headers):
+    """Convert the headers (multi-dict or dict) to a list of pairs for keeping the duplicate keys."""
+    if not headers:
+        return []
+    return [[str(k), str(v)] for k, v in headers.items()]
+
+
+def _encode_record(metadata, body, record_format, encode='utf-8'):
+    if record_format == RECORD_FORMAT_JSONL:
+        if isinstance(body, bytes):
+            body = body.decode(encode, errors='replace')
+        metadata['body'] = body
+        return json.dumps(metadata, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    meta = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+    return _HEADER_STRUCT.pack(len(meta), len(body)) + meta + body
+
+
+def iter_records(filename, record_format=RECORD_FORMAT_JSONL):
+    """
+    Iterate the records of a segment file that written by the SegmentFilePipeline,
+    each record is a dict and the body of a length-prefixed record is the bytes.
+    """
+    with open(filename, 'rb') as f:
+        if record_format == RECORD_FORMAT_JSONL:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line.decode('utf-8'))
+            return
+
+        while True:
+            header = f.read(_HEADER_STRUCT.size)
+            if len(header) < _HEADER_STRUCT.size:
+                return
+            meta_length, body_length = _HEADER_STRUCT.unpack(header)
+            record = json.loads(f.read(meta_length).decode('utf-8'))
+            record['body'] = f.read(body_length)
+            yield record
+
+
+class SegmentFilePipeline(Pipeline):
+    """
+    Transmit the records (URL, status, headers and body) of the tasks to the large segment files,
+    a record is a JSON line or a length-prefixed binary record (see iter_records()).
+    Pages from the same domain never overwrite each other and there is no new file per page.
+
+    notice, this class must manually call close() for flushing the buffer!!!
+    """
+
+    def __init__(self,
+                 dirname='data',
+                 prefix='segment',
+                 record_format=RECORD_FORMAT_JSONL,
+                 max_segment_size=1 << 30,
+                 max_segment_age=3600,
+                 buffer_size=1 << 20,
+                 fsync_bytes=1 << 26,
+                 **kwargs):
+        """
+        :param record_format: RECORD_FORMAT_JSONL or RECORD_FORMAT_LENGTH_PREFIXED
+        the other params see the SegmentWriter.
+        """
+        super(__class__, self).__init__(**kwargs)
+
+        if record_format not in (RECORD_FORMAT_JSONL, RECORD_FORMAT_LENGTH_PREFIXED):
+            raise ValueError('The record format must be %s or %s, got %s'
+                             % (RECORD_FORMAT_JSONL, RECORD_FORMAT_LENGTH_PREFIXED, record_format))
+
+        self.record_format = record_format
+        self.writer = SegmentWriter(dirname=dirname,
+                                    prefix=prefix,
+                                    suffix='jsonl' if record_format == RECORD_FORMAT_JSONL else 'rec',
+                                    max_segment_size=max_segment_size,
+                                    max_segment_age=max_segment_age,
+                                    buffer_size=buffer_size,
+                                    fsync_bytes=fsync_bytes)
+
+    def transmit(self, task, encode='utf-8', **kwargs):
+        """
+        Overwrite this function for avoiding call close() when each time perform
+        transmit(), because close() will close the segment file.
+        """
+        super(__class__, self)._init_task(task)
+
+        self.setup(**kwargs)
+        self.handle(encode)
+
+    def setup(self, **kwargs):
+        pass
+
+    def handle(self, encode='utf-8', **kwargs):
+        response = self.task.response
+        body = self.data
+        if body is None:
+            body = ''
+        elif not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+
+        if self.record_format == RECORD_FORMAT_LENGTH_PREFIXED and isinstance(body, str):
+            body = body.encode(encode, errors='replace')
+
+        metadata = {
+            'url': self.task.url,
+            'status': response.status if response is not None else None,
+            'headers': _headers_to_list(response.headers) if response is not None else [],
+            'fetched_at': time.time(),
+        }
+        self.writer.write(_encode_record(metadata, body, self.record_format, encode))
+
+    def flush(self, fsync=False):
+        self.writer.flush(fsync=fsync)
+
+    def close(self, **kwargs):
+        self.writer.close()
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+from common_crawler.pipeline import Pipeline
+from common_crawler.pipeline.segment import _headers_to_list
+
+__all__ = ['SqlitePipeline', 'SCHEMA']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    redirect_url TEXT,
+    redirect_num INTEGER,
+    retries_num INTEGER,
+    status INTEGER,
+    reason TEXT,
+    charset TEXT,
+    content_type TEXT,
+    content_length INTEGER,
+    headers TEXT,
+    body BLOB,
+    fetched_at REAL
+);
+CREATE INDEX IF NOT EXISTS pages_url ON pages (url);
+'''
+
+_INSERT = '''
+INSERT INTO pages (url, redirect_url, redirect_num, retries_num, status, reason, charset,
+                   content_type, content_length, headers, body, fetched_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# the marker that represents the commit_interval elapsed and the writer thread should commit
+_FLUSH = object()
+
+# the marker that notifies the writer thread to exit
+_CLOSE = object()
+
+
+class SqlitePipeline(Pipeline):
+    """
+    Transmit the tasks to the SQLite database (the table "pages" see SCHEMA), the database runs in
+    WAL mode and all the writes happen in a dedicated writer thread that groups the rows into one
+    transaction until the number of rows reaches the batch_size or the commit_interval elapsed.
+
+    The body is compressed by zlib, read it by zlib.decompress(body).decode(charset).
+
+    The queue between transmit() and the writer thread is bounded, transmit() blocks when the writer
+    falls behind, close() commits all the pending rows before return.
+
+    A task that can't be converted to a row (e.g. the parsed data isn't JSON serializable) is logged
+    and counted in self.invalid_rows, if the commit of a batch fails the rows are inserted one by one
+    so that only the rows that fail again are lost (logged and counted in self.failed_rows).
+    """
+
+    def __init__(self,
+                 filename='data/pages.db',
+                 batch_size=500,
+                 commit_interval=1.0,
+                 max_pending=10000,
+                 compress_level=6,
+                 thread_name='SqlitePipeline-writer',
+                 **kwargs):
+        """
+        :param filename: the filename of the SQLite database
+        :param batch_size: commit when the number of the uncommitted rows reaches this value
+        :param commit_interval: commit when the oldest uncommitted row waited over this value (seconds)
+        :param max_pending: the maximum number of the rows waiting for the writer thread
+        :param compress_level: the level of the zlib compression of the body
+        """
+        super(__class__, self).__init__(**kwargs)
+
+        self.filename = filename
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.compress_level = compress_level
+        self.rows_written = 0
+        self.commits = 0
+        self.invalid_rows = 0
+        self.failed_rows = 0
+        self.last_exception = None
+        if getattr(self, 'logger', None) is None:
+            self.logger = logging.getLogger(__name__)
+
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._ready = threading.Event()
+        self._writer = threading.Thread(target=self._work, name=thread_name, daemon=True)
+        self._writer.start()
+        self._ready.wait()
+        if self.last_exception is not None:
+            raise self.last_exception
+
+    def transmit(self, task, encode='utf-8', **kwargs):
+        """
+        Overwrite this function for avoiding call close() when each time perform
+        transmit(), because close() will stop the writer thread.
+        """
+        super(__class__, self)._init_task(task)
+
+        self.setup(**kwargs)
+        self.handle(encode)
+
+    def setup(self, **kwargs):
+        if self._closed:
+            raise ValueError('The pipeline %s is closed' % self.__class__.__name__)
+
+    def handle(self, encode='utf-8', **kwargs):
+        task, response = self.task, self.task.response
+        self._queue.put((task.url, task.redirect_url, task.redirect_num, task.retries_num,
+                         response.status, response.reason, response.charset,
+                         response.content_type, response.content_length,
+                         response.headers, self.data, encode, time.time()))
+
+    def _to_row(self, item):
+        *fields, headers, data, encode, fetched_at = item
+        if data is None:
+            body = None
+        else:
+            if isinstance(data, str):
+                data = data.encode(encode, errors='replace')
+            elif not isinstance(data, bytes):
+                data = json.dumps(data).encode('utf-8')
+            body = zlib.compress(data, self.compress_level)
+        return tuple(fields) + (json.dumps(_headers_to_list(headers)), body, fetched_at)
+
+    def _work(self):
+        try:
+            db = sqlite3.connect(self.filename, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+        except Exception as e:
+            self.last_exception = e
+            return
+        finally:
+            self._ready.set()
+
+        rows, first_at, running = [], None, True
+        while running:
+            timeout = None if first_at is None else max(0, first_at + self.commit_interval - time.time())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+
+            if item is _CLOSE:
+                running = False
+            elif isinstance(item, threading.Event):
+                pass
+            elif item is not _FLUSH:
+                try:
+                    rows.append(self._to_row(item))
+                except Exception as e:
+                    self.invalid_rows += 1
+                    self.logger.error('Convert the url %s to a row has failed, raised: %r', item[0], e)
+                if first_at is None:
+                    first_at = time.time()
+                if len(rows) < self.batch_size:
+                    continue
+
+            if rows:
+                self._commit(db, rows)
+            rows, first_at = [], None
+
+            if isinstance(item, threading.Event):
+                item.set()
+
+        db.close()
+
+    def _commit(self, db, rows):
+        try:
+            db.execute('BEGIN')
+            db.executemany(_INSERT, rows)
+            db.execute('COMMIT')
+            self.rows_written += len(rows)
+            self.commits += 1
+            return
+        except Exception as e:
+            self.last_exception = e
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            self.logger.error('Commit %s rows has failed and insert them one by one, raised: %r', len(rows), e)
+
+        for row in rows:
+            try:
+                db.execute(_INSERT, row)
+                self.rows_written += 1
+            except Exception as e:
+                self.last_exception = e
+                self.failed_rows += 1
+                self.logger.error('Insert the url %s has failed, raised: %r', row[0], e)
+        self.commits += 1
+
+    def flush(self):
+        """Block until all the transmitted rows have been committed."""
+        if self._closed:
+            return
+        event = threading.Event()
+        self._queue.put(event)
+        event.wait()
+
+    def close(self, **kwargs):
+        """Commit all the pending rows then stop the writer thread, raise the last error of the writer if any."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._writer.join()
+
+        if self.last_exception is not None:
+            exception, self.last_exception = self.last_exception, None
+            raise exception
@@ -0,0 +1,213 @@
+import base64
+import collections
+import gzip
+import hashlib
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from common_crawler.pipeline import Pipeline
+from common_crawler.pipeline.segment import SegmentWriter
+
+__all__ = ['WarcPipeline', 'build_warc_record']
+
+WARC_VERSION = 'WARC/1.0'
+
+# the body of the Response is decoded text, so the headers that describe the
+# encoding of the original transfer are invalid and will be replaced
+_STRIPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+
+
+def _warc_date(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def _record_id():
+    return '<urn:uuid:%s>' % uuid.uuid4()
+
+
+def _digest(block):
+    return 'sha1:%s' % base64.b32encode(hashlib.sha1(block).digest()).decode('ascii')
+
+
+def build_warc_record(warc_type, block, headers):
+    """
+    Return the bytes of a WARC record (uncompressed).
+
+    :param warc_type: the value of the WARC-Type e.g. warcinfo, request and response
+    :param block: the bytes of the content block
+    :param headers: a list of pairs which are the WARC named fields except WARC-Type and Content-Length
+    """
+    lines = [WARC_VERSION, 'WARC-Type: %s' % warc_type]
+    lines.extend('%s: %s' % (k, v) for k, v in headers)
+    lines.append('Content-Length: %s' % len(block))
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+    return head + block + b'\r\n\r\n'
+
+
+class WarcPipeline(Pipeline):
+    """
+    Transmit the request and response records of the tasks to the rotating .warc.gz files,
+    each record is gzipped independently (a gzip member per record) so that the files
+    support random access, the compression runs in a background thread pool and the
+    records are always written in the order of transmit().
+
+    Each segment has an offset index file ({segment}.idx) and each line of it is
+    "offset length WARC-Type URL" separated by tab.
+
+    notice, this class must manually call close() for flushing pending records!!!
+    """
+
+    def __init__(self,
+                 dirname='data',
+                 prefix='crawl',
+                 max_segment_size=1 << 30,
+                 max_segment_age=3600,
+                 buffer_size=1 << 20,
+                 fsync_bytes=1 << 26,
+                 compress_level=6,
+                 max_workers=multiprocessing.cpu_count(),
+                 max_pending=256,
+                 thread_name_prefix='WarcPipeline-',
+                 **kwargs):
+        """
+        :param compress_level: the level of the gzip compression
+        :param max_workers: the number of the compression threads
+        :param max_pending: the maximum number of the records that waiting for compression,
+        transmit() blocks on the oldest one if this value exceeded
+        the other params see the common_crawler.pipeline.segment.SegmentWriter.
+        """
+        super(__class__, self).__init__(**kwargs)
+
+        self.compress_level = compress_level
+        self.max_pending = max_pending
+        self.records_written = 0
+        self.threadpool = ThreadPoolExecutor(max_workers=max_workers,
+                                             thread_name_prefix=thread_name_prefix)
+        self.writer = SegmentWriter(dirname=dirname,
+                                    prefix=prefix,
+                                    suffix='warc.gz',
+                                    max_segment_size=max_segment_size,
+                                    max_segment_age=max_segment_age,
+                                    buffer_size=buffer_size,
+                                    fsync_bytes=fsync_bytes,
+                                    on_rotate=self._close_index)
+        self._pending = collections.deque()
+        self._index = None
+
+    def transmit(self, task, encode='utf-8', **kwargs):
+        """
+        Overwrite this function for avoiding call close() when each time perform
+        transmit(), because close() will shut down the thread pool and close the segment.
+        """
+        super(__class__, self)._init_task(task)
+
+        self.setup(**kwargs)
+        self.handle(encode)
+
+    def setup(self, **kwargs):
+        pass
+
+    def handle(self, encode='utf-8', **kwargs):
+        # the payload of the response record is the HTTP body rather than the parsed data
+        response = self.task.response
+        body = getattr(response, 'text', None)
+        if body is None:
+            body = b''
+        elif isinstance(body, str):
+            body = body.encode(response.charset or encode, errors='replace')
+
+        future = self.threadpool.submit(self._build_records,
+                                        self.task.url,
+                                        response.status,
+                                        response.reason,
+                                        response.headers,
+                                        body,
+                                        time.time())
+        self._pending.append(future)
+
+        if len(self._pending) > self.max_pending:
+            self._write(self._pending.popleft().result())
+        self._drain(block=False)
+
+    def _build_records(self, url, status, reason, headers, body, timestamp):
+        """Build and compress the request record and the response record, run in the thread pool."""
+        date = _warc_date(timestamp)
+        response_id = _record_id()
+
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_block = ('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n' % (path, parts.netloc)).encode('utf-8')
+
+        status_line = 'HTTP/1.1 %s %s\r\n' % (status, reason or '')
+        header_lines = ''.join('%s: %s\r\n' % (k, v) for k, v in (headers or {}).items()
+                               if k.lower() not in _STRIPPED_HEADERS)
+        header_lines += 'Content-Length: %s\r\n' % len(body)
+        response_block = (status_line + header_lines + '\r\n').encode('utf-8', errors='replace') + body
+
+        request = build_warc_record('request', request_block, [
+            ('WARC-Record-ID', _record_id()),
+            ('WARC-Date', date),
+            ('WARC-Target-URI', url),
+            ('WARC-Concurrent-To', response_id),
+            ('Content-Type', 'application/http; msgtype=request'),
+        ])
+        response = build_warc_record('response', response_block, [
+            ('WARC-Record-ID', response_id),
+            ('WARC-Date', date),
+            ('WARC-Target-URI', url),
+            ('WARC-Payload-Digest', _digest(body)),
+            ('Content-Type', 'application/http; msgtype=response'),
+        ])
+
+        return [(url, 'request', gzip.compress(request, self.compress_level)),
+                (url, 'response', gzip.compress(response, self.compress_level))]
+
+    def _drain(self, block):
+        """Write the compressed records in order, stop at the first unfinished one if block is False."""
+        while self._pending and (block or self._pending[0].done()):
+            self._write(self._pending.popleft().result())
+
+    def _write(self, records):
+        for url, warc_type, data in records:
+            if self.writer.maybe_rotate() or self._index is None:
+                self._open_index(self.writer.filename)
+            _, offset, length = self.writer.write(data)
+            self._index.write('%s\t%s\t%s\t%s\n' % (offset, length, warc_type, url))
+            self.records_written += 1
+
+    def _open_index(self, filename):
+        self._close_index()
+        self._index = open(filename + '.idx', 'a', encoding='utf-8')
+
+        # the first record of a segment is the warcinfo
+        info = ('software: common_crawler\r\nformat: WARC File Format 1.0\r\n').encode('utf-8')
+        data = gzip.compress(build_warc_record('warcinfo', info, [
+            ('WARC-Record-ID', _record_id()),
+            ('WARC-Date', _warc_date(time.time())),
+            ('Content-Type', 'application/warc-fields'),
+        ]), self.compress_level)
+        _, offset, length = self.writer.write(data)
+        self._index.write('%s\t%s\twarcinfo\t-\n' % (offset, length))
+
+    def _close_index(self, filename=None):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def flush(self):
+        """Wait for all the pending records then flush the segment."""
+        self._drain(block=True)
+        self.writer.flush()
+        if self._index is not None:
+            self._index.flush()
+
+    def close(self, **kwargs):
+        self._drain(block=True)
+        self.threadpool.shutdown()
+        self.writer.close()
+        self._close_index()
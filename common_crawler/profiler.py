@@ -0,0 +1,169 @@
+"""The profiling mode of the engine: a sampling CPU profiler and the periodic tracemalloc snapshots"""
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+__all__ = ['Profiler', 'run_filename']
+
+
+def run_filename(dirname, name, suffix, started_at=None):
+    """Return the filename of a run, e.g. data/profiles/common_crawler-20200101-120000-1234.folded"""
+    started_at = started_at or time.time()
+    return os.path.join(dirname, '%s-%s-%s.%s'
+                        % (name, time.strftime('%Y%m%d-%H%M%S', time.localtime(started_at)), os.getpid(), suffix))
+
+
+def _folded_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('%s:%s:%s' % (os.path.basename(code.co_filename), code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return ';'.join(stack)
+
+
+class Profiler(object):
+    """
+    The class Profiler profiles the thread that starts it (the thread of the event loop) from a
+    background thread, so nothing is inserted into the profiled code:
+
+        - the CPU profile: the stack of the profiled thread is sampled every interval seconds and
+          counted as the folded stacks (one "frame;frame;frame count" line for each stack), the file
+          is rewritten every flush_interval seconds and can be rendered by flamegraph.pl or speedscope
+        - the memory profile: a tracemalloc snapshot is taken every memory_interval seconds, the top
+          allocators (grouped by the line, e.g. the lines that create the Task, the Response and the
+          lxml trees) and their growth since the previous snapshot are appended to the file
+
+    The overhead is a stack walk for each sample, the tracemalloc costs more (it traces each allocation),
+    so it's enabled only if memory_interval is positive.
+    """
+
+    def __init__(self,
+                 dirname='data/profiles',
+                 name='common_crawler',
+                 interval=0.005,
+                 flush_interval=10,
+                 memory_interval=30,
+                 memory_top=20,
+                 memory_frames=1):
+        """
+        :param dirname: the directory of the output files, the files are named by the start time and the pid
+        :param name: the prefix of the output files
+        :param interval: the seconds between two samples of the stack
+        :param flush_interval: the seconds between two writes of the CPU profile
+        :param memory_interval: the seconds between two tracemalloc snapshots, 0 or None represent disabled
+        :param memory_top: the number of the allocators that reported for each snapshot
+        :param memory_frames: the number of the frames that tracemalloc stores for each allocation
+        """
+        self.dirname = dirname
+        self.name = name
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.memory_interval = memory_interval
+        self.memory_top = memory_top
+        self.memory_frames = memory_frames
+
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.snapshots = 0
+        self.cpu_filename = None
+        self.memory_filename = None
+        self._thread = None
+        self._target = None
+        self._stopped = threading.Event()
+        self._previous_snapshot = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not os.path.exists(self.dirname):
+            os.makedirs(self.dirname)
+        started_at = time.time()
+        self.cpu_filename = run_filename(self.dirname, self.name, 'folded', started_at)
+        if self.memory_interval:
+            self.memory_filename = run_filename(self.dirname, self.name, 'memory.txt', started_at)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.memory_frames)
+                self._started_tracemalloc = True
+
+        self._target = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='common_crawler-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        next_snapshot = time.monotonic() + self.memory_interval if self.memory_interval else None
+        while not self._stopped.wait(self.interval):
+            self.sample()
+            now = time.monotonic()
+            if now >= next_flush:
+                self.flush()
+                next_flush = now + self.flush_interval
+            if next_snapshot is not None and now >= next_snapshot:
+                self.snapshot()
+                next_snapshot = now + self.memory_interval
+
+    def sample(self):
+        """Count the current stack of the profiled thread."""
+        frame = sys._current_frames().get(self._target)
+        if frame is not None:
+            self.stacks[_folded_stack(frame)] += 1
+            self.samples += 1
+
+    def flush(self):
+        """Rewrite the CPU profile with the folded stacks that sampled so far."""
+        if self.cpu_filename is None:
+            return
+        temp_filename = self.cpu_filename + '.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %s\n' % (stack, count))
+        os.replace(temp_filename, self.cpu_filename)
+
+    def snapshot(self):
+        """Take a tracemalloc snapshot and append the top allocators and their growth to the memory profile."""
+        if self.memory_filename is None or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        self.snapshots += 1
+
+        lines = ['--- snapshot %s at %s, traced %.1f KiB, peak %.1f KiB ---'
+                 % (self.snapshots, time.strftime('%H:%M:%S'), current / 1024, peak / 1024)]
+        if self._previous_snapshot is None:
+            for stat in snapshot.statistics('lineno')[:self.memory_top]:
+                lines.append('%s' % stat)
+        else:
+            for stat in snapshot.compare_to(self._previous_snapshot, 'lineno')[:self.memory_top]:
+                lines.append('%s' % stat)
+        self._previous_snapshot = snapshot
+
+        with open(self.memory_filename, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n\n')
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        self.snapshot()
+        self._previous_snapshot = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,116 @@
+"""The cache of the permanent redirections that rewrites the URLs before they are fetched"""
+import collections
+
+__all__ = ['RedirectCache', 'PERMANENT_REDIRECT_STATUSES']
+
+PERMANENT_REDIRECT_STATUSES = (301, 308)
+
+
+def _split_prefix(url):
+    """Return a tuple (scheme://host, the rest of the URL) or None if the URL is not absolute."""
+    i = url.find('://')
+    if i == -1:
+        return None
+    j = url.find('/', i + 3)
+    if j == -1:
+        return url.lower(), '/'
+    return url[:j].lower(), url[j:]
+
+
+class RedirectCache(object):
+    """
+    The class RedirectCache remembers the permanent redirections (301 and 308) in two bounded LRU maps:
+
+        - URL: http://example.com/a -> https://www.example.com/a
+        - prefix: http://example.com -> https://www.example.com, learned when min_evidence redirections
+          of the different paths only changed the scheme and/or the host (e.g. a site that redirects
+          every http:// URL to https://), a contradicting redirection forgets the rule
+
+    The function resolve() rewrites a URL to the final target of the known redirections, so the
+    crawler enqueues and fetches the target directly instead of requesting each hop every time.
+    """
+
+    def __init__(self, max_urls=10000, max_prefixes=1000, min_evidence=2, max_hops=10):
+        """
+        :param max_urls: the maximum number of the URL redirections
+        :param max_prefixes: the maximum number of the prefix rules
+        :param min_evidence: the number of the redirections that a prefix rule needs to be used
+        :param max_hops: the maximum number of the hops that resolve() follows (it also stops a loop)
+        """
+        self.max_urls = max_urls
+        self.max_prefixes = max_prefixes
+        self.min_evidence = min_evidence
+        self.max_hops = max_hops
+
+        self.hits = 0
+        self.prefix_hits = 0
+        self._urls = collections.OrderedDict()
+        # prefix -> [target prefix, the number of the redirections that agree]
+        self._prefixes = collections.OrderedDict()
+
+    def record(self, url, target, status=301):
+        """Remember the redirection if it's permanent, return True if it's remembered."""
+        if status not in PERMANENT_REDIRECT_STATUSES or url == target:
+            return False
+
+        self._urls[url] = target
+        self._urls.move_to_end(url)
+        if len(self._urls) > self.max_urls:
+            self._urls.popitem(last=False)
+
+        source, target = _split_prefix(url), _split_prefix(target)
+        if source is None or target is None or source[0] == target[0]:
+            return True
+        # only the scheme and the host were changed
+        if source[1] == target[1]:
+            rule = self._prefixes.get(source[0])
+            if rule is not None and rule[0] == target[0]:
+                rule[1] += 1
+                self._prefixes.move_to_end(source[0])
+            else:
+                self._prefixes[source[0]] = [target[0], 1]
+                if len(self._prefixes) > self.max_prefixes:
+                    self._prefixes.popitem(last=False)
+        else:
+            # the site maps the paths, the prefix rule doesn't hold
+            self._prefixes.pop(source[0], None)
+        return True
+
+    def _resolve_prefix(self, url):
+        if not self._prefixes:
+            return url
+        parts = _split_prefix(url)
+        if parts is None:
+            return url
+        rule = self._prefixes.get(parts[0])
+        if rule is None or rule[1] < self.min_evidence:
+            return url
+        self.prefix_hits += 1
+        return rule[0] + parts[1]
+
+    def resolve(self, url):
+        """Return the final target of the known redirections of the URL, the URL itself if unknown."""
+        resolved = url
+        for _ in range(self.max_hops):
+            target = self._urls.get(resolved)
+            if target is None:
+                target = self._resolve_prefix(resolved)
+            else:
+                self._urls.move_to_end(resolved)
+            if target == resolved or target == url:
+                break
+            resolved = target
+
+        if resolved != url:
+            self.hits += 1
+        return resolved
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __repr__(self):
+        return 'RedirectCache (urls: %s, prefixes: %s, hits: %s, prefix hits: %s)' \
+               % (len(self._urls), sum(1 for r in self._prefixes.values() if r[1] >= self.min_evidence),
+                  self.hits, self.prefix_hits)
+
+    __str__ = __repr__
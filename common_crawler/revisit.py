@@ -0,0 +1,188 @@
+"""Conditional revisit crawling by the persistent validators and the change-rate scheduler"""
+import hashlib
+import heapq
+import math
+import os
+import sqlite3
+import time
+
+__all__ = ['ValidatorStore', 'RevisitScheduler', 'estimate_change_rate']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    first_fetched_at REAL,
+    fetched_at REAL,
+    visits INTEGER,
+    changes INTEGER
+)
+'''
+
+_COLUMNS = ('url', 'etag', 'last_modified', 'content_hash',
+            'first_fetched_at', 'fetched_at', 'visits', 'changes')
+
+
+def _header(headers, name):
+    if not headers:
+        return None
+    return headers.get(name) or headers.get(name.lower())
+
+
+class ValidatorStore(object):
+    """
+    The class ValidatorStore persists the validators of each URL (ETag, Last-Modified, the hash of
+    the content, the time of the last fetch) in a SQLite database, so that a later run of the engine
+    can send the conditional request and skip the unchanged pages.
+
+    The visits and the detected changes of each URL are counted for the RevisitScheduler, the updates
+    are committed in batches (every commit_every updates) and on close().
+    """
+
+    def __init__(self, filename='data/validators.db', commit_every=100):
+        """
+        :param filename: the filename of the SQLite database
+        :param commit_every: commit after this number of the updates
+        """
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self.filename = filename
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._db = sqlite3.connect(filename)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def get(self, url):
+        """Return a dict of the validators of the URL or None if never fetched."""
+        row = self._db.execute('SELECT %s FROM validators WHERE url = ?' % ', '.join(_COLUMNS),
+                               (url,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def conditional_headers(self, url):
+        """Return the headers If-None-Match and If-Modified-Since for revisiting the URL."""
+        validators = self.get(url)
+        headers = {}
+        if validators is None:
+            return headers
+        if validators['etag']:
+            headers['If-None-Match'] = validators['etag']
+        if validators['last_modified']:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def update(self, url, headers, text, now=None):
+        """
+        Record a fetched (200) response of the URL.
+
+        :return True if the content changed since the last fetch (or it is the first fetch)
+        """
+        now = now or time.time()
+        data = text.encode('utf-8', errors='replace') if isinstance(text, str) else (text or b'')
+        content_hash = hashlib.sha1(data).hexdigest()
+        etag, last_modified = _header(headers, 'ETag'), _header(headers, 'Last-Modified')
+
+        validators = self.get(url)
+        if validators is None:
+            self._db.execute('INSERT INTO validators VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (url, etag, last_modified, content_hash, now, now, 1, 0))
+            changed = True
+        else:
+            changed = validators['content_hash'] != content_hash
+            self._db.execute('UPDATE validators SET etag = ?, last_modified = ?, content_hash = ?, '
+                             'fetched_at = ?, visits = visits + 1, changes = changes + ? WHERE url = ?',
+                             (etag, last_modified, content_hash, now, 1 if changed else 0, url))
+        self._commit_in_batches()
+        return changed
+
+    def not_modified(self, url, now=None):
+        """Record a revisit of the URL that responded 304 Not Modified."""
+        self._db.execute('UPDATE validators SET fetched_at = ?, visits = visits + 1 WHERE url = ?',
+                         (now or time.time(), url))
+        self._commit_in_batches()
+
+    def _commit_in_batches(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self._db.commit()
+        self._uncommitted = 0
+
+    def __iter__(self):
+        """Iterate the validators of all the URLs."""
+        cursor = self._db.execute('SELECT %s FROM validators' % ', '.join(_COLUMNS))
+        for row in cursor:
+            yield dict(zip(_COLUMNS, row))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM validators').fetchone()[0]
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def estimate_change_rate(visits, changes, first_fetched_at, fetched_at, default_rate=1.0 / 86400):
+    """
+    Return the estimated change rate (changes per second) of a page that is modeled as a Poisson process,
+    by the estimator of Cho and Garcia-Molina: -log((n - X + 0.5) / (n + 0.5)) / I, the n is the number of
+    the revisits, the X is the number of the detected changes and the I is the mean interval of the revisits.
+    """
+    revisits = visits - 1
+    if revisits <= 0 or fetched_at <= first_fetched_at:
+        return default_rate
+
+    interval = (fetched_at - first_fetched_at) / revisits
+    changes = min(changes, revisits)
+    return -math.log((revisits - changes + 0.5) / (revisits + 0.5)) / interval
+
+
+class RevisitScheduler(object):
+    """
+    The class RevisitScheduler orders the URLs of a ValidatorStore for revisiting, each URL is scored by
+    the probability that it has changed since the last fetch: 1 - exp(-rate * elapsed), and schedule()
+    returns the URLs with the highest probability that fit within the fetch budget.
+    """
+
+    def __init__(self, store, default_rate=1.0 / 86400):
+        """
+        :param store: an object ValidatorStore
+        :param default_rate: the change rate (changes per second) of the URL that only fetched once
+        """
+        self.store = store
+        self.default_rate = default_rate
+
+    def probability_changed(self, validators, now=None):
+        now = now or time.time()
+        rate = estimate_change_rate(validators['visits'],
+                                    validators['changes'],
+                                    validators['first_fetched_at'],
+                                    validators['fetched_at'],
+                                    self.default_rate)
+        return 1 - math.exp(-rate * max(0, now - validators['fetched_at']))
+
+    def schedule(self, budget, now=None):
+        """
+        Return a list of at most budget URLs which ordered by the probability of the change (descending),
+        None represent disabled and a negative number represent all known URLs.
+        """
+        if budget is None or budget == 0:
+            return []
+        now = now or time.time()
+        scored = ((self.probability_changed(v, now), v['url']) for v in self.store)
+        if budget < 0:
+            return [url for _, url in sorted(scored, reverse=True)]
+        return [url for _, url in heapq.nlargest(budget, scored)]
@@ -0,0 +1,293 @@
+"""The robots.txt of the hosts: fetched once per host, compiled into the matchers and cached"""
+import asyncio
+import collections
+import re
+import time
+
+__all__ = ['RobotsRules', 'RobotsCache', 'parse_robots']
+
+# the maximum size of a robots.txt that parsed, RFC 9309 requires at least 500 KiB
+MAX_ROBOTS_SIZE = 500 * 1024
+
+
+def _host_key(url):
+    """scheme://host of the URL (lowercase), None if the URL is not absolute"""
+    i = url.find('://')
+    if i == -1:
+        return None
+    j = url.find('/', i + 3)
+    return (url if j == -1 else url[:j]).lower()
+
+
+def _path_of(url):
+    """The path and the query of the URL, the fragment is removed"""
+    i = url.find('://')
+    j = url.find('/', i + 3) if i != -1 else 0
+    path = '/' if j == -1 else url[j:]
+    return path.split('#', 1)[0] or '/'
+
+
+def _compile(pattern):
+    """Return a function that returns True if a path matches the pattern of a rule."""
+    if '*' not in pattern and not pattern.endswith('$'):
+        return lambda path: path.startswith(pattern)
+
+    anchored = pattern.endswith('$')
+    if anchored:
+        pattern = pattern[:-1]
+    regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+    return re.compile(regex + (r'\Z' if anchored else '')).match
+
+
+class RobotsRules(object):
+    """
+    The class RobotsRules is the compiled group of a robots.txt for a user agent, each rule is a prefix
+    (str.startswith) or a regex if it has the wildcards (* and $), the longest matched rule decides and
+    the Allow wins a tie (RFC 9309).
+    """
+
+    def __init__(self, rules=(), crawl_delay=None, sitemaps=(), disallow_all=False):
+        """
+        :param rules: a list of the tuples (allow, pattern)
+        :param crawl_delay: the seconds of the Crawl-delay, None if not specified
+        :param sitemaps: the URLs of the Sitemap lines
+        :param disallow_all: disallow every path (e.g. the robots.txt is unreachable)
+        """
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+        self.disallow_all = disallow_all
+        # the longest first and the Allow first when the lengths are equal
+        ordered = sorted(((allow, pattern) for allow, pattern in rules if pattern),
+                         key=lambda r: (-len(r[1]), not r[0]))
+        self._rules = [(allow, _compile(pattern)) for allow, pattern in ordered]
+
+    def allowed(self, url):
+        """Return True if the URL (or a path starts with /) can be fetched."""
+        if self.disallow_all:
+            return False
+        if not self._rules:
+            return True
+        path = url if url.startswith('/') else _path_of(url)
+        if path == '/robots.txt':
+            return True
+        for allow, match in self._rules:
+            if match(path):
+                return allow
+        return True
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __repr__(self):
+        return 'RobotsRules (rules: %s, crawl delay: %s, disallow all: %s)' \
+               % (len(self._rules), self.crawl_delay, self.disallow_all)
+
+    __str__ = __repr__
+
+
+ALLOW_ALL = RobotsRules()
+DISALLOW_ALL = RobotsRules(disallow_all=True)
+
+
+def parse_robots(text, user_agent):
+    """
+    Parse a robots.txt and return the RobotsRules of the user agent, the groups that name the product
+    token of the user agent (e.g. common_crawler of common_crawler/1.0) are merged, otherwise the groups of "*".
+    """
+    token = user_agent.split('/', 1)[0].strip().lower()
+    groups = []
+    sitemaps = []
+    agents, rules, delay = [], [], None
+    in_rules = False
+
+    for line in text[:MAX_ROBOTS_SIZE].splitlines():
+        line = line.split('#', 1)[0].strip()
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        key, value = key.strip().lower(), value.strip()
+
+        if key == 'user-agent':
+            # a user-agent line after the rules starts a new group
+            if in_rules:
+                groups.append((agents, rules, delay))
+                agents, rules, delay = [], [], None
+                in_rules = False
+            agents.append(value.lower())
+        elif key in ('allow', 'disallow'):
+            in_rules = True
+            if agents:
+                rules.append((key == 'allow', value))
+        elif key == 'crawl-delay':
+            in_rules = True
+            try:
+                delay = float(value)
+            except ValueError:
+                pass
+        elif key == 'sitemap':
+            sitemaps.append(value)
+    if agents:
+        groups.append((agents, rules, delay))
+
+    matched = [g for g in groups if token in g[0]] \
+        or [g for g in groups if '*' in g[0]]
+    merged_rules, merged_delay = [], None
+    for _, group_rules, group_delay in matched:
+        merged_rules.extend(group_rules)
+        if group_delay is not None:
+            merged_delay = max(merged_delay or 0, group_delay)
+    return RobotsRules(merged_rules, crawl_delay=merged_delay, sitemaps=sitemaps)
+
+
+class RobotsCache(object):
+    """
+    The class RobotsCache fetches the robots.txt of each host (scheme://host) once, the concurrent
+    requests for the robots.txt of the same host await the same future, the results are cached in
+    a LRU map (at most max_hosts hosts) and expire after the ttl (the error_ttl if it was unreachable).
+
+    The status of the robots.txt decides the rules (RFC 9309): 2xx is parsed, 4xx allows all, 5xx
+    and the network errors disallow all until the error_ttl expired.
+
+    The function allowed() only consults the cache (it's synchronous for filtering the URLs before
+    they are enqueued, an unknown host is allowed), the crawler checks fetch() again before a fetch.
+    The function reserve() is the per-host scheduling of the Crawl-delay, it returns the seconds that
+    the caller should wait before requesting the host.
+    """
+
+    def __init__(self,
+                 http_client,
+                 user_agent='common_crawler',
+                 ttl=24 * 3600,
+                 error_ttl=600,
+                 max_hosts=10000,
+                 max_crawl_delay=30,
+                 clock=time.monotonic):
+        """
+        :param http_client: the client for requesting the robots.txt
+        :param user_agent: the product token that matched with the User-agent lines
+        :param ttl: the seconds that a fetched robots.txt is cached
+        :param error_ttl: the seconds that an unreachable robots.txt (disallow all) is cached
+        :param max_hosts: the maximum number of the cached hosts
+        :param max_crawl_delay: the Crawl-delay is limited to this value (seconds)
+        """
+        self.http_client = http_client
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_hosts = max_hosts
+        self.max_crawl_delay = max_crawl_delay
+        self.clock = clock
+
+        self.fetched = 0
+        self.errors = 0
+        self.deduplicated = 0
+        self.disallowed = 0
+        self.delayed = 0
+        # host -> (RobotsRules, the time of expiration)
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        # host -> the earliest time of the next request
+        self._next_slot = {}
+
+    def cached(self, url):
+        """Return the cached RobotsRules of the host of the URL, None if unknown or expired."""
+        key = _host_key(url)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self.clock():
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def allowed(self, url):
+        """Return False if the cached robots.txt disallows the URL, an unknown host is allowed."""
+        rules = self.cached(url)
+        if rules is not None and not rules.allowed(url):
+            self.disallowed += 1
+            return False
+        return True
+
+    async def fetch(self, url):
+        """Return the RobotsRules of the host of the URL, the robots.txt is requested if not cached."""
+        rules = self.cached(url)
+        if rules is not None:
+            return rules
+        key = _host_key(url)
+        if key is None:
+            return ALLOW_ALL
+
+        future = self._pending.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return await future
+
+        future = asyncio.get_event_loop().create_future()
+        self._pending[key] = future
+        try:
+            rules, ttl = await self._download(key)
+            self._store(key, rules, ttl)
+            future.set_result(rules)
+            return rules
+        except BaseException as e:
+            future.set_exception(e)
+            # the exception is raised by the caller, the waiters retrieve it by themselves
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def _download(self, key):
+        """Return a tuple (RobotsRules, ttl) of the robots.txt of the host."""
+        self.fetched += 1
+        try:
+            async with self.http_client.get(key + '/robots.txt') as response:
+                status = response.status
+                text = await response.text() if 200 <= status < 300 else ''
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.errors += 1
+            return DISALLOW_ALL, self.error_ttl
+
+        if 200 <= status < 300:
+            return parse_robots(text or '', self.user_agent), self.ttl
+        if 400 <= status < 500:
+            return ALLOW_ALL, self.ttl
+        self.errors += 1
+        return DISALLOW_ALL, self.error_ttl
+
+    def _store(self, key, rules, ttl):
+        self._entries[key] = (rules, self.clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_hosts:
+            evicted, _ = self._entries.popitem(last=False)
+            self._next_slot.pop(evicted, None)
+
+    async def can_fetch(self, url):
+        """Return True if the robots.txt of the host allows the URL, the robots.txt is fetched if needed."""
+        rules = await self.fetch(url)
+        if not rules.allowed(url):
+            self.disallowed += 1
+            return False
+        return True
+
+    def reserve(self, url):
+        """Reserve the next request slot of the host by its Crawl-delay, return the seconds to wait."""
+        rules = self.cached(url)
+        if rules is None or not rules.crawl_delay:
+            return 0
+        key = _host_key(url)
+        now = self.clock()
+        slot = max(now, self._next_slot.get(key, now))
+        self._next_slot[key] = slot + min(rules.crawl_delay, self.max_crawl_delay)
+        if slot > now:
+            self.delayed += 1
+        return slot - now
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return 'RobotsCache (hosts: %s, fetched: %s, errors: %s, deduplicated: %s, disallowed: %s, delayed: %s)' \
+               % (len(self._entries), self.fetched, self.errors, self.deduplicated, self.disallowed, self.delayed)
+
+    __str__ = __repr__
@@ -0,0 +1,121 @@
+"""The seed source streams root URLs into the frontier of the crawler lazily"""
+import gzip
+from abc import ABC, abstractmethod
+
+from common_crawler.utils.misc import arg_to_iter
+from common_crawler.utils.url import revise_urls
+
+__all__ = ['SeedSource', 'IterableSeedSource', 'FileSeedSource', 'to_seed_source']
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+class SeedSource(ABC):
+    """
+    The class SeedSource represents a stream of root URLs, the Crawler pulls a batch of URLs
+    from it by the function take() only when the task queue drops below the low-water mark,
+    so that millions of root URLs never need to sit in memory at the same time.
+
+    Each URL is normalized (by common_crawler.utils.url.revise_urls) while streaming, the seed source
+    keeps nothing of the emitted URLs, the duplicates are rejected exactly by the seen_urls of the Crawler.
+    """
+
+    def __init__(self, strict=True):
+        """
+        :param strict: see the common_crawler.configuration
+        """
+        self.strict = strict
+        self.exhausted = False
+        self.emitted = 0
+        self._iterator = None
+
+    @abstractmethod
+    def _iter_raw(self):
+        """Return an iterator of the raw URL strings, the subclass implementation."""
+        raise NotImplementedError
+
+    def take(self, n):
+        """Return a list of at most n normalized URLs."""
+        result = []
+        if self.exhausted:
+            return result
+
+        if self._iterator is None:
+            self._iterator = iter(self._iter_raw())
+
+        while len(result) < n:
+            try:
+                raw = next(self._iterator)
+            except StopIteration:
+                self.exhausted = True
+                self.close()
+                break
+
+            raw = raw.strip()
+            if not raw or raw.startswith('#'):
+                continue
+
+            result.extend(revise_urls((raw,), self.strict))
+
+        self.emitted += len(result)
+        return result
+
+    def close(self):
+        """Release all acquired resources"""
+        pass
+
+    def __repr__(self):
+        return '%s (emitted: %s, exhausted: %s)' \
+               % (self.__class__.__name__, self.emitted, self.exhausted)
+
+    __str__ = __repr__
+
+
+class IterableSeedSource(SeedSource):
+    """
+    Stream the root URLs from an iterable object such as a tuple or a generator.
+    """
+
+    def __init__(self, iterable, **kwargs):
+        super(IterableSeedSource, self).__init__(**kwargs)
+        self.iterable = iterable
+
+    def _iter_raw(self):
+        return arg_to_iter(self.iterable)
+
+
+class FileSeedSource(SeedSource):
+    """
+    Stream the root URLs from a text file that one URL per line, the gzip file is
+    detected by its magic number, lines start with "#" are comments.
+    """
+
+    def __init__(self, filename, encoding='utf-8', **kwargs):
+        super(FileSeedSource, self).__init__(**kwargs)
+        self.filename = filename
+        self.encoding = encoding
+        self._file = None
+
+    def _iter_raw(self):
+        with open(self.filename, 'rb') as f:
+            is_gzip = f.read(2) == _GZIP_MAGIC
+
+        if is_gzip:
+            self._file = gzip.open(self.filename, 'rt', encoding=self.encoding, errors='replace')
+        else:
+            self._file = open(self.filename, 'r', encoding=self.encoding, errors='replace')
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def to_seed_source(roots, strict=True):
+    """
+    Return the roots itself if it is a SeedSource otherwise wrap it as an IterableSeedSource.
+    """
+    if isinstance(roots, SeedSource):
+        return roots
+    return IterableSeedSource(roots, strict=strict)
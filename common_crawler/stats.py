@@ -0,0 +1,139 @@
+"""The streaming statistics of the finished tasks"""
+import collections
+import os
+
+from common_crawler.instrument import Histogram
+
+__all__ = ['CrawlStats', 'iter_spilled']
+
+_SPILL_FIELDS = ('url', 'status', 'content_type', 'content_length', 'retries', 'redirects', 'error')
+
+
+def _clean(value):
+    return '' if value is None else str(value).replace('\t', ' ').replace('\n', ' ')
+
+
+class CrawlStats(object):
+    """
+    The class CrawlStats replaces the list of the finished tasks, each finished task is folded into
+    the counters and the histograms then dropped, so the memory doesn't grow with the size of the crawl.
+
+    Only the most recent tasks (a bounded deque) are kept for inspecting, and if the spill_filename is
+    specified, a compact record (URL, status, content type, content length, retries, redirects, error)
+    of each task is appended to the file as a tab-separated line, see iter_spilled().
+
+    It has the function add() so that it can be the finished_urls of a crawler.
+    """
+
+    def __init__(self, spill_filename=None, recent_size=100, buffer_size=1 << 16):
+        """
+        :param spill_filename: the file for appending the records of the tasks, None represent no spill
+        :param recent_size: the number of the most recent tasks that kept
+        :param buffer_size: the size (bytes) of the write buffer of the spill file
+        """
+        self.total = 0
+        self.valid = 0
+        self.invalid = 0
+        self.ignored = 0
+        self.retries = 0
+        self.redirects = 0
+        self.statuses = collections.Counter()
+        self.exceptions = collections.Counter()
+        self.content_types = collections.Counter()
+        self.content_lengths = Histogram()
+        self.recent = collections.deque(maxlen=recent_size)
+        self.recent_invalid = collections.deque(maxlen=recent_size)
+
+        self.spill_filename = spill_filename
+        self._spill = None
+        if spill_filename:
+            dirname = os.path.dirname(spill_filename)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self._spill = open(spill_filename, 'a', encoding='utf-8', buffering=buffer_size)
+
+    def add(self, task):
+        """Fold a finished task (None represent an ignored URL) into the statistics."""
+        if task is None:
+            self.ignored += 1
+            return
+
+        self.total += 1
+        self.retries += task.retries_num
+        self.redirects += task.redirect_num
+        self.recent.append(task)
+
+        response = task.response
+        if task.exception is not None:
+            self.invalid += 1
+            self.exceptions[task.exception.__class__.__name__] += 1
+            self.recent_invalid.append(task)
+        else:
+            self.valid += 1
+
+        if response is not None:
+            self.statuses[response.status] += 1
+            if response.content_type:
+                self.content_types[response.content_type] += 1
+            if response.content_length is not None:
+                self.content_lengths.record(response.content_length)
+
+        if self._spill is not None:
+            self._spill.write('\t'.join(map(_clean, (
+                task.url,
+                response.status if response is not None else None,
+                response.content_type if response is not None else None,
+                response.content_length if response is not None else None,
+                task.retries_num,
+                task.redirect_num,
+                task.exception)))
+                              + '\n')
+
+    append = add
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        """Iterate the most recent tasks."""
+        return iter(self.recent)
+
+    def __contains__(self, task):
+        return task in self.recent
+
+    def report(self, top=10):
+        """Return a list of the lines that summarize the finished tasks."""
+        lines = ['Finished %s tasks: valid %s, invalid %s, ignored %s, retries %s, redirects %s'
+                 % (self.total, self.valid, self.invalid, self.ignored, self.retries, self.redirects),
+                 'Statuses: %s' % ', '.join('%s: %s' % item for item in sorted(self.statuses.items()))]
+        if self.exceptions:
+            lines.append('Exceptions: %s' % ', '.join('%s: %s' % item for item in self.exceptions.most_common(top)))
+        if self.content_types:
+            lines.append('Content types: %s'
+                         % ', '.join('%s: %s' % item for item in self.content_types.most_common(top)))
+        if self.content_lengths.count:
+            lines.append('Content length: p50 %s, p90 %s, p99 %s, max %s bytes'
+                         % (self.content_lengths.percentile(50), self.content_lengths.percentile(90),
+                            self.content_lengths.percentile(99), self.content_lengths.max))
+        for task in self.recent_invalid:
+            lines.append('Invalid: %s error: %s' % (task.url, task.exception))
+        if self.spill_filename:
+            lines.append('The records of the tasks are spilled to %s' % self.spill_filename)
+        return lines
+
+    def flush(self):
+        if self._spill is not None:
+            self._spill.flush()
+
+    def close(self):
+        if self._spill is not None and not self._spill.closed:
+            self._spill.close()
+
+
+def iter_spilled(filename):
+    """Iterate the records (dict) of a spill file that written by the CrawlStats."""
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            values = line.rstrip('\n').split('\t')
+            if len(values) == len(_SPILL_FIELDS):
+                yield dict(zip(_SPILL_FIELDS, values))
@@ -10,7 +10,7 @@ class Task(object):
     __slots__ = [
         'url', 'parsed_data', 'exception',
         'redirect_num', 'retries_num', 'redirect_url',
-        'response',
+        'response', 'depth', 'parent', 'span', 'delayed_url',
     ]
 
     def __init__(self, url,
@@ -19,7 +19,18 @@ class Task(object):
                  redirect_num=0,
                  retries_num=0,
                  redirect_url=None,
-                 response=None):
+                 response=None,
+                 depth=0,
+                 parent=None,
+                 span=None,
+                 delayed_url=None):
+        """
+        :param depth: the number of the links from a root to this task, the root is 0
+        :param parent: the URL of the task that this task was extracted from, None for a root
+        :param span: an object common_crawler.trace.Span if the task is traced, otherwise None
+        :param delayed_url: the URL that the task is waiting for the Crawl-delay of its host to request,
+        its request slot has been reserved, otherwise None
+        """
         self.url = url
         self.parsed_data = parsed_data
         self.exception = exception
@@ -27,11 +38,15 @@ class Task(object):
         self.retries_num = retries_num
         self.redirect_url = redirect_url
         self.response = response
+        self.depth = depth
+        self.parent = parent
+        self.span = span
+        self.delayed_url = delayed_url
 
     def __repr__(self):
-        return 'Task (redirect: %s, redirect url: %s, retries: %s, response: %s)' \
+        return 'Task (depth: %s, redirect: %s, redirect url: %s, retries: %s, response: %s)' \
                % (
-                   self.redirect_num, self.redirect_url,
+                   self.depth, self.redirect_num, self.redirect_url,
                    self.retries_num, str(self.response)
                )
 
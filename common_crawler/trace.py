@@ -0,0 +1,128 @@
+"""The trace spans of the sampled tasks that exported in the Chrome trace event format"""
+import json
+import os
+import random
+import time
+
+__all__ = ['Span', 'Tracer']
+
+_clock = time.perf_counter
+
+
+class Span(object):
+    """
+    The class Span records the timestamped events of a task as it moves through the crawl, from
+    being queued to the pipeline:
+
+        span.begin('fetch')
+        ...
+        span.end('fetch', status=200)
+        span.instant('redirect', location=url)
+
+    A span is exported when it's finished and no one holds it, the AsyncPipeline holds the span
+    until its background handle() is done, see hold() and finish().
+    """
+
+    __slots__ = ['tracer', 'id', 'url', 'created', 'events', '_pending', '_holds']
+
+    def __init__(self, tracer, span_id, url):
+        self.tracer = tracer
+        self.id = span_id
+        self.url = url
+        self.created = _clock()
+        # tuples (name, start, duration or None for an instant, args)
+        self.events = []
+        self._pending = {}
+        self._holds = 1
+
+    def begin(self, name):
+        self._pending[name] = _clock()
+
+    def end(self, name, **args):
+        start = self._pending.pop(name, None)
+        if start is not None:
+            self.events.append((name, start, _clock() - start, args))
+
+    def complete(self, name, start, end=None, **args):
+        """Record an event that started at the start (the result of time.perf_counter())."""
+        self.events.append((name, start, (end if end is not None else _clock()) - start, args))
+
+    def instant(self, name, **args):
+        self.events.append((name, _clock(), None, args))
+
+    def hold(self):
+        """Delay the export until the function finish() is called once more."""
+        self._holds += 1
+
+    def finish(self):
+        self._holds -= 1
+        if self._holds == 0:
+            self.tracer.export(self)
+
+
+class Tracer(object):
+    """
+    The class Tracer samples the tasks and writes their spans to a file in the Chrome trace event
+    format (a JSON array of the events) that can be opened by chrome://tracing or Perfetto, each
+    sampled task is a row (a thread) named by its URL.
+
+    The overhead of an unsampled task is a random number, the number of the sampled tasks is bounded
+    by max_spans so that the file and the overhead stay bounded for a long crawl.
+    """
+
+    def __init__(self, filename, sample_rate=0.01, max_spans=10000, buffer_size=1 << 16, rng=random.random):
+        """
+        :param filename: the file of the trace events
+        :param sample_rate: the probability (0 - 1) that a task is traced
+        :param max_spans: the maximum number of the traced tasks, a negative number represent unlimited
+        :param rng: the function that returns a random number in [0, 1)
+        """
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.max_spans = max_spans
+        self.rng = rng
+        self.sampled = 0
+        self.exported = 0
+        self.epoch = _clock()
+        self.pid = os.getpid()
+
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._file = open(filename, 'w', encoding='utf-8', buffering=buffer_size)
+        self._file.write('[')
+        self._first = True
+
+    def start_span(self, url):
+        """Return a new Span for the task of the URL if it's sampled, otherwise return None."""
+        if self._file is None or 0 <= self.max_spans <= self.sampled or self.rng() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return Span(self, self.sampled, url)
+
+    def _write(self, event):
+        self._file.write(('\n' if self._first else ',\n') + json.dumps(event, sort_keys=True))
+        self._first = False
+
+    def export(self, span):
+        if self._file is None:
+            return
+        self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': span.id, 'args': {'name': span.url}})
+        for name, start, duration, args in span.events:
+            event = {'name': name, 'cat': 'crawl', 'pid': self.pid, 'tid': span.id,
+                     'ts': round((start - self.epoch) * 1e6, 3)}
+            if duration is None:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=round(duration * 1e6, 3))
+            if args:
+                event['args'] = {k: v if isinstance(v, (int, float, bool)) or v is None else str(v)
+                                 for k, v in args.items()}
+            self._write(event)
+        self.exported += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write('\n]\n')
+            self._file.close()
+            self._file = None
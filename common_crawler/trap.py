@@ -0,0 +1,136 @@
+"""Detect the crawler traps (infinite URL spaces) at admission time"""
+import collections
+import re
+from urllib.parse import urlsplit, parse_qsl
+
+from common_crawler.configuration import CONFIGURATION
+
+__all__ = ['TrapDetector', 'url_template']
+
+_DIGITS_REGEX = re.compile(r'\d+')
+
+REASON_URL_LENGTH = 'url_length'
+REASON_PATH_DEPTH = 'path_depth'
+REASON_REPEATED_SEGMENTS = 'repeated_segments'
+REASON_QUERY_PARAMS = 'query_params'
+REASON_TEMPLATE = 'template'
+
+
+def url_template(parts):
+    """
+    Return the template of a URL (the result of urlsplit), the digits of the path are replaced
+    by "#" and the query is replaced by its sorted parameter names, e.g.:
+
+        https://www.example.com/calendar/2018/05/12?day=1&view=week
+        -> www.example.com/calendar/#/#/#?day&view
+    """
+    path = _DIGITS_REGEX.sub('#', parts.path)
+    keys = sorted(set(k for k, _ in parse_qsl(parts.query, keep_blank_values=True)))
+    return '%s%s?%s' % (parts.netloc.lower(), path, '&'.join(keys))
+
+
+class TrapDetector(object):
+    """
+    The class TrapDetector decides whether a URL should be admitted into the task queue,
+    it rejects the URLs that look like an infinite URL space:
+
+        - the URL is too long
+        - the path is too deep
+        - a path segment repeats too many times (/a/b/a/b/a/b/...)
+        - the query has too many parameters (ever-growing query strings)
+        - the template (see url_template()) has produced too many distinct URLs (endless calendars)
+
+    The statistics are kept per host. The function admit() only checks a URL, the caller calls record()
+    once the URL is enqueued, so a URL that rejected by the other checks (e.g. the robots.txt or the budget)
+    is not counted. The templates count the recorded URLs (the crawler records each distinct URL once) and at
+    most max_templates templates are tracked, the least recently used one is dropped when it's full.
+    """
+
+    def __init__(self,
+                 max_url_length=CONFIGURATION.get('trap_max_url_length', 2048),
+                 max_path_depth=CONFIGURATION.get('trap_max_path_depth', 16),
+                 max_repeated_segments=CONFIGURATION.get('trap_max_repeated_segments', 2),
+                 max_query_params=CONFIGURATION.get('trap_max_query_params', 12),
+                 max_urls_per_template=CONFIGURATION.get('trap_max_urls_per_template', 10000),
+                 max_templates=CONFIGURATION.get('trap_max_templates', 100000)):
+        """
+        The params see the common_crawler.configuration, None or a non-positive number
+        represent that the check is disabled.
+        """
+        self.max_url_length = max_url_length
+        self.max_path_depth = max_path_depth
+        self.max_repeated_segments = max_repeated_segments
+        self.max_query_params = max_query_params
+        self.max_urls_per_template = max_urls_per_template
+        self.max_templates = max_templates
+
+        self.admitted = 0
+        self.rejected = collections.Counter()
+        self.rejected_hosts = collections.Counter()
+        self.trapped_templates = set()
+        # template -> the number of the recorded URLs
+        self._templates = collections.OrderedDict()
+
+    @staticmethod
+    def _exceeds(value, limit):
+        return limit is not None and limit > 0 and value > limit
+
+    def check(self, url):
+        """Return the reason if the URL should be rejected, otherwise return None."""
+        if self._exceeds(len(url), self.max_url_length):
+            return REASON_URL_LENGTH
+
+        parts = urlsplit(url)
+        segments = [s for s in parts.path.split('/') if s]
+        if self._exceeds(len(segments), self.max_path_depth):
+            return REASON_PATH_DEPTH
+
+        if segments and self._exceeds(max(collections.Counter(segments).values()),
+                                      self.max_repeated_segments):
+            return REASON_REPEATED_SEGMENTS
+
+        if parts.query and self._exceeds(parts.query.count('&') + 1, self.max_query_params):
+            return REASON_QUERY_PARAMS
+
+        if self._template_limited and url_template(parts) in self.trapped_templates:
+            return REASON_TEMPLATE
+
+        return None
+
+    @property
+    def _template_limited(self):
+        return self.max_urls_per_template is not None and self.max_urls_per_template > 0
+
+    def admit(self, url):
+        """Return True if the URL passes the checks, otherwise record the reason and return False."""
+        reason = self.check(url)
+        if reason is None:
+            return True
+
+        self.rejected[reason] += 1
+        self.rejected_hosts[urlsplit(url).netloc.lower()] += 1
+        return False
+
+    def record(self, url):
+        """Count a URL that admitted into the task queue, its template is trapped if it produced too many URLs."""
+        self.admitted += 1
+        if not self._template_limited:
+            return
+
+        template = url_template(urlsplit(url))
+        if template in self.trapped_templates:
+            return
+        templates = self._templates
+        count = templates.pop(template, 0) + 1
+        if count >= self.max_urls_per_template:
+            self.trapped_templates.add(template)
+            return
+        templates[template] = count
+        if self.max_templates is not None and 0 < self.max_templates < len(templates):
+            templates.popitem(last=False)
+
+    def __repr__(self):
+        return 'TrapDetector (admitted: %s, rejected: %s, tracked templates: %s, trapped templates: %s)' \
+               % (self.admitted, dict(self.rejected), len(self._templates), len(self.trapped_templates))
+
+    __str__ = __repr__
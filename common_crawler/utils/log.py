@@ -0,0 +1,95 @@
+"""The logging helpers that keep the file I/O and the bursts of the per URL messages off the event loop"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+
+__all__ = ['RateLimitFilter', 'start_queue_logging', 'stop_queue_logging']
+
+_listeners = []
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    The class RateLimitFilter limits the records of each message template (the msg before the %
+    formatting, e.g. 'Redirect to %s from %s') by a token bucket, so a burst of the per URL messages
+    costs a dict lookup for each dropped record rather than the formatting and the I/O.
+
+    The records of the level WARNING or above are never dropped, the next passed record of a template
+    tells the number of the dropped records since the last one.
+    """
+
+    def __init__(self, rate=10.0, burst=None, level=logging.WARNING, max_templates=1024, clock=time.monotonic):
+        """
+        :param rate: the number of the records of a template per second
+        :param burst: the maximum number of the records of a template at once, default is the rate
+        :param level: the records of this level or above are never dropped
+        :param max_templates: the maximum number of the tracked templates, the buckets are reset when exceeded
+        """
+        super(__class__, self).__init__()
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.level = level
+        self.max_templates = max_templates
+        self.clock = clock
+        self.dropped = 0
+        # template -> [tokens, the time of the last refill, dropped since the last passed record]
+        self._buckets = {}
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+
+        key = (record.name, record.msg)
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_templates:
+                self._buckets.clear()
+            bucket = self._buckets[key] = [self.burst, now, 0]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            self.dropped += 1
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            record.msg = '%s (%s similar messages suppressed)' % (record.msg, bucket[2])
+            bucket[2] = 0
+        return True
+
+
+def start_queue_logging(handlers, logger=None):
+    """
+    Move the handlers behind a QueueHandler, the records are put into a queue by the caller and the
+    handlers write them on the thread of a QueueListener, so the event loop never waits for the I/O.
+
+    :param handlers: the handlers that write the records (e.g. StreamHandler, FileHandler)
+    :param logger: the logger that the QueueHandler is added to, None represent only return the QueueHandler
+    :return the QueueHandler, its attribute listener is the started QueueListener
+    """
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    handler = logging.handlers.QueueHandler(records)
+    handler.listener = listener
+    listener.start()
+    _listeners.append(listener)
+    if logger is not None:
+        logger.addHandler(handler)
+    return handler
+
+
+def stop_queue_logging():
+    """Stop the started listeners, each one writes the records that remained in its queue before stopping."""
+    while _listeners:
+        listener = _listeners.pop()
+        if listener._thread is not None:
+            listener.stop()
+
+
+atexit.register(stop_queue_logging)
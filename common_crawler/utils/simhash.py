@@ -0,0 +1,114 @@
+"""SimHash fingerprint and the index for finding the near-duplicate pages"""
+import collections
+import hashlib
+import re
+
+__all__ = ['tokenize', 'simhash', 'hamming_distance', 'SimhashIndex']
+
+_TAG_REGEX = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]*>', re.S | re.I)
+_WORD_REGEX = re.compile(r'\w+', re.U)
+
+_FINGERPRINT_BITS = 64
+_FINGERPRINT_BYTES = _FINGERPRINT_BITS // 8
+
+
+def tokenize(text, shingle_size=3):
+    """
+    Return the features (word shingles) of the specified HTML or plain text,
+    the tags, scripts and styles are removed first.
+    """
+    words = _WORD_REGEX.findall(_TAG_REGEX.sub(' ', text).lower())
+    if len(words) < shingle_size:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+
+def simhash(features):
+    """
+    Return the 64 bits SimHash fingerprint of the features (an iterable of the string).
+
+    The weights are accumulated per byte value of the token hash (8 table updates for each
+    feature rather than 64 bit tests) then the table is folded into the per bit weights
+    once, so the cost of a page is linear in the number of the features with a small constant.
+    """
+    counts = collections.Counter(features)
+    if not counts:
+        return 0
+
+    tables = [[0] * 256 for _ in range(_FINGERPRINT_BYTES)]
+    total = 0
+    for feature, weight in counts.items():
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=_FINGERPRINT_BYTES).digest()
+        for i, byte in enumerate(digest):
+            tables[i][byte] += weight
+        total += weight
+
+    fingerprint = 0
+    for i, table in enumerate(tables):
+        for bit in range(8):
+            mask = 1 << bit
+            weight = sum(w for value, w in enumerate(table) if value & mask)
+            # set the bit if the weight of the features that have the bit is the majority
+            if weight * 2 > total:
+                fingerprint |= 1 << (i * 8 + bit)
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class SimhashIndex(object):
+    """
+    The index answers whether there is a fingerprint within k bits of the specific fingerprint.
+
+    By the pigeonhole principle, two fingerprints within k bits must be equal in at least
+    one of k + 1 blocks, so each fingerprint is stored in k + 1 buckets that keyed by
+    (block number, block value) and a query only compares the candidates in its own buckets.
+    """
+
+    def __init__(self, k=3):
+        """
+        :param k: the maximum hamming distance of the near-duplicate fingerprints
+        """
+        if not 0 <= k < _FINGERPRINT_BITS:
+            raise ValueError('The k must be in [0, %s), got %s' % (_FINGERPRINT_BITS, k))
+
+        self.k = k
+        self.size = 0
+        self._buckets = collections.defaultdict(list)
+
+        blocks = k + 1
+        width, extra = divmod(_FINGERPRINT_BITS, blocks)
+        self._blocks = []
+        offset = 0
+        for i in range(blocks):
+            w = width + (1 if i < extra else 0)
+            self._blocks.append((offset, (1 << w) - 1))
+            offset += w
+
+    def _keys(self, fingerprint):
+        return [(i, (fingerprint >> offset) & mask) for i, (offset, mask) in enumerate(self._blocks)]
+
+    def find(self, fingerprint):
+        """Return a stored fingerprint within k bits of the specific fingerprint or None."""
+        for key in self._keys(fingerprint):
+            for candidate in self._buckets.get(key, ()):
+                if hamming_distance(candidate, fingerprint) <= self.k:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        for key in self._keys(fingerprint):
+            self._buckets[key].append(fingerprint)
+        self.size += 1
+
+    def add_if_new(self, fingerprint):
+        """Add the fingerprint and return True if there is no near-duplicate of it, otherwise return False."""
+        if self.find(fingerprint) is not None:
+            return False
+        self.add(fingerprint)
+        return True
+
+    def __len__(self):
+        return self.size
@@ -74,7 +74,7 @@ def revise_urls(roots, strict=True):
 
 
 def is_redirect(status):
-    return status in (300, 301, 302, 303, 307)
+    return status in (300, 301, 302, 303, 307, 308)
 
 
 def get_domain(url):
@@ -0,0 +1,83 @@
+import unittest
+
+from benchmarks import percentiles, compare_with_baseline
+from benchmarks.link_extraction import generate_corpus, run, STAGES
+from benchmarks.site import SyntheticSite
+
+
+class BenchmarksTest(unittest.TestCase):
+    def test_percentiles(self):
+        result = percentiles(list(range(1, 101)))
+        self.assertEqual({'p50': 50, 'p90': 90, 'p99': 99, 'max': 100}, result)
+        self.assertEqual({'p50': 0, 'max': 0}, percentiles([], ps=(50,)))
+
+    def test_compare_with_baseline(self):
+        baseline = {'pages_per_second': 100, 'stages': {'fetch': {'p99': 10}}}
+        metrics = (('pages_per_second', True), ('stages.fetch.p99', False), ('missing', True))
+
+        report = {'pages_per_second': 95, 'stages': {'fetch': {'p99': 10.5}}}
+        self.assertEqual([], compare_with_baseline(report, baseline, metrics, tolerance=0.1))
+
+        report = {'pages_per_second': 80, 'stages': {'fetch': {'p99': 20}}}
+        self.assertEqual([('pages_per_second', 100, 80), ('stages.fetch.p99', 10, 20)],
+                         compare_with_baseline(report, baseline, metrics, tolerance=0.1))
+
+
+class SyntheticSiteTest(unittest.TestCase):
+    def test_deterministic(self):
+        site = SyntheticSite(hosts=2, pages_per_host=50, seed=1)
+        self.assertEqual(site.page(0, '/page/3'), SyntheticSite(hosts=2, pages_per_host=50, seed=1).page(0, '/page/3'))
+        self.assertNotEqual(site.page(0, '/page/3'), SyntheticSite(hosts=2, pages_per_host=50, seed=2).page(0, '/page/3'))
+
+    def test_page(self):
+        site = SyntheticSite(hosts=1, pages_per_host=10, fan_out=5, min_page_size=1000, max_page_size=1000,
+                             latency=0, error_rate=0, redirect_rate=0, trap_rate=0)
+        status, headers, body, latency = site.page(0, '/page/1')
+        self.assertEqual(200, status)
+        self.assertEqual(0, latency)
+        self.assertEqual(5, body.count('<a href="/page/'))
+        self.assertGreaterEqual(len(body), 1000)
+        self.assertEqual(404, site.page(0, '/page/10')[0])
+
+    def test_errors_redirects_and_traps(self):
+        site = SyntheticSite(hosts=1, pages_per_host=10, latency=0, error_rate=1)
+        self.assertEqual(500, site.page(0, '/page/1')[0])
+
+        site = SyntheticSite(hosts=1, pages_per_host=10, latency=0, error_rate=0, redirect_rate=1)
+        status, headers, _, _ = site.page(0, '/page/1')
+        self.assertEqual(301, status)
+        self.assertEqual(200, site.page(0, headers['Location'])[0])
+
+        site = SyntheticSite(hosts=1, pages_per_host=10, latency=0, error_rate=0, redirect_rate=0, trap_rate=1)
+        self.assertIn('/calendar/', site.page(0, '/page/1')[2])
+        self.assertIn('/calendar/2019/1"', site.page(0, '/calendar/2018/12')[2])
+
+    def test_latency(self):
+        for distribution in ('fixed', 'uniform', 'exponential', 'lognormal'):
+            site = SyntheticSite(latency=0.01, latency_distribution=distribution)
+            self.assertGreaterEqual(site.page(0, '/page/1')[3], 0)
+        self.assertEqual(0.01, SyntheticSite(latency=0.01, latency_distribution='fixed').page(0, '/page/1')[3])
+        self.assertRaises(ValueError, SyntheticSite, latency_distribution='normal')
+
+
+class LinkExtractionBenchmarkTest(unittest.TestCase):
+    def test_generate_corpus(self):
+        profiles = (('tiny', 2, 5), ('dense', 2, 50))
+        corpus = generate_corpus(pages_per_profile=2, seed=1, profiles=profiles)
+        self.assertEqual(4, len(corpus))
+        self.assertEqual(['tiny', 'tiny', 'dense', 'dense'], [name for name, _, _ in corpus])
+        self.assertEqual(corpus, generate_corpus(pages_per_profile=2, seed=1, profiles=profiles))
+
+    def test_run(self):
+        corpus = generate_corpus(pages_per_profile=1, profiles=(('tiny', 2, 20),))
+        report = run(corpus, repeat=1)
+        self.assertEqual(1, report['pages'])
+        # the anchors and the area of the map
+        self.assertEqual(21, report['links'])
+        for stage in STAGES + ('total',):
+            self.assertGreaterEqual(report['per_page'][stage], 0)
+        self.assertIn('tiny', report['profiles'])
+
+
+if __name__ == '__main__':
+    unittest.main()
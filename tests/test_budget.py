@@ -0,0 +1,51 @@
+import time
+import unittest
+
+from common_crawler.budget import CrawlBudget
+
+
+class TestCrawlBudget(unittest.TestCase):
+    """Test for common_crawler.budget"""
+
+    def test_unlimited(self):
+        budget = CrawlBudget(max_depth=-1, max_pages_per_host=-1, max_pages=None, max_time=-1)
+        for i in range(100):
+            self.assertTrue(budget.admit('https://www.example.com/%s' % i, depth=i))
+        self.assertFalse(budget.exhausted)
+
+    def test_max_depth(self):
+        budget = CrawlBudget(max_depth=2)
+        self.assertTrue(budget.admit('https://www.example.com/a', depth=2))
+        self.assertFalse(budget.admit('https://www.example.com/b', depth=3))
+        self.assertEqual(budget.rejected['depth'], 1)
+
+    def test_max_pages_per_host(self):
+        budget = CrawlBudget(max_pages_per_host=2)
+        self.assertTrue(budget.admit('https://www.example.com/a'))
+        self.assertTrue(budget.admit('https://www.example.com/b'))
+        self.assertFalse(budget.admit('https://www.example.com/c'))
+        self.assertTrue(budget.admit('https://www.python.org/a'))
+        self.assertFalse(budget.exhausted)
+
+    def test_max_pages(self):
+        budget = CrawlBudget(max_pages=2)
+        self.assertTrue(budget.admit('https://www.example.com/a'))
+        self.assertTrue(budget.admit('https://www.python.org/a'))
+        self.assertTrue(budget.exhausted)
+        self.assertFalse(budget.admit('https://www.quora.com/a'))
+        self.assertEqual(budget.admitted, 2)
+
+    def test_max_time(self):
+        budget = CrawlBudget(max_time=0.05)
+        self.assertFalse(budget.expired)
+        self.assertTrue(budget.admit('https://www.example.com/a'))
+        time.sleep(0.06)
+        self.assertTrue(budget.expired)
+        self.assertTrue(budget.exhausted)
+        self.assertFalse(budget.admit('https://www.example.com/b'))
+        budget.start()
+        self.assertFalse(budget.expired)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,16 @@
 import asyncio
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
+from common_crawler.budget import CrawlBudget
 from common_crawler.crawler.async import AsyncCrawler
+from common_crawler.governor import MemoryGovernor
+from common_crawler.redirect import RedirectCache
+from common_crawler.revisit import ValidatorStore
+from common_crawler.robots import RobotsCache
+from common_crawler.trap import TrapDetector
 from tests.mock import FakedObject
 
 _MOCKED_TARGET = 'common_crawler.http.client.aiohttp.AioHttpClient.get'
@@ -28,6 +36,45 @@ async def _TEXT():
     return _BODY
 
 
+class FakedHttpClient(object):
+    """Return the same response for every request without touching the network"""
+
+    def __init__(self, response):
+        self.response = response
+        self.requested = []
+        self.request_headers = []
+
+    def get(self, url, *args, **kwargs):
+        self.requested.append(url)
+        self.request_headers.append(kwargs.get('headers'))
+        return self.response
+
+    async def get_response(self, response):
+        return FakedObject(url=response.url,
+                           status=response.status,
+                           headers=response.headers,
+                           charset=response.charset,
+                           content_type=response.content_type,
+                           content_length=response.content_length,
+                           reason=response.reason,
+                           text=await response.text())
+
+    async def close(self):
+        pass
+
+
+class RoutingHttpClient(FakedHttpClient):
+    """Return the response of the requested URL"""
+
+    def __init__(self, responses):
+        super(RoutingHttpClient, self).__init__(None)
+        self.responses = responses
+
+    def get(self, url, *args, **kwargs):
+        super(RoutingHttpClient, self).get(url, *args, **kwargs)
+        return self.responses[url]
+
+
 class AsyncCrawlerLauncher(object):
     def __init__(self, crawler, work, max_task=10):
         self.max_task = max_task
@@ -137,6 +184,332 @@ class AsyncCrawlerTest(unittest.TestCase):
 
         asyncio.get_event_loop().run_until_complete(work())
 
+    def test_feed_seeds(self):
+        roots = ['https://www.example%s.com' % i for i in range(10)]
+        crawler = AsyncCrawler(roots=iter(roots),
+                               http_client=FakedHttpClient(self.response),
+                               seeds_low_water=2,
+                               seeds_batch_size=3)
+
+        async def work():
+            async with crawler:
+                self.assertEqual(3, crawler.task_queue.qsize())
+                # above the low-water mark
+                self.assertEqual(0, crawler.feed_seeds())
+                await crawler.task_queue.get()
+                await crawler.task_queue.get()
+                self.assertEqual(3, crawler.feed_seeds())
+                self.assertEqual(4, crawler.task_queue.qsize())
+                self.assertFalse(crawler.seed_source.exhausted)
+
+        asyncio.get_event_loop().run_until_complete(work())
+
+    def test_crawl_with_seed_source(self):
+        roots = ['https://www.example%s.com' % i for i in range(10)]
+        # the duplicate seeds are rejected by the seen_urls
+        crawler = AsyncCrawler(roots=roots + roots[:3],
+                               http_client=FakedHttpClient(self.response),
+                               seeds_low_water=1,
+                               seeds_batch_size=2)
+
+        async def work(crawler):
+            async for _ in crawler.crawl():
+                pass
+
+        launcher = AsyncCrawlerLauncher(crawler=crawler, work=work)
+        launcher.run()
+        self.assertTrue(crawler.seed_source.exhausted)
+        self.assertEqual(10, len(crawler.finished_urls))
+
+    def test_to_task_queue_with_trap_detector(self):
+        crawler = AsyncCrawler(http_client=FakedHttpClient(self.response),
+                               trap_detector=TrapDetector(max_repeated_segments=2))
+
+        async def work():
+            async with crawler:
+                crawler.add_to_task_queue(['https://www.example.com/a/b/a/b',
+                                           'https://www.example.com/a/b/a/b/a/b'])
+                self.assertEqual(1, crawler.task_queue.qsize())
+                self.assertEqual(1, crawler.trap_detector.rejected['repeated_segments'])
+
+        asyncio.get_event_loop().run_until_complete(work())
+
+    def test_to_task_queue_with_parent(self):
+        crawler = AsyncCrawler(http_client=FakedHttpClient(self.response),
+                               budget=CrawlBudget(max_depth=1))
+
+        async def work():
+            async with crawler:
+                crawler.add_to_task_queue(_URL)
+                root = await crawler.task_queue.get()
+                self.assertEqual(0, root.depth)
+                self.assertIsNone(root.parent)
+
+                crawler.add_to_task_queue(['https://www.python.org'], parent=root)
+                child = await crawler.task_queue.get()
+                self.assertEqual(1, child.depth)
+                self.assertEqual(_URL, child.parent)
+
+                crawler.add_to_task_queue(['https://www.quora.com'], parent=child)
+                self.assertEqual(0, crawler.task_queue.qsize())
+
+        asyncio.get_event_loop().run_until_complete(work())
+
+    def test_init_http_client(self):
+        async def work():
+            async with AsyncCrawler(allowed_content_types=['text/plain'], max_body_size=100,
+                                    truncate_body=False) as crawler:
+                self.assertEqual({'text/plain'}, crawler.http_client.allowed_content_types)
+                self.assertEqual(100, crawler.http_client.max_body_size)
+                self.assertFalse(crawler.http_client.truncate_body)
+
+        asyncio.get_event_loop().run_until_complete(work())
+
+    def test_to_task_queue_charges_once(self):
+        budget = CrawlBudget(max_pages=2)
+        crawler = AsyncCrawler(http_client=FakedHttpClient(self.response), budget=budget)
+
+        async def work():
+            async with crawler:
+                # the URLs that seen or queued before don't consume the budget
+                crawler.add_to_task_queue([_URL, _URL, 'http://www.example.com', 'https://www.python.org'])
+                self.assertEqual(2, crawler.task_queue.qsize())
+                self.assertEqual(2, budget.admitted)
+                self.assertFalse(budget.rejected)
+
+        asyncio.get_event_loop().run_until_complete(work())
+
+    def test_to_task_queue_with_governor(self):
+        rss = [900]
+        governor = MemoryGovernor(1000, sample_interval=0, rss_fn=lambda: rss[0])
+        crawler = AsyncCrawler(http_client=FakedHttpClient(self.response), governor=governor)
+
+        async def work():
+            async with crawler:
+                crawler.add_to_task_queue(_URL)
+                root = await crawler.task_queue.get()
+
+                # the extracted URLs are deferred while throttled
+                crawler.add_to_task_queue(['https://www.python.org', 'https://www.quora.com'], parent=root)
+                self.assertEqual(0, crawler.task_queue.qsize())
+                self.assertEqual(2, governor.deferred)
+
+                # the empty task queue is fed even if throttled
+                crawler.add_to_task_queue('https://www.example.org')
+                self.assertEqual(0, crawler.feed_seeds())
+                await crawler.task_queue.get()
+                self.assertEqual(2, crawler.feed_seeds())
+                child = await crawler.task_queue.get()
+                self.assertEqual(('https://www.python.org', 1, _URL), (child.url, child.depth, child.parent))
+
+        asyncio.get_event_loop().run_until_complete(work())
+        governor.close()
+
+    def test_crawl_with_redirect_cache(self):
+        def response(url, status=200, location=None):
+            return FakedObject(url=url, status=status, headers={'location': location} if location else {},
+                               charset=_CHARSET, content_type=_CONTENT_TYPE, content_length=_CONTENT_LENGTH,
+                               reason=_REASON, text=_TEXT)
+
+        responses = {}
+        for path in ('a', 'b', 'c'):
+            responses['http://example.com/%s' % path] = response('http://example.com/%s' % path, 301,
+                                                                 'https://example.com/%s' % path)
+            responses['https://example.com/%s' % path] = response('https://example.com/%s' % path)
+        http_client = RoutingHttpClient(responses)
+        crawler = AsyncCrawler(roots=['http://example.com/a', 'http://example.com/b'],
+                               strict=False,
+                               http_client=http_client,
+                               redirect_cache=RedirectCache())
+        tasks = []
+
+        async def work(crawler):
+            async for t in crawler.crawl():
+                tasks.append(t)
+
+        AsyncCrawlerLauncher(crawler=crawler, work=work).run()
+        self.assertEqual(2, len(tasks))
+        self.assertEqual({1}, {t.redirect_num for t in tasks})
+        self.assertEqual(4, len(http_client.requested))
+
+        # the enqueued URL is rewritten by the learned scheme rule and fetched without the hop
+        crawler.add_to_task_queue('http://example.com/c', parent=tasks[0])
+        AsyncCrawlerLauncher(crawler=crawler, work=work).run()
+        self.assertEqual('https://example.com/c', tasks[-1].url)
+        self.assertEqual(0, tasks[-1].redirect_num)
+        self.assertEqual(['https://example.com/c'], http_client.requested[4:])
+
+    def test_crawl_with_robots(self):
+        async def robots_text():
+            return 'User-agent: *\nDisallow: /private/\n'
+
+        responses = {
+            'http://example.com/robots.txt': FakedObject(url='http://example.com/robots.txt', status=200,
+                                                         text=robots_text),
+        }
+        for path in ('a', 'private/b'):
+            url = 'http://example.com/%s' % path
+            responses[url] = FakedObject(url=url, status=_STATUS, headers=_HEADERS, charset=_CHARSET,
+                                         content_type=_CONTENT_TYPE, content_length=_CONTENT_LENGTH,
+                                         reason=_REASON, text=_TEXT)
+        http_client = RoutingHttpClient(responses)
+        robots = RobotsCache(http_client)
+        crawler = AsyncCrawler(roots=['http://example.com/a', 'http://example.com/private/b'],
+                               strict=False,
+                               http_client=http_client,
+                               robots=robots)
+        tasks = []
+
+        async def work(crawler):
+            async for t in crawler.crawl():
+                tasks.append(t)
+
+        # the disallowed URL is not logged as an invalid URL
+        with patch.object(crawler.logger, 'error') as error:
+            AsyncCrawlerLauncher(crawler=crawler, work=work).run()
+        error.assert_not_called()
+        self.assertEqual(['http://example.com/a'], [t.url for t in tasks])
+        self.assertEqual(1, robots.fetched)
+        self.assertNotIn('http://example.com/private/b', http_client.requested)
+
+        # the disallowed URL is filtered before it is enqueued
+        crawler.add_to_task_queue(['http://example.com/private/c', 'http://example.com/c'], parent=tasks[0])
+        self.assertEqual(1, crawler.task_queue.qsize())
+        self.assertEqual(2, robots.disallowed)
+
+    def test_crawl_with_crawl_delay(self):
+        async def robots_text():
+            return 'User-agent: *\nCrawl-delay: 10\n'
+
+        responses = {
+            'http://slow.com/robots.txt': FakedObject(url='http://slow.com/robots.txt', status=200, text=robots_text),
+            'http://fast.com/robots.txt': FakedObject(url='http://fast.com/robots.txt', status=404, text=robots_text),
+        }
+        urls = ['http://slow.com/a', 'http://slow.com/b', 'http://slow.com/c', 'http://fast.com/a']
+        for url in urls:
+            responses[url] = FakedObject(url=url, status=_STATUS, headers=_HEADERS, charset=_CHARSET,
+                                         content_type=_CONTENT_TYPE, content_length=_CONTENT_LENGTH,
+                                         reason=_REASON, text=_TEXT)
+        http_client = RoutingHttpClient(responses)
+        robots = RobotsCache(http_client, max_crawl_delay=0.05)
+        crawler = AsyncCrawler(roots=urls, strict=False, http_client=http_client, robots=robots)
+        tasks = []
+
+        async def work(crawler):
+            async for t in crawler.crawl():
+                tasks.append(t)
+
+        # a single worker isn't held by the tasks that wait for the Crawl-delay
+        AsyncCrawlerLauncher(crawler=crawler, work=work, max_task=1).run()
+        self.assertEqual(4, len(tasks))
+        requested = [u for u in http_client.requested if not u.endswith('/robots.txt')]
+        self.assertEqual(['http://slow.com/a', 'http://fast.com/a', 'http://slow.com/b', 'http://slow.com/c'],
+                         requested)
+        self.assertEqual(2, robots.delayed)
+        self.assertEqual(0, crawler.parked)
+
+    def test_crawl_coalesces_inflight_requests(self):
+        async def slow_text():
+            await asyncio.sleep(0.05)
+            return _BODY
+
+        response = FakedObject(url='http://example.com/a', status=_STATUS, headers=_HEADERS, charset=_CHARSET,
+                               content_type=_CONTENT_TYPE, content_length=_CONTENT_LENGTH, reason=_REASON,
+                               text=slow_text)
+        # the same canonical URL
+        roots = ['http://example.com/a?x=1&y=2', 'http://example.com/a?y=2&x=1']
+        http_client = RoutingHttpClient({url: response for url in roots})
+        crawler = AsyncCrawler(roots=roots, strict=False, http_client=http_client)
+        tasks = []
+
+        async def work(crawler):
+            async for t in crawler.crawl():
+                tasks.append(t)
+
+        # the coalesced request is not logged as an invalid URL
+        with patch.object(crawler.logger, 'error') as error:
+            AsyncCrawlerLauncher(crawler=crawler, work=work).run()
+        error.assert_not_called()
+        self.assertEqual(1, len(tasks))
+        self.assertEqual(1, len(http_client.requested))
+        self.assertEqual(1, crawler.coalesced)
+        self.assertEqual(set(), crawler.inflight_urls)
+
+    def test_crawl_releases_governor(self):
+        governor = MemoryGovernor(1000, sample_interval=0, rss_fn=lambda: 0)
+        http_client = FakedHttpClient(self.response)
+
+        async def get_response(response):
+            raise RuntimeError('broken')
+
+        http_client.get_response = get_response
+        crawler = AsyncCrawler(roots=_URL, http_client=http_client, governor=governor)
+
+        async def work():
+            async with crawler:
+                with self.assertRaises(RuntimeError):
+                    async for _ in crawler.crawl():
+                        pass
+                self.assertEqual(0, governor.active)
+
+        asyncio.get_event_loop().run_until_complete(work())
+        governor.close()
+
+    def test_crawl_drains_when_budget_expired(self):
+        budget = CrawlBudget(max_time=60)
+        http_client = FakedHttpClient(self.response)
+        crawler = AsyncCrawler(roots=['https://www.example%s.com' % i for i in range(5)],
+                               http_client=http_client,
+                               budget=budget)
+        budget.deadline = 0
+
+        async def work(crawler):
+            async for _ in crawler.crawl():
+                pass
+
+        launcher = AsyncCrawlerLauncher(crawler=crawler, work=work)
+        launcher.run()
+        self.assertEqual(5, crawler.dropped)
+        self.assertEqual(0, len(http_client.requested))
+
+    def test_crawl_with_validator_store(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            store = ValidatorStore(os.path.join(dirname, 'validators.db'))
+            store.update(_URL, {'ETag': '"v1"'}, _BODY)
+            self.response.status = 304
+            http_client = FakedHttpClient(self.response)
+            crawler = AsyncCrawler(roots=_URL, http_client=http_client, validator_store=store)
+            list = []
+
+            async def work(crawler):
+                async for t in crawler.crawl():
+                    list.append(t)
+
+            launcher = AsyncCrawlerLauncher(crawler=crawler, work=work)
+            launcher.run()
+            self.assertEqual(0, len(list))
+            self.assertEqual(1, crawler.not_modified)
+            self.assertEqual({'If-None-Match': '"v1"'}, http_client.request_headers[0])
+            self.assertEqual(2, store.get(_URL)['visits'])
+            store.close()
+
+    def test_crawl_with_validator_store_error(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            store = ValidatorStore(os.path.join(dirname, 'validators.db'))
+            self.response.status = 404
+            self.response.headers = dict(_HEADERS, ETag='"error"')
+            crawler = AsyncCrawler(roots=_URL, http_client=FakedHttpClient(self.response), validator_store=store)
+
+            async def work(crawler):
+                async for _ in crawler.crawl():
+                    pass
+
+            launcher = AsyncCrawlerLauncher(crawler=crawler, work=work)
+            launcher.run()
+            # the validators are only stored for the 2xx responses
+            self.assertIsNone(store.get(_URL))
+            store.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,17 @@
 import asyncio
+import json
+import os
+import tempfile
 import unittest
 
 from common_crawler.crawler import Crawler
 from common_crawler.engines.async import AsyncEngine
 from common_crawler.link_extractor import LinkExtractor
-from common_crawler.pipeline import Pipeline
+from common_crawler.pipeline import Pipeline, AsyncPipeline
+from common_crawler.pipeline.segment import SegmentFilePipeline
+from common_crawler.stats import CrawlStats
+from common_crawler.task import Task
+from common_crawler.trace import Tracer
 from tests.mock import FakedObject
 
 
@@ -26,7 +33,7 @@ class FakedCrawler(Crawler):
     def parse_link(self, response):
         pass
 
-    def add_to_task_queue(self, url):
+    def add_to_task_queue(self, url, parent=None):
         if isinstance(url, str):
             url = [url]
 
@@ -103,6 +110,21 @@ class FakedPipeline(Pipeline):
         pass
 
 
+class FakedAsyncPipeline(AsyncPipeline):
+    def __init__(self, **kwargs):
+        super(self.__class__, self).__init__(**kwargs)
+        self.tasks = []
+
+    @staticmethod
+    def _verify_task(task):
+        # the FakedCrawler produces the FakedObject rather than the Task
+        pass
+
+    async def handle(self, task, **kwargs):
+        await asyncio.sleep(0.01)
+        self.tasks.append(task)
+
+
 class TestAsyncEngine(unittest.TestCase):
     def setUp(self):
         self.configuration = {
@@ -194,6 +216,20 @@ class TestAsyncEngine(unittest.TestCase):
 
         asyncio.get_event_loop().run_until_complete(judge())
 
+    def test_add_links_near_duplicate(self):
+        engine = self._get_default_engine(near_duplicate_distance=3)
+        engine.link_extractor.extract_links = lambda **kwargs: [engine.link_extractor.return_val]
+
+        async def judge():
+            async with engine:
+                engine.add_links(self.task)
+                engine.add_links(self.task)
+
+                self.assertEqual(engine.crawler.task_queue.qsize(), 1)
+                self.assertEqual(engine.near_duplicate_skips, 1)
+
+        asyncio.get_event_loop().run_until_complete(judge())
+
     def test_transmit_data(self):
         engine = self._get_default_engine()
 
@@ -239,6 +275,29 @@ class TestAsyncEngine(unittest.TestCase):
 
         asyncio.get_event_loop().run_until_complete(judge())
 
+    def test_handle_traces_pipeline(self):
+        self.configuration['follow'] = False
+        self.configuration['interval'] = 0
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'crawl.json')
+            tracer = Tracer(filename, sample_rate=1)
+            # the built-in pipeline overrides transmit() so the span is opened by the engine
+            engine = self._get_default_engine(pipeline=SegmentFilePipeline(dirname=dirname))
+            task = Task(url=self.task.url, response=self.task.response, span=tracer.start_span(self.task.url))
+
+            async def judge():
+                async with engine:
+                    await engine.handle_async(task)
+
+            asyncio.get_event_loop().run_until_complete(judge())
+            task.span.finish()
+            tracer.close()
+
+            with open(filename, encoding='utf-8') as f:
+                events = [e for e in json.load(f) if e['name'] == 'pipeline']
+            self.assertEqual(1, len(events))
+            self.assertEqual({'pipeline': 'SegmentFilePipeline'}, events[0]['args'])
+
     def test_start(self):
         engine = self._get_default_engine()
         engine.crawler.add_to_task_queue(self.configuration['roots'])
@@ -253,6 +312,75 @@ class TestAsyncEngine(unittest.TestCase):
 
         asyncio.get_event_loop().run_until_complete(engine.close())
 
+    def test_start_with_async_pipeline(self):
+        engine = AsyncEngine(configuration=self.configuration,
+                             crawler=FakedCrawler(http_client=self.http_client,
+                                                  task_queue=self.task_queue),
+                             link_extractor=FakedLinkExtractor(),
+                             pipeline=FakedAsyncPipeline(max_inflight=1))
+        engine.crawler.add_to_task_queue(self.configuration['roots'])
+
+        engine.start()
+
+        self.assertEqual(len(engine.pipeline.tasks), 2)
+        self.assertEqual(engine.pipeline.inflight, 0)
+
+        asyncio.get_event_loop().run_until_complete(engine.close())
+
+    def test_start_with_instrumentation(self):
+        self.configuration['instrumentation'] = True
+        self.configuration['interval'] = 0
+        engine = self._get_default_engine()
+        engine.crawler.add_to_task_queue(self.configuration['roots'])
+
+        engine.start()
+
+        stages = engine.instrumentation.to_dict()['stages']
+        self.assertEqual(2, stages['transmit']['count'])
+        self.assertEqual(2, stages['extract']['count'])
+        self.assertIs(engine.instrumentation, engine.crawler.instrumentation)
+
+        asyncio.get_event_loop().run_until_complete(engine.close())
+
+    def test_start_with_metrics_server(self):
+        self.configuration['metrics_port'] = 0
+        self.configuration['interval'] = 0
+        engine = self._get_default_engine()
+        engine.crawler.add_to_task_queue(self.configuration['roots'])
+
+        engine.start()
+
+        self.assertEqual(len(engine.crawler.finished_urls), 2)
+        asyncio.get_event_loop().run_until_complete(engine.close())
+
+    def test_start_with_crawl_stats(self):
+        self.configuration['interval'] = 0
+        engine = self._get_default_engine()
+        engine.crawler.finished_urls = CrawlStats()
+        engine.crawler.add_to_finished_urls = engine.crawler.finished_urls.add
+        engine.crawler.add_to_task_queue(self.configuration['roots'])
+
+        engine.start()
+
+        finished = engine.crawler.finished_urls
+        self.assertIsInstance(finished, CrawlStats)
+        self.assertEqual(2, len(finished))
+        self.assertEqual({200: 2}, dict(finished.statuses))
+
+        asyncio.get_event_loop().run_until_complete(engine.close())
+
+    def test_start_with_profiler(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            self.configuration.update(profile=True, profile_dir=dirname, profile_memory_interval=0)
+            engine = self._get_default_engine()
+            engine.crawler.add_to_task_queue(self.configuration['roots'])
+
+            engine.start()
+
+            self.assertIsNone(engine.profiler._thread)
+            self.assertTrue(os.path.exists(engine.profiler.cpu_filename))
+            asyncio.get_event_loop().run_until_complete(engine.close())
+
     def test_clean_for_finished_urls(self):
         engine = self._get_default_engine()
         engine.crawler.finished_urls = [FakedObject(url='f'),
@@ -269,14 +397,15 @@ class TestAsyncEngine(unittest.TestCase):
         self.assertEqual(engine.crawler.finished_urls[2].url, 'f')
         self.assertEqual(engine.crawler.finished_urls[3].url, 'g')
 
-    def _get_default_engine(self):
+    def _get_default_engine(self, pipeline=None, **kwargs):
         return AsyncEngine(configuration=self.configuration,
                            crawler=FakedCrawler(http_client=self.http_client,
                                                 task_queue=self.task_queue,
                                                 parse_link=self.parse_link,
                                                 ),
                            link_extractor=FakedLinkExtractor(),
-                           pipeline=FakedPipeline())
+                           pipeline=pipeline if pipeline is not None else FakedPipeline(),
+                           **kwargs)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from common_crawler.governor import MemoryGovernor, read_rss, LEVEL_NORMAL, LEVEL_THROTTLE, LEVEL_CRITICAL
+
+
+class MemoryGovernorTest(unittest.TestCase):
+    def setUp(self):
+        self.rss = 0
+        self.now = 0.0
+        self.governor = MemoryGovernor(1000,
+                                       soft_ratio=0.8,
+                                       hard_ratio=0.95,
+                                       sample_interval=1,
+                                       max_concurrency=8,
+                                       pause=0.001,
+                                       rss_fn=lambda: self.rss,
+                                       clock=lambda: self.now)
+
+    def test_read_rss(self):
+        self.assertGreater(read_rss(), 0)
+
+    def test_level(self):
+        governor = self.governor
+        self.assertEqual(LEVEL_NORMAL, governor.sample())
+        self.assertEqual(8, governor.concurrency_limit)
+
+        # the RSS is sampled at most once per interval
+        self.rss = 850
+        self.assertFalse(governor.throttled)
+        self.now += 1
+        self.assertTrue(governor.throttled)
+        self.assertEqual(LEVEL_THROTTLE, governor.level)
+        self.assertEqual(2, governor.concurrency_limit)
+
+        self.rss = 960
+        self.assertEqual(LEVEL_CRITICAL, governor.sample(force=True))
+        self.assertEqual(1, governor.concurrency_limit)
+
+        self.rss = 100
+        self.assertEqual(LEVEL_NORMAL, governor.sample(force=True))
+        self.rss = 900
+        governor.sample(force=True)
+        self.assertEqual({LEVEL_THROTTLE: 2, LEVEL_CRITICAL: 1}, dict(governor.throttle_events))
+        self.assertEqual(960, governor.peak_rss)
+
+    def test_defer(self):
+        governor = self.governor
+        self.assertEqual([], governor.take_deferred(10))
+        for i in range(5):
+            governor.defer('http://www.example.com/%s' % i, depth=i, parent='http://www.example.com')
+        governor.defer('http://www.example.com/root')
+
+        self.assertEqual(6, governor.deferred)
+        self.assertEqual([('http://www.example.com/0', 0, 'http://www.example.com'),
+                          ('http://www.example.com/1', 1, 'http://www.example.com')],
+                         governor.take_deferred(2))
+        governor.defer('http://www.example.com/5', depth=5)
+        taken = governor.take_deferred(10)
+        self.assertEqual(['http://www.example.com/%s' % i for i in (2, 3, 4)], [url for url, _, _ in taken[:3]])
+        self.assertEqual(('http://www.example.com/root', 0, None), taken[3])
+        self.assertEqual(('http://www.example.com/5', 5, None), taken[4])
+        self.assertEqual((0, 7, 7), (governor.deferred, governor.deferred_total, governor.requeued_total))
+        governor.close()
+
+    def test_acquire(self):
+        governor = self.governor
+        self.rss = 990
+        governor.sample(force=True)
+        peak = []
+
+        async def fetch():
+            await governor.acquire()
+            peak.append(governor.active)
+            await asyncio.sleep(0.005)
+            governor.release()
+
+        async def work():
+            await asyncio.gather(*[fetch() for _ in range(4)])
+
+        asyncio.get_event_loop().run_until_complete(work())
+        self.assertEqual([1, 1, 1, 1], peak)
+        self.assertEqual(3, governor.waits)
+        self.assertEqual(0, governor.active)
+
+    def test_components(self):
+        self.governor.probes.update(task_queue=lambda: 3, broken=lambda: 1 / 0)
+        self.assertEqual({'task_queue': 3, 'broken': None}, self.governor.components())
+
+
+if __name__ == '__main__':
+    unittest.main()
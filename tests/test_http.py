@@ -1,8 +1,12 @@
 import asyncio
+import os
+import tempfile
+import time
 import unittest
 from unittest import mock
 
 from common_crawler.http.client.aiohttp import AioHttpClient
+from common_crawler.http.client.replay import RecordingHttpClient, ReplayHttpClient
 from tests.mock import FakedObject
 
 _TARGET_URL = 'https://www.example.com/hello'
@@ -12,6 +16,33 @@ _MOCKED_TARGET = '%s.%s' % (AioHttpClient.__module__, AioHttpClient.__name__)
 _LOOP = asyncio.get_event_loop()
 
 
+def _streamed_response(body, content_type='text/html', content_length=None, chunk_size=4):
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def read(n=-1):
+        return chunks.pop(0) if chunks else b''
+
+    async def text():
+        return body.decode('utf-8')
+
+    response = FakedObject(url=_TARGET_URL,
+                           status=200,
+                           charset='utf-8',
+                           content_type=content_type,
+                           content_length=content_length,
+                           reason='OK',
+                           headers={'Content-Type': content_type},
+                           content=FakedObject(read=read),
+                           closed=False)
+    response.text = text
+
+    def close():
+        response.closed = True
+
+    response.close = close
+    return response
+
+
 class TestAioHttpClient(unittest.TestCase):
     """Test for common_crawler.http.aiohttp.AioHttpClient"""
 
@@ -138,7 +169,8 @@ class TestAioHttpClient(unittest.TestCase):
         response.text = text
 
         async def work():
-            async with AioHttpClient() as client:
+            # the body is read by the response.text() only if unlimited
+            async with AioHttpClient(max_body_size=None) as client:
                 expected = await client.get_response(response)
 
                 self.assertTrue(isinstance(expected, Response))
@@ -172,6 +204,152 @@ class TestAioHttpClient(unittest.TestCase):
 
         _LOOP.run_until_complete(work())
 
+    def test_get_response_rejected_content_type(self):
+        response = _streamed_response(b'%PDF', content_type='application/pdf', content_length=4)
+
+        async def work():
+            async with AioHttpClient() as client:
+                result = await client.get_response(response)
+                self.assertEqual(result.rejected, 'content_type')
+                self.assertIsNone(result.text)
+                self.assertTrue(response.closed)
+                self.assertEqual(client.stats['rejected_content_type'], 1)
+                self.assertEqual(client.stats['bytes_saved'], 4)
+
+        _LOOP.run_until_complete(work())
+
+    def test_get_response_rejected_content_length(self):
+        response = _streamed_response(b'<html></html>', content_length=1000)
+
+        async def work():
+            async with AioHttpClient(max_body_size=100) as client:
+                result = await client.get_response(response)
+                self.assertEqual(result.rejected, 'size')
+                self.assertTrue(response.closed)
+                self.assertEqual(client.stats['bytes_saved'], 1000)
+
+        _LOOP.run_until_complete(work())
+
+    def test_get_response_streamed(self):
+        async def work():
+            async with AioHttpClient(max_body_size=10) as client:
+                result = await client.get_response(_streamed_response(b'<p>hi</p>'))
+                self.assertEqual(result.text, '<p>hi</p>')
+                self.assertFalse(result.truncated)
+
+                response = _streamed_response(b'<p>hello world</p>')
+                result = await client.get_response(response)
+                self.assertEqual(result.text, '<p>hello w')
+                self.assertTrue(result.truncated)
+                self.assertTrue(response.closed)
+                self.assertEqual(client.stats['truncated'], 1)
+
+            async with AioHttpClient(max_body_size=10, truncate_body=False) as client:
+                result = await client.get_response(_streamed_response(b'<p>hello world</p>'))
+                self.assertEqual(result.rejected, 'size')
+                self.assertIsNone(result.text)
+
+        _LOOP.run_until_complete(work())
+
+    def test_get_response_unknown_charset(self):
+        response = _streamed_response('<p>h\u00e9llo</p>'.encode('utf-8'))
+        response.charset = 'bogus'
+        latin = _streamed_response('<p>h\u00e9llo</p>'.encode('latin-1'))
+        latin.charset = 'ISO-8859-1'
+
+        async def work():
+            async with AioHttpClient() as client:
+                result = await client.get_response(response)
+                self.assertEqual(result.text, '<p>h\u00e9llo</p>')
+                result = await client.get_response(latin)
+                self.assertEqual(result.text, '<p>h\u00e9llo</p>')
+
+        _LOOP.run_until_complete(work())
+
+    def test_get_response_decoded_size(self):
+        # the declared length of a compressed body is smaller than the decoded body
+        response = _streamed_response(b'<p>hello world</p>', content_length=8)
+
+        async def work():
+            async with AioHttpClient(max_body_size=10) as client:
+                result = await client.get_response(response)
+                self.assertEqual(result.text, '<p>hello w')
+                self.assertTrue(result.truncated)
+                self.assertEqual(client.stats['bytes_downloaded'], 12)
+
+        _LOOP.run_until_complete(work())
+
+
+class TestReplayHttpClient(unittest.TestCase):
+    """Test for common_crawler.http.client.replay"""
+
+    def setUp(self):
+        self.dirname = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.dirname.name, 'replay.dat')
+
+    def tearDown(self):
+        self.dirname.cleanup()
+
+    def _record(self):
+        response = _streamed_response('<p>h\u00e9llo</p>'.encode('utf-8'))
+        rejected = _streamed_response(b'{}', content_type='application/json')
+        rejected.url = 'https://www.example.com/data.json'
+
+        async def work():
+            async with RecordingHttpClient(archive=self.archive) as client:
+                await client.get_response(response)
+                await client.get_response(rejected)
+                self.assertEqual(2, client.recorded)
+
+        _LOOP.run_until_complete(work())
+
+    def test_replay(self):
+        self._record()
+
+        async def work():
+            async with ReplayHttpClient(archive=self.archive) as client:
+                async with client.get(_TARGET_URL, allow_redirects=False) as resp:
+                    result = await client.get_response(resp)
+                self.assertEqual(200, result.status)
+                self.assertEqual('<p>h\u00e9llo</p>', result.text)
+                self.assertEqual('text/html', result.headers['content-type'])
+                self.assertIsNotNone(result.selector)
+
+                async with client.get('https://www.example.com/data.json') as resp:
+                    result = await client.get_response(resp)
+                self.assertEqual('content_type', result.rejected)
+                self.assertIsNone(result.text)
+
+                async with client.get('https://www.example.com/missing') as resp:
+                    self.assertEqual(404, resp.status)
+                self.assertEqual((2, 1), (client.hits, client.misses))
+
+        _LOOP.run_until_complete(work())
+
+    def test_replay_without_index(self):
+        self._record()
+        os.remove(self.archive + '.idx')
+
+        async def work():
+            async with ReplayHttpClient(archive=self.archive) as client:
+                self.assertEqual(2, len(client.index))
+                async with client.get(_TARGET_URL) as resp:
+                    self.assertEqual(200, resp.status)
+
+        _LOOP.run_until_complete(work())
+
+    def test_replay_latency(self):
+        self._record()
+
+        async def work():
+            async with ReplayHttpClient(archive=self.archive, latency=0.05) as client:
+                start = time.time()
+                async with client.get(_TARGET_URL):
+                    pass
+                self.assertGreaterEqual(time.time() - start, 0.05)
+
+        _LOOP.run_until_complete(work())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import unittest
+
+from common_crawler.instrument import Histogram, Instrumentation, NULL_INSTRUMENTATION
+
+
+class HistogramTest(unittest.TestCase):
+    def test_percentile(self):
+        histogram = Histogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+
+        self.assertEqual(10000, histogram.count)
+        self.assertEqual((1, 10000), (histogram.min, histogram.max))
+        self.assertAlmostEqual(5000.5, histogram.mean)
+        # the relative error of a bucket is less than 1 / 32
+        for p in (50, 90, 99):
+            self.assertAlmostEqual(p * 100, histogram.percentile(p), delta=p * 100 / 32.0)
+        self.assertEqual(10000, histogram.percentile(100))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in (0, 3, 3, 31):
+            histogram.record(value)
+        self.assertEqual(3, histogram.percentile(50))
+        self.assertEqual(31, histogram.percentile(99))
+        self.assertEqual(0, Histogram().percentile(50))
+
+    def test_merge(self):
+        a, b = Histogram(), Histogram()
+        for value in range(100):
+            a.record(value)
+            b.record(value + 1000)
+        a.merge(b)
+        self.assertEqual(200, a.count)
+        self.assertEqual((0, 1099), (a.min, a.max))
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_observe(self):
+        instrumentation = Instrumentation()
+        start = instrumentation.clock()
+        instrumentation.observe('parse', start)
+        instrumentation.record('fetch', 0.002)
+        instrumentation.incr('retries')
+
+        result = instrumentation.to_dict()
+        self.assertEqual({'retries': 1}, result['counters'])
+        self.assertEqual(1, result['stages']['parse']['count'])
+        self.assertAlmostEqual(2, result['stages']['fetch']['p50'], delta=0.1)
+        self.assertEqual(3, len(instrumentation.report()))
+
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'stages.json')
+            instrumentation.dump(filename)
+            with open(filename) as f:
+                self.assertEqual(result, json.load(f))
+
+    def test_null_instrumentation(self):
+        self.assertFalse(NULL_INSTRUMENTATION.enabled)
+        start = NULL_INSTRUMENTATION.clock()
+        NULL_INSTRUMENTATION.observe('parse', start)
+        NULL_INSTRUMENTATION.incr('retries')
+        self.assertEqual({'counters': {}, 'stages': {}}, NULL_INSTRUMENTATION.to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from common_crawler.governor import MemoryGovernor
+from common_crawler.instrument import Instrumentation
+from common_crawler.metrics import CrawlMetrics, MetricsServer, render_metrics
+from tests.mock import FakedObject
+
+
+def _task(status=200, exception=None):
+    return FakedObject(exception=exception, response=FakedObject(status=status) if status else None)
+
+
+class CrawlMetricsTest(unittest.TestCase):
+    def test_observe(self):
+        metrics = CrawlMetrics()
+        metrics.observe(_task(), 'https://www.example.com/a', yielded=True)
+        metrics.observe(_task(status=500), 'https://www.example.com/b')
+        metrics.observe(_task(status=None, exception=ValueError()), 'https://www.python.org/')
+        metrics.observe(None, 'https://www.python.org/')
+
+        self.assertEqual(3, metrics.requests)
+        self.assertEqual(1, metrics.pages)
+        self.assertEqual(2, metrics.errors)
+        self.assertEqual({200: 1, 500: 1}, dict(metrics.statuses))
+        self.assertEqual({'www.example.com': 2, 'www.python.org': 1}, dict(metrics.host_requests))
+        self.assertEqual({'www.example.com': 1, 'www.python.org': 1}, dict(metrics.host_errors))
+
+
+class RenderMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = CrawlMetrics()
+        self.metrics.observe(_task(), 'https://www.example.com/a', yielded=True)
+        self.metrics.observe(_task(status=404), 'https://www.example.com/b')
+        self.metrics.inflight = 3
+
+        task_queue = asyncio.Queue()
+        task_queue.put_nowait(1)
+        instrumentation = Instrumentation()
+        instrumentation.record('ttfb', 0.01)
+        crawler = FakedObject(metrics=self.metrics,
+                              coalesced=4,
+                              task_queue=task_queue,
+                              seen_urls={'a', 'b'},
+                              http_client=FakedObject(stats={'bytes_downloaded': 1024, 'rejected_size': 2}))
+        self.engine = FakedObject(crawler=crawler, instrumentation=instrumentation)
+
+    def test_render(self):
+        text = render_metrics(self.engine)
+        lines = text.splitlines()
+        self.assertIn('# TYPE common_crawler_pages_total counter', lines)
+        self.assertIn('common_crawler_pages_total 1', lines)
+        self.assertIn('common_crawler_requests_total 2', lines)
+        self.assertIn('common_crawler_inflight_fetches 3', lines)
+        self.assertIn('common_crawler_coalesced_requests_total 4', lines)
+        self.assertIn('common_crawler_task_queue_depth 1', lines)
+        self.assertIn('common_crawler_seen_urls 2', lines)
+        self.assertIn('common_crawler_responses_total{status="404"} 1', lines)
+        self.assertIn('common_crawler_bytes_downloaded_total 1024', lines)
+        self.assertIn('common_crawler_bodies_rejected_total{reason="size"} 2', lines)
+        self.assertIn('common_crawler_bodies_truncated_total 0', lines)
+        self.assertIn('common_crawler_host_error_ratio{host="www.example.com"} 0.5000', lines)
+        self.assertIn('common_crawler_stage_seconds_count{stage="ttfb"} 1', lines)
+
+    def test_render_governor(self):
+        governor = MemoryGovernor(1000, max_concurrency=8, rss_fn=lambda: 900, probes={'task_queue': lambda: 5})
+        governor.sample()
+        governor.defer('https://www.example.com/c')
+        self.engine.governor = governor
+
+        lines = render_metrics(self.engine).splitlines()
+        self.assertIn('common_crawler_memory_rss_bytes 900', lines)
+        self.assertIn('common_crawler_memory_level 1', lines)
+        self.assertIn('common_crawler_memory_throttle_events_total{level="throttle"} 1', lines)
+        self.assertIn('common_crawler_memory_concurrency_limit 2', lines)
+        self.assertIn('common_crawler_memory_deferred_urls 1', lines)
+        self.assertIn('common_crawler_component_size{component="task_queue"} 5', lines)
+        governor.close()
+
+    def test_serve(self):
+        async def scrape(path):
+            server = await MetricsServer(self.engine, port=0).start()
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+                writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path).encode('latin-1'))
+                response = await reader.read()
+                writer.close()
+                return response.decode('utf-8')
+            finally:
+                await server.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            response = loop.run_until_complete(scrape('/metrics'))
+            self.assertTrue(response.startswith('HTTP/1.1 200 OK'))
+            self.assertIn('common_crawler_pages_total 1', response)
+
+            response = loop.run_until_complete(scrape('/'))
+            self.assertTrue(response.startswith('HTTP/1.1 404'))
+        finally:
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
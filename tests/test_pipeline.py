@@ -1,7 +1,19 @@
+import asyncio
+import glob
+import gzip
+import os
+import sqlite3
+import tempfile
 import unittest
+import zlib
 from unittest.mock import patch, mock_open, MagicMock
 
+from common_crawler.pipeline import Pipeline, AsyncPipeline, ThreadedPipeline
+from common_crawler.pipeline.cas import ContentAddressedPipeline
 from common_crawler.pipeline.file import SimpleFilePipeline
+from common_crawler.pipeline.segment import SegmentFilePipeline, iter_records, RECORD_FORMAT_LENGTH_PREFIXED
+from common_crawler.pipeline.sqlite import SqlitePipeline
+from common_crawler.pipeline.warc import WarcPipeline
 from common_crawler.task import Task
 from tests.mock import FakedObject
 
@@ -24,14 +36,21 @@ class TestSimpleFilePipeline(unittest.TestCase):
                          parsed_data='Text',
                          response=response)
 
+    def _transmit(self, **kwargs):
+        async def work():
+            async with SimpleFilePipeline() as pipeline:
+                await pipeline.transmit(task=self.task, **kwargs)
+            return pipeline
+
+        return asyncio.get_event_loop().run_until_complete(work())
+
     def test_transmit(self):
         m = mock_open()
         expected_mode = 'wb+'
         expected_encode = 'utf-8'
 
         with patch(self.open_path, m):
-            with SimpleFilePipeline() as pipeline:
-                pipeline.transmit(task=self.task, encode=expected_encode)
+            pipeline = self._transmit(encode=expected_encode)
 
         domain = self.task.url[self.task.url.find('www'):]
         response = self.task.response
@@ -40,6 +59,7 @@ class TestSimpleFilePipeline(unittest.TestCase):
         m.assert_called_once_with(default_filename, expected_mode)
         handle = m()
         handle.write.assert_called_once_with(self.task.parsed_data.encode(expected_encode))
+        self.assertEqual(1, pipeline.transmitted)
 
     def test_suffix(self):
         m = mock_open()
@@ -48,8 +68,7 @@ class TestSimpleFilePipeline(unittest.TestCase):
         expected_encode = 'utf-8'
 
         with patch(self.open_path, m):
-            with SimpleFilePipeline() as pipeline:
-                pipeline.transmit(task=self.task, suffix=expected_suffix, encode=expected_encode)
+            self._transmit(suffix=expected_suffix, encode=expected_encode)
 
         domain = self.task.url[self.task.url.find('www'):]
         response = self.task.response
@@ -59,14 +78,361 @@ class TestSimpleFilePipeline(unittest.TestCase):
         handle = m()
         handle.write.assert_called_once_with(self.task.parsed_data.encode(expected_encode))
 
+    def test_bounded_inflight(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            tasks = [Task(url='https://www.example%s.com' % i, parsed_data='Text', response=self.task.response)
+                     for i in range(10)]
+
+            async def work():
+                async with SimpleFilePipeline(max_inflight=2) as pipeline:
+                    for task in tasks:
+                        await pipeline.transmit(task, dirname=dirname)
+                        self.assertTrue(pipeline.inflight <= 2)
+                return pipeline
+
+            pipeline = asyncio.get_event_loop().run_until_complete(work())
+            self.assertEqual(10, pipeline.transmitted)
+            self.assertEqual(10, len(os.listdir(dirname)))
+
     def test_task_with_invalid(self):
         self.task = MagicMock(url='https://www.example.com',
                               parsed_data='Test',
                               status=200)
 
-        with SimpleFilePipeline() as pipeline:
+        with self.assertRaises(ValueError):
+            self._transmit()
+
+
+class TestSegmentFilePipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _task(self, i):
+        url = 'https://www.example.com/%s' % i
+        response = FakedObject(url=url,
+                               status=200,
+                               charset='utf-8',
+                               headers={'content-type': 'text/html'})
+        return Task(url=url, parsed_data='<html>%s</html>' % i, response=response)
+
+    def test_transmit(self):
+        with SegmentFilePipeline(dirname=self.dirname) as pipeline:
+            for i in range(10):
+                pipeline.transmit(self._task(i))
+
+        segments = glob.glob(os.path.join(self.dirname, '*.jsonl'))
+        self.assertEqual(len(segments), 1)
+        records = list(iter_records(segments[0]))
+        self.assertEqual(len(records), 10)
+        self.assertEqual(records[3]['url'], 'https://www.example.com/3')
+        self.assertEqual(records[3]['status'], 200)
+        self.assertEqual(records[3]['headers'], [['content-type', 'text/html']])
+        self.assertEqual(records[3]['body'], '<html>3</html>')
+
+    def test_rotate_by_size(self):
+        with SegmentFilePipeline(dirname=self.dirname,
+                                 record_format=RECORD_FORMAT_LENGTH_PREFIXED,
+                                 max_segment_size=200) as pipeline:
+            for i in range(10):
+                pipeline.transmit(self._task(i))
+
+        segments = sorted(glob.glob(os.path.join(self.dirname, '*.rec')))
+        self.assertTrue(len(segments) > 1)
+        records = [r for s in segments for r in iter_records(s, RECORD_FORMAT_LENGTH_PREFIXED)]
+        self.assertEqual(len(records), 10)
+        self.assertEqual(records[9]['body'], b'<html>9</html>')
+
+    def test_invalid_record_format(self):
+        with self.assertRaises(ValueError):
+            SegmentFilePipeline(dirname=self.dirname, record_format='csv')
+
+
+class TestWarcPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_transmit(self):
+        with WarcPipeline(dirname=self.dirname, max_workers=2, max_pending=2) as pipeline:
+            for i in range(5):
+                url = 'https://www.example.com/%s?q=1' % i
+                response = FakedObject(url=url,
+                                       status=200,
+                                       reason='OK',
+                                       charset='utf-8',
+                                       headers={'Content-Type': 'text/html', 'Content-Encoding': 'gzip'},
+                                       text='<html>%s</html>' % i)
+                # the parsed data is not a part of the record
+                pipeline.transmit(Task(url=url, parsed_data={'links': [url]}, response=response))
+
+        segments = glob.glob(os.path.join(self.dirname, '*.warc.gz'))
+        self.assertEqual(len(segments), 1)
+        with gzip.open(segments[0], 'rb') as f:
+            content = f.read()
+        self.assertEqual(content.count(b'WARC/1.0\r\n'), 11)
+        self.assertTrue(content.startswith(b'WARC/1.0\r\nWARC-Type: warcinfo'))
+        self.assertTrue(b'GET /3?q=1 HTTP/1.1' in content)
+        self.assertFalse(b'Content-Encoding' in content)
+
+        # each record is a gzip member that can be decompressed independently by the index
+        with open(segments[0] + '.idx') as f:
+            index = [line.rstrip('\n').split('\t') for line in f]
+        self.assertEqual(len(index), 11)
+        offset, length, warc_type, url = index[-1]
+        self.assertEqual(warc_type, 'response')
+        self.assertEqual(url, 'https://www.example.com/4?q=1')
+        with open(segments[0], 'rb') as f:
+            f.seek(int(offset))
+            record = gzip.decompress(f.read(int(length)))
+        self.assertTrue(record.startswith(b'WARC/1.0\r\nWARC-Type: response'))
+        self.assertTrue(record.endswith(b'<html>4</html>\r\n\r\n'))
+
+    def test_transmit_with_charset(self):
+        url = 'https://www.example.com'
+        response = FakedObject(url=url,
+                               status=200,
+                               reason='OK',
+                               charset='iso-8859-1',
+                               headers={'Content-Type': 'text/html; charset=iso-8859-1'},
+                               text='<html>caf\xe9</html>')
+        with WarcPipeline(dirname=self.dirname, max_workers=1) as pipeline:
+            pipeline.transmit(Task(url=url, parsed_data=None, response=response))
+
+        segments = glob.glob(os.path.join(self.dirname, '*.warc.gz'))
+        with gzip.open(segments[0], 'rb') as f:
+            content = f.read()
+        self.assertTrue(b'Content-Length: 17\r\n\r\n<html>caf\xe9</html>\r\n\r\n' in content)
+
+
+class TestSqlitePipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'db', 'pages.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _task(self, i):
+        url = 'https://www.example.com/%s' % i
+        response = FakedObject(url=url,
+                               status=200,
+                               reason='OK',
+                               charset='utf-8',
+                               content_type='text/html',
+                               content_length=None,
+                               headers={'server': 'nginx'})
+        return Task(url=url, parsed_data='<html>%s</html>' % i, response=response)
+
+    def test_transmit(self):
+        with SqlitePipeline(filename=self.filename, batch_size=3, commit_interval=60) as pipeline:
+            for i in range(10):
+                pipeline.transmit(self._task(i))
+
+        self.assertEqual(pipeline.rows_written, 10)
+        # 3 full batches and the rest is committed by close()
+        self.assertEqual(pipeline.commits, 4)
+
+        db = sqlite3.connect(self.filename)
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        rows = db.execute('SELECT url, status, headers, body FROM pages ORDER BY id').fetchall()
+        db.close()
+        self.assertEqual(len(rows), 10)
+        url, status, headers, body = rows[7]
+        self.assertEqual(url, 'https://www.example.com/7')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, '[["server", "nginx"]]')
+        self.assertEqual(zlib.decompress(body).decode('utf-8'), '<html>7</html>')
+
+    def test_flush(self):
+        pipeline = SqlitePipeline(filename=self.filename, batch_size=100, commit_interval=60)
+        pipeline.transmit(self._task(0))
+        pipeline.flush()
+        self.assertEqual(pipeline.rows_written, 1)
+        pipeline.close()
+        with self.assertRaises(ValueError):
+            pipeline.transmit(self._task(1))
+
+
+    def test_invalid_rows(self):
+        pipeline = SqlitePipeline(filename=self.filename, batch_size=3, commit_interval=60)
+        invalid = self._task(0)
+        invalid.parsed_data = object()
+        # violates the constraint NOT NULL of the column url
+        failed = self._task(1)
+        failed.url = None
+
+        with self.assertLogs('common_crawler.pipeline.sqlite', level='ERROR'):
+            for task in [invalid, failed] + [self._task(i) for i in range(2, 6)]:
+                pipeline.transmit(task)
+            pipeline.flush()
+        # the writer thread is still alive and the rest of the failed batch is written
+        self.assertEqual(1, pipeline.invalid_rows)
+        self.assertEqual(1, pipeline.failed_rows)
+        self.assertEqual(4, pipeline.rows_written)
+        pipeline.transmit(self._task(6))
+        with self.assertRaises(sqlite3.IntegrityError):
+            pipeline.close()
+        self.assertEqual(5, pipeline.rows_written)
+
+
+class TestContentAddressedPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _task(self, url, body):
+        return Task(url=url, parsed_data=body, response=FakedObject(status=200))
+
+    def test_transmit(self):
+        bodies = ['<html>same</html>', '<html>other</html>', '<html>same</html>', '<html>same</html>']
+        with ContentAddressedPipeline(dirname=self.dirname) as pipeline:
+            for i, body in enumerate(bodies):
+                pipeline.transmit(self._task('https://www.example.com/?sid=%s' % i, body))
+
+        self.assertEqual(pipeline.blobs_written, 2)
+        self.assertEqual(pipeline.duplicates, 2)
+        self.assertEqual(pipeline.bytes_saved, 2 * len(bodies[0]))
+
+        blobs = [f for _, _, files in os.walk(os.path.join(self.dirname, 'objects')) for f in files]
+        self.assertEqual(len(blobs), 2)
+
+        with open(os.path.join(self.dirname, 'index.tsv')) as f:
+            index = [line.split('\t') for line in f]
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index[0][1], index[2][1])
+        with open(pipeline.path_of(index[1][1])) as f:
+            self.assertEqual(f.read(), bodies[1])
+
+    def test_seen_on_disk(self):
+        body = '<html>same</html>'
+        with ContentAddressedPipeline(dirname=self.dirname) as pipeline:
+            pipeline.transmit(self._task('https://www.example.com/a', body))
+
+        # the cache is empty but the blob already exists
+        with ContentAddressedPipeline(dirname=self.dirname, cache_size=1) as pipeline:
+            pipeline.transmit(self._task('https://www.example.com/b', body))
+        self.assertEqual(pipeline.blobs_written, 0)
+        self.assertEqual(pipeline.duplicates, 1)
+
+
+class CountingPipeline(Pipeline):
+    def __init__(self, **kwargs):
+        super(CountingPipeline, self).__init__(**kwargs)
+        self.count = 0
+
+    def setup(self, **kwargs):
+        pass
+
+    def handle(self, **kwargs):
+        self.count += 1
+
+    def close(self, **kwargs):
+        pass
+
+
+class SlowAsyncPipeline(AsyncPipeline):
+    def __init__(self, **kwargs):
+        super(SlowAsyncPipeline, self).__init__(**kwargs)
+        self.current = 0
+        self.peak = 0
+        self.urls = []
+
+    async def handle(self, task, **kwargs):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        await asyncio.sleep(0.01)
+        self.urls.append(task.url)
+        self.current -= 1
+
+
+class TestAsyncPipeline(unittest.TestCase):
+    def _tasks(self, n):
+        return [Task(url='https://www.example.com/%s' % i, parsed_data='Text') for i in range(n)]
+
+    def test_bounded_inflight(self):
+        pipeline = SlowAsyncPipeline(max_inflight=3)
+
+        async def work():
+            async with pipeline:
+                for task in self._tasks(10):
+                    await pipeline.transmit(task)
+                    self.assertTrue(pipeline.inflight <= 3)
+
+        asyncio.get_event_loop().run_until_complete(work())
+        self.assertEqual(pipeline.peak, 3)
+        self.assertEqual(len(pipeline.urls), 10)
+        self.assertEqual(pipeline.transmitted, 10)
+        self.assertEqual(pipeline.inflight, 0)
+
+    def test_failed_writes_are_logged(self):
+        pipeline = SlowAsyncPipeline()
+
+        async def fail(task, **kwargs):
+            raise IOError('disk full')
+
+        pipeline.handle = fail
+
+        async def work():
+            async with pipeline:
+                for task in self._tasks(3):
+                    await pipeline.transmit(task)
+
+        with self.assertLogs('common_crawler.pipeline', level='ERROR') as logs:
+            asyncio.get_event_loop().run_until_complete(work())
+        self.assertEqual(3, len(logs.records))
+        self.assertIn('disk full', logs.output[0])
+        self.assertEqual(3, pipeline.failed)
+        self.assertIsInstance(pipeline.last_exception, IOError)
+
+    def test_task_with_invalid(self):
+        pipeline = SlowAsyncPipeline()
+
+        async def work():
             with self.assertRaises(ValueError):
-                pipeline.transmit(task=self.task)
+                await pipeline.transmit(MagicMock(url='https://www.example.com'))
+
+        asyncio.get_event_loop().run_until_complete(work())
+
+    def test_threaded_pipeline(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            tasks = self._tasks(5)
+            for task in tasks:
+                task.response = FakedObject(status=200, headers=None)
+            pipeline = ThreadedPipeline(SegmentFilePipeline(dirname=dirname), max_inflight=2)
+
+            async def work():
+                async with pipeline:
+                    for task in tasks:
+                        await pipeline.transmit(task, encode='utf-8')
+
+            asyncio.get_event_loop().run_until_complete(work())
+            segments = glob.glob(os.path.join(dirname, '*.jsonl'))
+            records = list(iter_records(segments[0]))
+            self.assertEqual([r['url'] for r in records], [t.url for t in tasks])
+
+        with self.assertRaises(ValueError):
+            ThreadedPipeline(SlowAsyncPipeline())
+
+    def test_threaded_pipeline_by_name(self):
+        # the wrapped pipeline can be given by the full name of its class (see the config item threaded_pipeline)
+        pipeline = ThreadedPipeline('%s.%s' % (__name__, CountingPipeline.__name__))
+        self.assertIsInstance(pipeline.pipeline, CountingPipeline)
+
+        # the statement "with" awaits the close() if no event loop is running
+        with pipeline:
+            asyncio.get_event_loop().run_until_complete(pipeline.transmit(self._tasks(1)[0]))
+        self.assertEqual(1, pipeline.pipeline.count)
+        self.assertTrue(pipeline.threadpool._shutdown)
 
 
 if __name__ == '__main__':
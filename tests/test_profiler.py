@@ -0,0 +1,54 @@
+import os
+import re
+import tempfile
+import time
+import unittest
+
+from common_crawler.profiler import Profiler, run_filename
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    data = []
+    while time.perf_counter() < deadline:
+        data.append(str(len(data)))
+    return data
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_run_filename(self):
+        filename = run_filename('data', 'crawler', 'folded', started_at=0)
+        self.assertTrue(re.match(r'data/crawler-\d{8}-\d{6}-%s\.folded$' % os.getpid(), filename))
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            profiler = Profiler(dirname=os.path.join(dirname, 'profiles'),
+                                interval=0.001,
+                                flush_interval=0.05,
+                                memory_interval=0.05)
+            with profiler:
+                _busy(0.3)
+
+            self.assertGreater(profiler.samples, 0)
+            self.assertGreater(profiler.snapshots, 1)
+
+            with open(profiler.cpu_filename, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            self.assertTrue(any('test_profiler.py:_busy' in line for line in lines))
+            self.assertEqual(profiler.samples, sum(int(line.rsplit(' ', 1)[1]) for line in lines))
+
+            with open(profiler.memory_filename, encoding='utf-8') as f:
+                self.assertIn('--- snapshot 1 at', f.read())
+
+    def test_profile_without_memory(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            with Profiler(dirname=dirname, interval=0.001, memory_interval=0) as profiler:
+                _busy(0.05)
+
+            self.assertIsNone(profiler.memory_filename)
+            self.assertEqual(0, profiler.snapshots)
+            self.assertTrue(os.path.exists(profiler.cpu_filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
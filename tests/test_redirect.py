@@ -0,0 +1,55 @@
+import unittest
+
+from common_crawler.redirect import RedirectCache
+
+
+class RedirectCacheTest(unittest.TestCase):
+    def test_record(self):
+        cache = RedirectCache()
+        self.assertFalse(cache.record('http://a.com/x', 'http://a.com/y', status=302))
+        self.assertFalse(cache.record('http://a.com/x', 'http://a.com/x', status=301))
+        self.assertTrue(cache.record('http://a.com/x', 'http://a.com/y', status=308))
+        self.assertEqual(1, len(cache))
+        self.assertEqual('http://a.com/y', cache.resolve('http://a.com/x'))
+        self.assertEqual('http://a.com/z', cache.resolve('http://a.com/z'))
+
+    def test_resolve_chain(self):
+        cache = RedirectCache()
+        cache.record('http://a.com/1', 'http://a.com/2')
+        cache.record('http://a.com/2', 'http://a.com/3')
+        self.assertEqual('http://a.com/3', cache.resolve('http://a.com/1'))
+
+        # a loop is stopped
+        cache.record('http://a.com/3', 'http://a.com/1')
+        self.assertIn(cache.resolve('http://a.com/1'), ('http://a.com/2', 'http://a.com/3'))
+
+    def test_prefix(self):
+        cache = RedirectCache(min_evidence=2)
+        cache.record('http://example.com/a', 'https://www.example.com/a')
+        # one redirection is not enough for the rule
+        self.assertEqual('http://example.com/c', cache.resolve('http://example.com/c'))
+
+        cache.record('http://example.com/b?q=1', 'https://www.example.com/b?q=1')
+        self.assertEqual('https://www.example.com/c', cache.resolve('http://example.com/c'))
+        self.assertEqual('https://www.example.com/', cache.resolve('http://EXAMPLE.com'))
+        self.assertEqual(2, cache.prefix_hits)
+
+        # the rule is forgotten if the site maps a path
+        cache.record('http://example.com/d', 'https://www.example.com/login')
+        self.assertEqual('http://example.com/c', cache.resolve('http://example.com/c'))
+
+    def test_bounded(self):
+        cache = RedirectCache(max_urls=2, max_prefixes=1)
+        cache.record('http://a.com/1', 'https://a.com/1')
+        cache.record('http://a.com/2', 'https://a.com/2')
+        cache.resolve('http://a.com/1')
+        cache.record('http://b.com/3', 'https://b.com/3')
+
+        self.assertEqual(2, len(cache))
+        # the least recently used is evicted
+        self.assertEqual('https://a.com/1', cache.resolve('http://a.com/1'))
+        self.assertEqual('http://a.com/2', cache.resolve('http://a.com/2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from common_crawler.revisit import ValidatorStore, RevisitScheduler, estimate_change_rate
+
+_URL = 'https://www.example.com'
+
+
+class ValidatorStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.TemporaryDirectory()
+        self.store = ValidatorStore(os.path.join(self.dirname.name, 'validators.db'), commit_every=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.dirname.cleanup()
+
+    def test_conditional_headers(self):
+        self.assertEqual({}, self.store.conditional_headers(_URL))
+        self.store.update(_URL, {'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'}, 'body')
+        self.assertEqual({'If-None-Match': '"abc"',
+                          'If-Modified-Since': 'Mon, 01 Jan 2018 00:00:00 GMT'},
+                         self.store.conditional_headers(_URL))
+
+    def test_update(self):
+        self.assertTrue(self.store.update(_URL, {}, 'body', now=100))
+        self.assertFalse(self.store.update(_URL, {}, 'body', now=200))
+        self.assertTrue(self.store.update(_URL, {}, 'changed', now=300))
+        self.store.not_modified(_URL, now=400)
+
+        validators = self.store.get(_URL)
+        self.assertEqual(4, validators['visits'])
+        self.assertEqual(1, validators['changes'])
+        self.assertEqual(100, validators['first_fetched_at'])
+        self.assertEqual(400, validators['fetched_at'])
+        self.assertEqual(1, len(self.store))
+
+    def test_persistence(self):
+        self.store.update(_URL, {'etag': '"abc"'}, 'body')
+        self.store.close()
+        self.store = ValidatorStore(os.path.join(self.dirname.name, 'validators.db'))
+        self.assertEqual('"abc"', self.store.get(_URL)['etag'])
+
+
+class RevisitSchedulerTest(unittest.TestCase):
+    def test_estimate_change_rate(self):
+        default_rate = 0.5
+        self.assertEqual(default_rate, estimate_change_rate(1, 0, 0, 0, default_rate))
+        self.assertEqual(0, estimate_change_rate(11, 0, 0, 100))
+        # changed at every revisit is finite thanks to the bias correction
+        self.assertGreater(estimate_change_rate(11, 10, 0, 100), estimate_change_rate(11, 5, 0, 100))
+
+    def test_schedule(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            with ValidatorStore(os.path.join(dirname, 'validators.db')) as store:
+                for i, body in enumerate(['a', 'b', 'c']):
+                    store.update('https://www.volatile.com', {}, body, now=100 * (i + 1))
+                    store.update('https://www.stable.com', {}, 'same', now=100 * (i + 1))
+
+                scheduler = RevisitScheduler(store)
+                self.assertEqual(['https://www.volatile.com', 'https://www.stable.com'],
+                                 scheduler.schedule(10, now=400))
+                self.assertEqual(['https://www.volatile.com'], scheduler.schedule(1, now=400))
+                # a negative budget represent all known URLs and None represent disabled
+                self.assertEqual(2, len(scheduler.schedule(-1)))
+                self.assertEqual([], scheduler.schedule(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+
+from common_crawler.robots import RobotsCache, RobotsRules, parse_robots
+from tests.mock import FakedObject
+
+_ROBOTS = """
+# the comments are ignored
+User-agent: *
+Disallow: /private/
+Allow: /private/public
+Disallow: /*.pdf$
+Crawl-delay: 2
+
+User-agent: common_crawler
+User-agent: other
+Disallow: /search
+Allow: /search/about
+
+Sitemap: http://example.com/sitemap.xml
+"""
+
+
+class FakedRobotsClient(object):
+    """Return the robots.txt of the hosts, the response is delayed for the concurrent requests"""
+
+    def __init__(self, robots, delay=0.01):
+        self.robots = robots
+        self.delay = delay
+        self.requested = []
+
+    def get(self, url, *args, **kwargs):
+        self.requested.append(url)
+        status, body = self.robots[url]
+        if isinstance(status, Exception):
+            raise status
+
+        async def text():
+            await asyncio.sleep(self.delay)
+            return body
+
+        return FakedObject(url=url, status=status, text=text)
+
+
+class RobotsRulesTest(unittest.TestCase):
+    def test_allowed(self):
+        rules = RobotsRules([(False, '/a'), (True, '/a/b'), (False, '/*.gif$'), (True, '/c'), (False, '/c')])
+        self.assertTrue(rules.allowed('http://example.com/'))
+        self.assertFalse(rules.allowed('http://example.com/a/x'))
+        # the longest match wins
+        self.assertTrue(rules.allowed('http://example.com/a/b/c'))
+        self.assertFalse(rules.allowed('/x/y.gif'))
+        self.assertTrue(rules.allowed('/x/y.gif?size=1'))
+        # the Allow wins a tie
+        self.assertTrue(rules.allowed('/c'))
+        self.assertTrue(rules.allowed('http://example.com/robots.txt'))
+        self.assertFalse(RobotsRules(disallow_all=True).allowed('http://example.com/'))
+
+    def test_parse(self):
+        rules = parse_robots(_ROBOTS, 'common_crawler/1.0')
+        self.assertEqual(2, len(rules))
+        self.assertIsNone(rules.crawl_delay)
+        self.assertFalse(rules.allowed('http://example.com/search?q=1'))
+        self.assertTrue(rules.allowed('http://example.com/search/about'))
+        self.assertTrue(rules.allowed('http://example.com/private/'))
+        self.assertEqual(['http://example.com/sitemap.xml'], rules.sitemaps)
+
+        rules = parse_robots(_ROBOTS, 'another')
+        self.assertEqual(2, rules.crawl_delay)
+        self.assertFalse(rules.allowed('http://example.com/private/x'))
+        self.assertTrue(rules.allowed('http://example.com/private/public/x'))
+        self.assertFalse(rules.allowed('http://example.com/a.pdf'))
+        self.assertTrue(rules.allowed('http://example.com/search'))
+
+        # the rules before any User-agent line are ignored
+        self.assertEqual(0, len(parse_robots('Disallow: /\n', 'a')))
+
+
+class RobotsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakedRobotsClient({
+            'http://example.com/robots.txt': (200, _ROBOTS),
+            'http://missing.com/robots.txt': (404, ''),
+            'http://broken.com/robots.txt': (503, ''),
+            'http://down.com/robots.txt': (ConnectionError('refused'), ''),
+        })
+        self.now = [0]
+        self.cache = RobotsCache(self.client, user_agent='another', ttl=100, error_ttl=10, max_hosts=2,
+                                 max_crawl_delay=1.5, clock=lambda: self.now[0])
+
+    def test_fetch_once(self):
+        async def work():
+            return await asyncio.gather(*[self.cache.can_fetch('http://example.com/private/%s' % i)
+                                          for i in range(5)])
+
+        self.assertEqual([False] * 5, asyncio.get_event_loop().run_until_complete(work()))
+        self.assertEqual(['http://example.com/robots.txt'], self.client.requested)
+        self.assertEqual(4, self.cache.deduplicated)
+        self.assertEqual(5, self.cache.disallowed)
+
+        # the cached rules filter the URLs synchronously
+        self.assertFalse(self.cache.allowed('http://EXAMPLE.com/private/x'))
+        self.assertTrue(self.cache.allowed('http://example.com/'))
+        # an unknown host is allowed until its robots.txt is fetched
+        self.assertTrue(self.cache.allowed('http://unknown.com/private/x'))
+
+    def test_status(self):
+        async def work():
+            return [await self.cache.can_fetch(url)
+                    for url in ('http://missing.com/a', 'http://broken.com/a', 'http://down.com/a')]
+
+        self.assertEqual([True, False, False], asyncio.get_event_loop().run_until_complete(work()))
+        self.assertEqual(2, self.cache.errors)
+
+    def test_expiration(self):
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.cache.fetch('http://example.com/'))
+        loop.run_until_complete(self.cache.fetch('http://broken.com/'))
+        self.now[0] = 50
+        loop.run_until_complete(self.cache.fetch('http://example.com/'))
+        loop.run_until_complete(self.cache.fetch('http://broken.com/'))
+        # only the unreachable robots.txt is expired
+        self.assertEqual(3, self.cache.fetched)
+
+        # the least recently used host is evicted
+        loop.run_until_complete(self.cache.fetch('http://missing.com/'))
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.cached('http://example.com/'))
+
+        self.now[0] = 200
+        self.assertIsNone(self.cache.cached('http://missing.com/'))
+
+    def test_reserve(self):
+        self.assertEqual(0, self.cache.reserve('http://example.com/a'))
+        asyncio.get_event_loop().run_until_complete(self.cache.fetch('http://example.com/'))
+        # the Crawl-delay 2 is limited to 1.5
+        self.assertEqual([0, 1.5, 3], [self.cache.reserve('http://example.com/%s' % i) for i in range(3)])
+        self.now[0] = 10
+        self.assertEqual(0, self.cache.reserve('http://example.com/a'))
+        self.assertEqual(2, self.cache.delayed)
+
+
+if __name__ == '__main__':
+    unittest.main()
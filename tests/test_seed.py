@@ -0,0 +1,68 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from common_crawler.seed import IterableSeedSource, FileSeedSource, to_seed_source
+
+
+class TestSeedSource(unittest.TestCase):
+    """Test for common_crawler.seed"""
+
+    def setUp(self):
+        self.lines = [
+            '# comment',
+            'https://www.python.org',
+            '',
+            'www.netflix.com',
+            'https://www.python.org',
+            'github.com',
+            'https://www.quora.com',
+        ]
+
+    def test_take(self):
+        source = IterableSeedSource(self.lines)
+        self.assertEqual(source.take(2), ['https://www.python.org', 'http://www.netflix.com'])
+        self.assertFalse(source.exhausted)
+        # the duplicates are rejected by the crawler
+        self.assertEqual(source.take(10), ['https://www.python.org', 'https://www.quora.com'])
+        self.assertTrue(source.exhausted)
+        self.assertEqual(source.take(10), [])
+        self.assertEqual(source.emitted, 4)
+
+    def test_lazy_iterator(self):
+        consumed = []
+
+        def generate():
+            for line in self.lines:
+                consumed.append(line)
+                yield line
+
+        source = IterableSeedSource(generate())
+        source.take(1)
+        self.assertEqual(len(consumed), 2)
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            plain = os.path.join(dirname, 'roots.txt')
+            with open(plain, 'w') as f:
+                f.write('\n'.join(self.lines))
+
+            compressed = os.path.join(dirname, 'roots.txt.gz')
+            with gzip.open(compressed, 'wt') as f:
+                f.write('\n'.join(self.lines))
+
+            for filename in (plain, compressed):
+                source = FileSeedSource(filename)
+                self.assertEqual(len(source.take(100)), 4)
+                self.assertTrue(source.exhausted)
+
+    def test_to_seed_source(self):
+        source = FileSeedSource('roots.txt')
+        self.assertIs(source, to_seed_source(source))
+        source = to_seed_source('https://www.python.org')
+        self.assertEqual(source.take(10), ['https://www.python.org'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import asyncio
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+from common_crawler.link_extractor.sitemap import SitemapParser, SitemapLinkExtractor, SitemapDiscovery, \
+    iter_sitemap, parse_lastmod
+from common_crawler.revisit import ValidatorStore
+from tests.mock import FakedObject
+
+_SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url><loc>http://example.com/a</loc><lastmod>2020-01-01</lastmod></url>
+  <url>
+    <loc> http://example.com/b </loc>
+    <image:image><image:loc>http://example.com/b.png</image:loc></image:image>
+    <lastmod>2021-06-01T10:00:00+00:00</lastmod>
+  </url>
+  <url><loc>http://example.com/c</loc></url>
+</urlset>
+"""
+
+_SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://example.com/sitemap-1.xml.gz</loc></sitemap>
+  <sitemap><loc>http://example.com/feed.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+_RSS = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel>
+  <title>Example</title>
+  <link>http://example.com/</link>
+  <item><title>1</title><link>http://example.com/news/1</link><pubDate>Sat, 01 Feb 2020 00:00:00 GMT</pubDate></item>
+  <item><title>2</title><link>/news/2</link></item>
+</channel></rss>
+"""
+
+_ATOM = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <link href="http://example.com/" rel="self"/>
+  <entry>
+    <link rel="edit" href="http://example.com/edit/1"/>
+    <link href="http://example.com/posts/1"/>
+    <updated>2020-03-01T00:00:00Z</updated>
+  </entry>
+</feed>
+"""
+
+
+def _parse(data, chunk_size=7, **kwargs):
+    parser = SitemapParser(**kwargs)
+    links = []
+    for i in range(0, len(data), chunk_size):
+        links.extend(parser.feed(data[i:i + chunk_size]))
+    links.extend(parser.close())
+    return links, parser
+
+
+class SitemapParserTest(unittest.TestCase):
+    def test_parse_lastmod(self):
+        self.assertEqual(1577836800, parse_lastmod('2020-01-01'))
+        self.assertEqual(1577836800, parse_lastmod('2020-01'))
+        self.assertEqual(1577836800, parse_lastmod('2020-01-01T01:00:00+01:00'))
+        self.assertEqual(1577836800, parse_lastmod('Wed, 01 Jan 2020 00:00:00 GMT'))
+        self.assertIsNone(parse_lastmod('yesterday'))
+        self.assertIsNone(parse_lastmod(None))
+
+    def test_sitemap(self):
+        links, parser = _parse(_SITEMAP)
+        self.assertEqual(['http://example.com/a', 'http://example.com/b', 'http://example.com/c'],
+                         [l.url for l in links])
+        self.assertEqual([1577836800, parse_lastmod('2021-06-01T10:00:00Z'), None], [l.lastmod for l in links])
+        self.assertFalse(any(l.sitemap for l in links))
+        self.assertEqual(3, parser.count)
+
+        links, _ = _parse(_SITEMAP_INDEX)
+        self.assertEqual([True, True], [l.sitemap for l in links])
+
+    def test_gzip(self):
+        # a chunk of one byte is fed before the magic number can be checked
+        links, parser = _parse(gzip.compress(_SITEMAP), chunk_size=1)
+        self.assertEqual(3, len(links))
+        self.assertEqual(len(_SITEMAP), parser.size)
+
+    def test_feeds(self):
+        links, _ = _parse(_RSS, base_url='http://example.com/feed.xml')
+        self.assertEqual(['http://example.com/news/1', 'http://example.com/news/2'], [l.url for l in links])
+        self.assertEqual(1580515200, links[0].lastmod)
+
+        links, _ = _parse(_ATOM)
+        self.assertEqual(['http://example.com/posts/1'], [l.url for l in links])
+        self.assertEqual(1583020800, links[0].lastmod)
+
+    def test_truncated(self):
+        links, parser = _parse(gzip.compress(_SITEMAP), max_size=_SITEMAP.index(b'</url>') + 10)
+        self.assertTrue(parser.truncated)
+        self.assertEqual(['http://example.com/a'], [l.url for l in links])
+
+        # the malformed document is recovered as far as possible
+        links, _ = _parse(_SITEMAP.replace(b'</url>\n  <url>\n', b'</url>\n  <url><bad>\n'))
+        self.assertIn('http://example.com/a', [l.url for l in links])
+
+    def test_iter_sitemap(self):
+        # the entries are emitted while streaming, not when the document is closed
+        data = b'<urlset>' + b''.join(b'<url><loc>http://example.com/%d</loc></url>' % i for i in range(5000)) \
+               + b'</urlset>'
+        parser = SitemapParser()
+        half = parser.feed(data[:len(data) // 2])
+        self.assertGreater(len(half), 2000)
+        rest = parser.feed(data[len(data) // 2:]) + parser.close()
+        self.assertEqual(5000, len(half) + len(rest))
+        self.assertEqual('http://example.com/4999', rest[-1].url)
+
+        fd, filename = tempfile.mkstemp(suffix='.xml.gz')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(_SITEMAP))
+        try:
+            self.assertEqual(3, len(list(iter_sitemap(filename))))
+            self.assertEqual(2, len(list(iter_sitemap(io.BytesIO(_SITEMAP_INDEX)))))
+        finally:
+            os.remove(filename)
+
+
+class SitemapLinkExtractorTest(unittest.TestCase):
+    def test_extract_links(self):
+        extractor = SitemapLinkExtractor()
+        response = FakedObject(url='http://example.com/sitemap.xml', text=_SITEMAP.decode('utf-8'))
+        # the newest first
+        self.assertEqual(['http://example.com/b', 'http://example.com/a', 'http://example.com/c'],
+                         [l.url for l in extractor.extract_links(response)])
+
+        response = FakedObject(url='http://example.com/', text='<html><body><a href="/x">x</a></body></html>')
+        self.assertEqual(['http://example.com/x'], [l.url for l in extractor.extract_links(response)])
+
+
+class FakedSitemapClient(object):
+    """Return the bodies of the URLs chunk by chunk"""
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.requested = []
+
+    def get(self, url, *args, **kwargs):
+        self.requested.append(url)
+        status, body = self.bodies.get(url, (404, b''))
+        stream = io.BytesIO(body)
+
+        async def read(n=-1):
+            return stream.read(n)
+
+        async def text():
+            return body.decode('utf-8')
+
+        return FakedObject(url=url, status=status, text=text, content=FakedObject(read=read))
+
+
+class SitemapDiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.http_client = FakedSitemapClient({
+            'http://example.com/robots.txt': (200, b'User-agent: *\nSitemap: http://example.com/index.xml\n'),
+            'http://example.com/index.xml': (200, _SITEMAP_INDEX),
+            'http://example.com/sitemap-1.xml.gz': (200, gzip.compress(_SITEMAP)),
+            'http://example.com/feed.xml': (200, _RSS),
+        })
+        self.enqueued = []
+        self.crawler = FakedObject(http_client=self.http_client,
+                                   task_queue=asyncio.Queue(),
+                                   seeds_batch_size=2,
+                                   seeds_low_water=10,
+                                   add_to_task_queue=self.enqueued.append)
+
+    def test_run(self):
+        discovery = SitemapDiscovery(sitemap_urls=['http://example.com/missing.xml'],
+                                     hosts=['http://example.com/', 'http://example.com/other'])
+        asyncio.get_event_loop().run_until_complete(discovery.run(self.crawler))
+
+        self.assertEqual([['http://example.com/b', 'http://example.com/a'], ['http://example.com/c'],
+                          ['http://example.com/news/1', 'http://example.com/news/2']], self.enqueued)
+        self.assertEqual(4, discovery.sitemaps)
+        self.assertEqual(1, discovery.errors)
+        self.assertEqual(5, discovery.urls)
+        self.assertEqual(1, self.http_client.requested.count('http://example.com/robots.txt'))
+
+    def test_skip_unchanged(self):
+        fd, filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        validator_store = ValidatorStore(filename)
+        try:
+            validator_store.update('http://example.com/a', {}, 'a', now=parse_lastmod('2020-06-01'))
+            validator_store.update('http://example.com/b', {}, 'b', now=parse_lastmod('2020-06-01'))
+            self.crawler.validator_store = validator_store
+
+            discovery = SitemapDiscovery(sitemap_urls=['http://example.com/sitemap-1.xml.gz'], max_sitemaps=1)
+            asyncio.get_event_loop().run_until_complete(discovery.run(self.crawler))
+            self.assertEqual([['http://example.com/b', 'http://example.com/c']], self.enqueued)
+            self.assertEqual(1, discovery.unchanged)
+        finally:
+            validator_store.close()
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from common_crawler.stats import CrawlStats, iter_spilled
+from tests.mock import FakedObject
+
+
+def _task(url, status=200, exception=None, retries_num=0, redirect_num=0, content_length=1024):
+    response = FakedObject(status=status, reason='OK', content_type='text/html', content_length=content_length)
+    return FakedObject(url=url, response=response, exception=exception,
+                       retries_num=retries_num, redirect_num=redirect_num)
+
+
+class CrawlStatsTest(unittest.TestCase):
+    def test_add(self):
+        stats = CrawlStats(recent_size=3)
+        for i in range(10):
+            stats.add(_task('http://www.example.com/%s' % i, retries_num=1))
+        stats.append(_task('http://www.example.com/error', status=500, exception=ValueError('boom')))
+        stats.add(None)
+
+        self.assertEqual(11, len(stats))
+        self.assertEqual((10, 1, 1), (stats.valid, stats.invalid, stats.ignored))
+        self.assertEqual(10, stats.retries)
+        self.assertEqual({200: 10, 500: 1}, dict(stats.statuses))
+        self.assertEqual({'ValueError': 1}, dict(stats.exceptions))
+        self.assertEqual(11, stats.content_lengths.count)
+
+        # only the most recent tasks are retained
+        self.assertEqual(3, len(list(stats)))
+        self.assertEqual('http://www.example.com/error', list(stats)[-1].url)
+        self.assertFalse(any(t.url == 'http://www.example.com/0' for t in stats))
+
+    def test_report(self):
+        stats = CrawlStats()
+        stats.add(_task('http://www.example.com/a'))
+        stats.add(_task('http://www.example.com/b', status=404, exception=ValueError('not found')))
+
+        lines = stats.report()
+        self.assertTrue(lines[0].startswith('Finished 2 tasks: valid 1, invalid 1'))
+        self.assertIn('Statuses: 200: 1, 404: 1', lines)
+        self.assertIn('Invalid: http://www.example.com/b error: not found', lines)
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'stats', 'tasks.tsv')
+            stats = CrawlStats(spill_filename=filename)
+            stats.add(_task('http://www.example.com/a', redirect_num=2))
+            stats.add(_task('http://www.example.com/b', status=503, exception=ValueError('tab\there')))
+            stats.add(None)
+            stats.close()
+
+            records = list(iter_spilled(filename))
+            self.assertEqual(2, len(records))
+            self.assertEqual({'url': 'http://www.example.com/a', 'status': '200', 'content_type': 'text/html',
+                              'content_length': '1024', 'retries': '0', 'redirects': '2', 'error': ''},
+                             records[0])
+            self.assertEqual('503', records[1]['status'])
+            self.assertEqual('tab here', records[1]['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
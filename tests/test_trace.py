@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from common_crawler.pipeline import AsyncPipeline
+from common_crawler.task import Task
+from common_crawler.trace import Tracer
+
+
+class _SlowPipeline(AsyncPipeline):
+    async def handle(self, task, **kwargs):
+        await asyncio.sleep(0.01)
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dirname.name, 'traces', 'crawl.json')
+
+    def tearDown(self):
+        self.dirname.cleanup()
+
+    def _load(self):
+        with open(self.filename, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_export(self):
+        tracer = Tracer(self.filename, sample_rate=1)
+        span = tracer.start_span('http://www.example.com')
+        span.complete('queued', span.created)
+        span.begin('fetch')
+        span.instant('retry', error=ValueError('timeout'))
+        span.end('fetch', status=200)
+        span.finish()
+        tracer.close()
+
+        events = self._load()
+        self.assertEqual(['thread_name', 'queued', 'retry', 'fetch'], [e['name'] for e in events])
+        self.assertEqual('http://www.example.com', events[0]['args']['name'])
+        self.assertEqual(['M', 'X', 'i', 'X'], [e['ph'] for e in events])
+        self.assertEqual({'error': 'timeout'}, events[2]['args'])
+        self.assertEqual({'status': 200}, events[3]['args'])
+        self.assertTrue(all(e['tid'] == span.id for e in events))
+
+    def test_sampling(self):
+        values = iter([0.5, 0.05, 0.01, 0.02])
+        tracer = Tracer(self.filename, sample_rate=0.1, max_spans=1, rng=lambda: next(values))
+        self.assertIsNone(tracer.start_span('a'))
+        self.assertIsNotNone(tracer.start_span('b'))
+        # the maximum number of the spans is reached
+        self.assertIsNone(tracer.start_span('c'))
+        self.assertEqual(1, tracer.sampled)
+        tracer.close()
+        self.assertEqual([], self._load())
+
+    def test_async_pipeline_holds_span(self):
+        tracer = Tracer(self.filename, sample_rate=1)
+        task = Task(url='http://www.example.com', span=tracer.start_span('http://www.example.com'))
+        pipeline = _SlowPipeline()
+
+        async def work():
+            await pipeline.transmit(task)
+            # the crawler finishes the span but the write is in flight
+            task.span.finish()
+            self.assertEqual(0, tracer.exported)
+            await pipeline.flush()
+
+        asyncio.get_event_loop().run_until_complete(work())
+        self.assertEqual(1, tracer.exported)
+        tracer.close()
+        self.assertEqual(['thread_name', 'pipeline_wait', 'pipeline_async'], [e['name'] for e in self._load()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from urllib.parse import urlsplit
+
+from common_crawler.trap import TrapDetector, url_template
+
+
+class TestTrapDetector(unittest.TestCase):
+    """Test for common_crawler.trap"""
+
+    def setUp(self):
+        self.detector = TrapDetector(max_url_length=200,
+                                     max_path_depth=6,
+                                     max_repeated_segments=2,
+                                     max_query_params=3,
+                                     max_urls_per_template=5)
+
+    def test_url_template(self):
+        parts = urlsplit('https://www.Example.com/calendar/2018/05/12?view=week&day=1')
+        self.assertEqual(url_template(parts), 'www.example.com/calendar/#/#/#?day&view')
+
+    def test_admit(self):
+        self.assertTrue(self.detector.admit('https://www.example.com/a/b/c'))
+        self.assertTrue(self.detector.admit('https://www.example.com/a/b/a/b'))
+        self.assertFalse(self.detector.admit('https://www.example.com/a/b/a/b/a/b'))
+        self.assertFalse(self.detector.admit('https://www.example.com/1/2/3/4/5/6/7'))
+        self.assertFalse(self.detector.admit('https://www.example.com/?a=1&b=2&c=3&d=4'))
+        self.assertFalse(self.detector.admit('https://www.example.com/' + 'x' * 200))
+        # only the recorded (enqueued) URLs are counted
+        self.assertEqual(self.detector.admitted, 0)
+        self.assertEqual(sum(self.detector.rejected.values()), 4)
+        self.assertEqual(self.detector.rejected_hosts['www.example.com'], 4)
+
+    def test_template(self):
+        urls = ['https://www.example.com/calendar/2018/05/%s' % day for day in range(1, 10)]
+        admitted = []
+        for u in urls:
+            if self.detector.admit(u):
+                self.detector.record(u)
+                admitted.append(u)
+        self.assertEqual(len(admitted), 5)
+        self.assertEqual(self.detector.admitted, 5)
+        self.assertEqual(self.detector.rejected['template'], 4)
+        self.assertEqual(len(self.detector.trapped_templates), 1)
+        # the other templates are not affected
+        self.assertTrue(self.detector.admit('https://www.example.com/about'))
+
+    def test_template_counts_recorded_urls(self):
+        # the URLs that admitted but not enqueued don't count
+        for day in range(1, 10):
+            self.assertTrue(self.detector.admit('https://www.example.com/calendar/%s' % day))
+        self.assertFalse(self.detector.trapped_templates)
+
+    def test_max_templates(self):
+        detector = TrapDetector(max_urls_per_template=2, max_templates=2)
+        detector.record('https://www.example.com/a/1')
+        detector.record('https://www.example.com/b/1')
+        detector.record('https://www.example.com/c/1')
+        self.assertEqual(len(detector._templates), 2)
+        # the least recently used template has been dropped and counts again
+        detector.record('https://www.example.com/a/2')
+        self.assertFalse(detector.trapped_templates)
+        detector.record('https://www.example.com/c/2')
+        self.assertEqual(detector.trapped_templates, {'www.example.com/c/#?'})
+
+    def test_disabled(self):
+        detector = TrapDetector(max_url_length=None,
+                                max_path_depth=0,
+                                max_repeated_segments=None,
+                                max_query_params=None,
+                                max_urls_per_template=None)
+        self.assertTrue(detector.admit('https://www.example.com/a/a/a/a/a/a/a/a/a/a/a/a/a/a/a/a/a/a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
+import logging
 import unittest
 
+from common_crawler.utils.log import *
 from common_crawler.utils.misc import *
+from common_crawler.utils.simhash import *
 from common_crawler.utils.url import *
 
 
@@ -155,6 +158,7 @@ class TestUrl(unittest.TestCase):
         self.assertTrue(is_redirect(302))
         self.assertTrue(is_redirect(303))
         self.assertTrue(is_redirect(307))
+        self.assertTrue(is_redirect(308))
         self.assertFalse(is_redirect(200))
         self.assertFalse(is_redirect(500))
         self.assertFalse(is_redirect(404))
@@ -167,5 +171,91 @@ class TestUrl(unittest.TestCase):
         self.assertEqual(expected, get_domain(url))
 
 
+class TestSimhash(unittest.TestCase):
+    """Test for common_crawler.utils.simhash"""
+
+    def setUp(self):
+        words = ' '.join('word%s' % i for i in range(300))
+        self.page = '<html><head><script>var x = 1;</script></head><body><p>%s</p></body></html>' % words
+        self.near = self.page.replace('word150', 'changed')
+        self.other = self.page.replace('word', 'other')
+
+    def test_tokenize(self):
+        features = tokenize('<p>Hello <b>World</b></p><script>ignored()</script> again', shingle_size=2)
+        self.assertEqual(features, ['hello world', 'world again'])
+        self.assertEqual(tokenize('<p>single</p>'), ['single'])
+        self.assertEqual(tokenize('<p></p>'), [])
+
+    def test_simhash(self):
+        a = simhash(tokenize(self.page))
+        self.assertEqual(a, simhash(tokenize(self.page)))
+        self.assertTrue(hamming_distance(a, simhash(tokenize(self.near))) <= 3)
+        self.assertTrue(hamming_distance(a, simhash(tokenize(self.other))) > 3)
+        self.assertEqual(simhash([]), 0)
+
+    def test_index(self):
+        index = SimhashIndex(k=3)
+        self.assertTrue(index.add_if_new(simhash(tokenize(self.page))))
+        self.assertFalse(index.add_if_new(simhash(tokenize(self.near))))
+        self.assertTrue(index.add_if_new(simhash(tokenize(self.other))))
+        self.assertEqual(len(index), 2)
+
+        index.add(0b1111)
+        self.assertEqual(index.find(0b0111), 0b1111)
+        self.assertEqual(index.find(0b11110000), None)
+
+        with self.assertRaises(ValueError):
+            SimhashIndex(k=64)
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super(__class__, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestLog(unittest.TestCase):
+    """Test for common_crawler.utils.log"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.handler = _ListHandler()
+        self.logger = logging.getLogger('common_crawler.tests.log')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.handlers = [self.handler]
+        self.logger.filters = []
+
+    def test_rate_limit_filter(self):
+        rate_limit = RateLimitFilter(rate=2, clock=lambda: self.now)
+        self.logger.addFilter(rate_limit)
+
+        for i in range(10):
+            self.logger.info('Redirect to %s', i)
+        self.logger.warning('Warning %s', 1)
+        self.logger.warning('Warning %s', 2)
+        self.assertEqual(['Redirect to 0', 'Redirect to 1', 'Warning 1', 'Warning 2'], self.handler.messages)
+        self.assertEqual(8, rate_limit.dropped)
+
+        # the bucket is refilled by the time
+        self.now += 1
+        self.logger.info('Redirect to %s', 10)
+        self.assertEqual('Redirect to 10 (8 similar messages suppressed)', self.handler.messages[-1])
+
+    def test_queue_logging(self):
+        self.logger.handlers = []
+        handler = start_queue_logging([self.handler], self.logger)
+        for i in range(100):
+            self.logger.debug('Adding %s urls', i)
+        stop_queue_logging()
+
+        self.assertIsNotNone(handler.listener)
+        self.assertEqual(100, len(self.handler.messages))
+        self.assertEqual('Adding 99 urls', self.handler.messages[-1])
+
+
 if __name__ == '__main__':
     unittest.main()